@@ -0,0 +1,101 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import pymysql
+
+from migrations.migrate import applyMigrations
+from benchmarks.seed import ROOT_DIR, connect, createSchema, seed
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "cryptowatch-querying"))
+from partitions import ensureHourlyPartitions
+
+# Seeds a scratch schema with a realistic volume of users, tracked metrics and MetricValue history, then reports
+# the query plans and timings of the hot queries before and after the migrations (indexes and partitioning).
+# Run from the root of the repo against a MySQL server, the scratch schema is dropped and recreated:
+#   python -m benchmarks.indexes --metrics 2400 --users 100 --hours 24 --output bench_indexes.json
+
+
+# The hot queries of the REST API, the poller and the canary, as (name, sql, params).
+def hotQueries(schema, userMetricIds):
+    now = datetime.datetime.now()
+    inList = ", ".join(str(cpmId) for cpmId in userMetricIds)
+    return [
+        ("graph", f"SELECT queriedAt, value, currencyPairMetricId FROM {schema}.MetricValue WHERE currencyPairMetricId IN ({inList}) ORDER BY 3, 1 ASC", None),
+        ("since", f"SELECT queriedAt, value, currencyPairMetricId FROM {schema}.MetricValue WHERE currencyPairMetricId IN ({inList}) AND queriedAt > %s ORDER BY 3, 1 ASC",
+         (now - datetime.timedelta(minutes=2),)),
+        ("canaryFreshness", f"SELECT timestampdiff(SECOND, MAX(timestamp(queriedAt)), CURRENT_TIMESTAMP) FROM {schema}.MetricValue", None),
+        ("freshness", f"SELECT MAX(queriedAt) FROM {schema}.MetricValue", None),
+        ("alertWindow", f"SELECT currencyPairMetricId, queriedAt, value FROM {schema}.MetricValue WHERE queriedAt > %s ORDER BY currencyPairMetricId, queriedAt",
+         (now - datetime.timedelta(hours=1),)),
+        ("retention", f"SELECT COUNT(*) FROM {schema}.MetricValue WHERE queriedAt < %s", (now - datetime.timedelta(hours=23),)),
+        ("activeMetrics", f"""SELECT cpm.id, cpm.pair, cpm.market FROM {schema}.CurrencyPairMetric cpm WHERE cpm.id IN
+            (SELECT DISTINCT ucpm.currencyPairMetricId FROM {schema}.UserCurrencyPairMetric ucpm WHERE ucpm.deletedAt is null)""", None),
+        ("userMetrics", f"SELECT currencyPairMetricId FROM {schema}.UserCurrencyPairMetric WHERE userId = 1 AND deletedAt is null", None),
+        ("metricLookup", f"SELECT id FROM {schema}.CurrencyPairMetric WHERE market = 'kraken' AND pair = 'btceur' AND metricTypeId = 1", None),
+    ]
+
+
+# Returns the plan of the query, as the list of EXPLAIN rows, and the median of its execution time in ms.
+def measure(db, sql, params, repeat):
+    cursor = db.cursor(pymysql.cursors.DictCursor)
+    cursor.execute("EXPLAIN " + sql, params)
+    plan = [{k: row.get(k) for k in ["table", "partitions", "type", "key", "rows", "Extra"]} for row in cursor.fetchall()]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    cursor.close()
+    return plan, round(statistics.median(timings), 3)
+
+
+def runQueries(db, schema, userMetricIds, repeat):
+    results = {}
+    for name, sql, params in hotQueries(schema, userMetricIds):
+        plan, medianMs = measure(db, sql, params, repeat)
+        results[name] = {"medianMs": medianMs, "plan": plan}
+        keys = ", ".join(f"{step['table']}:{step['type']}/{step['key']}" for step in plan)
+        print(f"{name:>16} {medianMs:>10} ms   {keys}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the hot queries before and after the migrations.")
+    parser.add_argument("--schema", default="crypto_benchmark", help="Scratch schema, dropped and recreated.")
+    parser.add_argument("--metrics", type=int, default=2400)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--output", default="bench_indexes.json")
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.random_seed)
+
+    db = connect()
+    createSchema(db.cursor(), args.schema)
+    userMetricIds = seed(db, args.schema, args.metrics, args.users, args.hours, args.chunk_size)
+
+    print("--- Before migrations ---")
+    before = runQueries(db, args.schema, userMetricIds, args.repeat)
+
+    start = time.time()
+    applyMigrations(db, args.schema)
+    now = datetime.datetime.now()
+    ensureHourlyPartitions(db, now, 6, schema=args.schema, firstHour=now - datetime.timedelta(hours=args.hours))
+    print(f"--- Migrated and partitioned --- {round(time.time() - start, 4)} seconds ---")
+
+    print("--- After migrations ---")
+    after = runQueries(db, args.schema, userMetricIds, args.repeat)
+
+    with open(args.output, "w") as outputFile:
+        json.dump({"metrics": args.metrics, "users": args.users, "hours": args.hours, "repeat": args.repeat,
+                   "before": before, "after": after}, outputFile, indent=2, default=str)
+    print(f"Results written to {args.output}")
+    db.close()
@@ -0,0 +1,237 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from migrations.migrate import applyMigrations
+from benchmarks.seed import ROOT_DIR, connect, createSchema, seed, MARKETS, BASES, QUOTES
+
+POLLER_DIR = os.path.join(ROOT_DIR, "cryptowatch-querying")
+API_DIR = os.path.join(ROOT_DIR, "crypto-client-api")
+
+# Load scenarios run end to end against a MySQL server, the fake Cryptowatch upstream and the actual poller and
+# REST API processes, writing their results to a JSON file to be compared with the runs of other versions:
+#   poller          cycle time of query-cryptowatch.py runs (read from the metrics of each run), stage by stage
+#   graphs          p50/p99 of GET /graphs-of-tracked-metrics/<userId> at increasing concurrency
+#   begin-tracking  p50/p99 of POST /begin-tracking-metric at increasing concurrency
+# The poller and the API are written against the crypto schema, so --seed drops and reloads the crypto schema of
+# the server: only ever run this against a disposable MySQL server. Run from the root of the repo:
+#   python -m benchmarks.scenarios --seed --metrics 2400 --users 100 --hours 24 --output bench_scenarios.json
+#   python -m benchmarks.scenarios --compare bench_scenarios.json --output bench_scenarios_new.json
+
+SCENARIOS = ["poller", "graphs", "begin-tracking"]
+
+
+def loadFakeCryptowatch():
+    sys.path.insert(0, POLLER_DIR)
+    spec = importlib.util.spec_from_file_location("fakeCryptowatch", os.path.join(POLLER_DIR, "fake-cryptowatch.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Nearest-rank percentile of a list of numbers.
+def percentile(values, q):
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+# Reads a Prometheus text file into a dictionary of series (name with its labels) => value.
+def readMetricsFile(path):
+    metrics = {}
+    with open(path) as metricsFile:
+        for line in metricsFile:
+            if line.startswith("#") or len(line.strip()) == 0:
+                continue
+            series, value = line.rsplit(" ", 1)
+            metrics[series] = float(value)
+    return metrics
+
+
+def sumSeries(metrics, name):
+    return sum(value for series, value in metrics.items() if series == name or series.startswith(name + "{"))
+
+
+# Runs the poller cycles cron style, one process each, and reads their durations from the metrics they export.
+def runPollerScenario(cycles, upstreamUrl):
+    runs = []
+    for i in range(cycles):
+        metricsPath = os.path.join(tempfile.gettempdir(), f"bench_poller_{os.getpid()}_{i}.prom")
+        env = dict(os.environ, CRYPTOWATCH_URL=upstreamUrl, POLLER_MODE="cron", METRICS_TEXTFILE=metricsPath)
+        start = time.time()
+        subprocess.run([sys.executable, "query-cryptowatch.py"], cwd=POLLER_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        wallSeconds = time.time() - start
+        metrics = readMetricsFile(metricsPath)
+        os.remove(metricsPath)
+        runs.append({
+            "wallSeconds": round(wallSeconds, 4),
+            "cycleSeconds": round(metrics["poller_cycle_seconds_sum"], 4),
+            "insertSeconds": round(metrics.get('poller_db_write_seconds_sum{stage="insert"}', 0), 4),
+            "rankSeconds": round(metrics.get('poller_db_write_seconds_sum{stage="rank"}', 0), 4),
+            "upstreamRequests": int(sumSeries(metrics, "poller_upstream_request_seconds_count")),
+            "upstreamErrors": int(sumSeries(metrics, "poller_upstream_errors_total")),
+            "valuesWritten": int(metrics.get("poller_values_written_total", 0)),
+        })
+        print(f"--- Poller cycle {i + 1}/{cycles} --- {runs[-1]['cycleSeconds']} seconds --- {runs[-1]['valuesWritten']} values ---")
+    cycleSeconds = [run["cycleSeconds"] for run in runs]
+    return {"cycles": runs, "p50CycleSeconds": percentile(cycleSeconds, 50), "maxCycleSeconds": max(cycleSeconds)}
+
+
+# Starts the REST API the way it is served in production, under Gunicorn with gunicorn.conf.py (gevent workers,
+# one pool each), bound to localhost, and waits for its health check. workers None keeps GUNICORN_WORKERS.
+def startApi(port, workers=None):
+    environment = dict(os.environ)
+    if workers != None:
+        environment["GUNICORN_WORKERS"] = str(workers)
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "wsgi:app"],
+                               cwd=API_DIR, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/hc", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("The REST API did not come up within 30 seconds")
+
+
+# Sends numRequests requests built by sendRequest(session, i) through concurrency threads, each with its own session.
+# Outputs: the latency percentiles in ms, the throughput, and the number of failed requests.
+def runLoad(sendRequest, concurrency, numRequests):
+    local = threading.local()
+
+    def timedRequest(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            failed = sendRequest(local.session, i).status_code >= 400
+        except requests.RequestException:
+            failed = True
+        return (time.perf_counter() - start) * 1000, failed
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timedRequest, range(numRequests)))
+    wallSeconds = time.time() - start
+    latencies = [latency for latency, failed in results]
+    return {"concurrency": concurrency, "requests": numRequests, "errors": sum(1 for latency, failed in results if failed),
+            "p50Ms": round(percentile(latencies, 50), 3), "p99Ms": round(percentile(latencies, 99), 3),
+            "maxMs": round(max(latencies), 3), "requestsPerSecond": round(numRequests / wallSeconds, 2)}
+
+
+def runApiScenario(name, sendRequest, concurrencyLevels, numRequests):
+    levels = []
+    for concurrency in concurrencyLevels:
+        levels.append(runLoad(sendRequest, concurrency, numRequests))
+        level = levels[-1]
+        print(f"{name:>16} x{concurrency:<4} p50 {level['p50Ms']:>9} ms   p99 {level['p99Ms']:>9} ms   "
+              f"{level['requestsPerSecond']:>8} req/s   {level['errors']} errors")
+    return levels
+
+
+# Prints how the p50/p99 of each scenario moved compared to a previous results file.
+def compareResults(previous, current):
+    print("--- Compared to the previous results ---")
+    if "poller" in previous and "poller" in current:
+        print(f"{'poller':>16} p50 cycle {previous['poller']['p50CycleSeconds']} -> {current['poller']['p50CycleSeconds']} seconds")
+    for name in ["graphs", "beginTracking"]:
+        previousLevels = {level["concurrency"]: level for level in previous.get(name, [])}
+        for level in current.get(name, []):
+            before = previousLevels.get(level["concurrency"])
+            if before != None:
+                print(f"{name:>16} x{level['concurrency']:<4} p50 {before['p50Ms']} -> {level['p50Ms']} ms   "
+                      f"p99 {before['p99Ms']} -> {level['p99Ms']} ms")
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load scenarios for the poller and the REST API.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma separated, out of {', '.join(SCENARIOS)}.")
+    parser.add_argument("--seed", action="store_true", help="Drop and reload the crypto schema first. Disposable servers only.")
+    parser.add_argument("--metrics", type=int, default=2400)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--cycles", type=int, default=5, help="Poller cycles to run.")
+    parser.add_argument("--latency", type=float, default=0.25, help="Base latency of the fake upstream in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--dead-rate", type=float, default=0.0, help="Share of the market/pairs the fake upstream answers with a 404.")
+    parser.add_argument("--upstream-port", type=int, default=8765)
+    parser.add_argument("--api-port", type=int, default=5055)
+    parser.add_argument("--api-workers", type=int, help="Gunicorn workers of the API, GUNICORN_WORKERS (or one per CPU) by default.")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma separated concurrency levels of the API scenarios.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level.")
+    parser.add_argument("--output", default="bench_scenarios.json")
+    parser.add_argument("--compare", help="Previous results file to compare with.")
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+    concurrencyLevels = [int(level) for level in args.concurrency.split(",")]
+    random.seed(args.random_seed)
+
+    db = connect()
+    if args.seed:
+        createSchema(db.cursor(), "crypto")
+        applyMigrations(db, "crypto")
+        seed(db, "crypto", args.metrics, args.users, args.hours, 5000)
+    cursor = db.cursor()
+    cursor.execute("SELECT id FROM crypto.User WHERE deletedAt is null")
+    userIds = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT name FROM crypto.MetricType WHERE deletedAt is null")
+    metricNames = [row[0] for row in cursor.fetchall()]
+    db.close()
+
+    results = {"commit": gitCommit(), "createdAt": datetime.datetime.now().isoformat(), "config": vars(args)}
+
+    if "poller" in scenarios:
+        fakeCryptowatch = loadFakeCryptowatch()
+        server = fakeCryptowatch.startServer(args.upstream_port, args.latency, args.jitter, args.error_rate, args.dead_rate)
+        results["poller"] = runPollerScenario(args.cycles, f"http://localhost:{args.upstream_port}")
+        server.shutdown()
+
+    if "graphs" in scenarios or "begin-tracking" in scenarios:
+        apiUrl = f"http://127.0.0.1:{args.api_port}"
+        headers = {"Authorization": os.environ.get("AUTHORIZATION_TOKEN", "")}
+        api = startApi(args.api_port, args.api_workers)
+        try:
+            if "graphs" in scenarios:
+                results["graphs"] = runApiScenario("graphs", lambda session, i: session.get(
+                    f"{apiUrl}/graphs-of-tracked-metrics/{random.choice(userIds)}", headers=headers, timeout=60),
+                    concurrencyLevels, args.requests)
+            if "begin-tracking" in scenarios:
+                results["beginTracking"] = runApiScenario("begin-tracking", lambda session, i: session.post(
+                    f"{apiUrl}/begin-tracking-metric", headers=headers, timeout=60,
+                    json={"userId": random.choice(userIds), "market": random.choice(MARKETS),
+                          "pair": random.choice(BASES) + random.choice(QUOTES), "metric": random.choice(metricNames)}),
+                    concurrencyLevels, args.requests)
+        finally:
+            # Gunicorn stops its workers gracefully on SIGTERM, within graceful_timeout.
+            api.terminate()
+            api.wait()
+
+    with open(args.output, "w") as outputFile:
+        json.dump(results, outputFile, indent=2, default=str)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as previousFile:
+            compareResults(json.load(previousFile), results)
@@ -0,0 +1,65 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+from benchmarks.seed import ROOT_DIR
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "cryptowatch-querying"))
+from screening import RobustScreen
+
+# Time the screening stage of the poller adds to a cycle, at a given number of metrics. The windows are filled
+# with random walks, then every cycle screens one new value per metric with a share of them corrupted (off by a
+# factor of 1000, or not a number). No database is needed. Run from the root of the repo:
+#   python -m benchmarks.screening --metrics 50000 --window 60 --cycles 20 --output bench_screening.json
+
+
+def randomWalks(generator, numMetrics, levels):
+    return levels * np.exp(generator.normal(0, 0.002, numMetrics))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of the screening stage of the poller.")
+    parser.add_argument("--metrics", type=int, default=50000)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--corrupt-rate", type=float, default=0.001, help="Share of the values corrupted every cycle.")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_screening.json")
+    args = parser.parse_args()
+    generator = np.random.default_rng(args.random_seed)
+
+    screen = RobustScreen(args.window, 10, 10, 50, 10)
+    cpmIds = list(range(1, args.metrics + 1))
+    levels = generator.uniform(0.01, 50000, args.metrics)
+    start = time.perf_counter()
+    for i in range(args.window):
+        levels = randomWalks(generator, args.metrics, levels)
+        screen.append(screen.rowsFor(cpmIds), levels)
+    print(f"--- Filled {args.metrics} windows of {args.window} values --- {round(time.perf_counter() - start, 4)} seconds ---")
+
+    timings, corrupted, quarantined = [], 0, 0
+    for i in range(args.cycles):
+        levels = randomWalks(generator, args.metrics, levels)
+        values = levels.tolist()
+        for index in np.flatnonzero(generator.random(args.metrics) < args.corrupt_rate):
+            values[index] = values[index] * 1000 if generator.random() < 0.5 else None
+            corrupted += 1
+        start = time.perf_counter()
+        accepted, suspect, resets = screen.screen(list(zip(cpmIds, values)))
+        timings.append((time.perf_counter() - start) * 1000)
+        quarantined += len(suspect)
+
+    results = {"createdAt": datetime.datetime.now().isoformat(), "config": vars(args),
+               "p50Ms": round(statistics.median(timings), 3), "maxMs": round(max(timings), 3),
+               "usPerMetric": round(statistics.median(timings) * 1000 / args.metrics, 3),
+               "corrupted": corrupted, "quarantined": quarantined}
+    print(f"--- Screened {args.metrics} values per cycle --- p50 {results['p50Ms']} ms, max {results['maxMs']} ms, "
+          f"{results['usPerMetric']} us per metric --- quarantined {quarantined} of {corrupted} corrupted values ---")
+    with open(args.output, "w") as outputFile:
+        json.dump(results, outputFile, indent=2)
+    print(f"Results written to {args.output}")
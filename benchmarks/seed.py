@@ -0,0 +1,100 @@
+import argparse
+import datetime
+import os
+import random
+import time
+import pymysql
+
+from migrations.migrate import applyMigrations, readStatements
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generates a realistic volume of users, tracked CurrencyPairMetrics and MetricValue history in a schema that is
+# dropped and recreated from databaseSetup.sql. Used by the other benchmarks, or on its own from the root of the
+# repo, ex: to load the crypto schema of a disposable MySQL server before running the poller and the API on it:
+#   python -m benchmarks.seed --schema crypto --metrics 2400 --users 100 --hours 24 --migrate
+
+MARKETS = ["kraken", "binance", "coinbase-pro", "bitfinex", "bitstamp"]
+BASES = ["btc", "eth", "ltc", "xrp", "ada", "dot", "sol", "doge", "link", "xlm", "bch", "eos"]
+QUOTES = ["usd", "eur", "usdt", "gbp"]
+NUM_METRIC_TYPES = 7
+
+
+def connect():
+    # This section is for running the benchmark locally.
+    if os.environ.get("SQL_IP") == None:
+        from dotenv import load_dotenv, find_dotenv
+        load_dotenv(find_dotenv(usecwd=True))
+    return pymysql.connect(host=os.environ.get('SQL_IP'), user=os.environ.get('SQL_USER'),
+                           password=os.environ.get('SQL_PASSWORD'), autocommit=True)
+
+
+# Recreates the scratch schema from databaseSetup.sql, rewritten to the scratch schema name.
+def createSchema(cursor, schema):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema}")
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    for statement in readStatements(os.path.join(ROOT_DIR, "databaseSetup.sql"), schema):
+        if not statement.upper().startswith("CREATE SCHEMA"):
+            cursor.execute(statement)
+
+
+# Generates numMetrics CurrencyPairMetrics spread over markets, pairs and metric types, numUsers users each
+# tracking a random share of them, and one MetricValue per metric per minute over the last hours.
+# Outputs: the list of the currencyPairMetricIds tracked by user 1, used by the graph queries.
+def seed(db, schema, numMetrics, numUsers, hours, chunkSize):
+    cursor = db.cursor()
+    now = datetime.datetime.now().replace(second=0, microsecond=0)
+    cursor.executemany(f"INSERT INTO {schema}.User (firstName, lastName, email, createdAt, updatedAt) VALUES (%s, %s, %s, now(), now())",
+                       [(f"First{i}", f"Last{i}", f"user{i}@example.com") for i in range(numUsers)])
+    combinations = [(market, base + quote, metricTypeId) for market in MARKETS for base in BASES for quote in QUOTES
+                    for metricTypeId in range(1, NUM_METRIC_TYPES + 1)]
+    random.shuffle(combinations)
+    while len(combinations) < numMetrics:
+        combinations += [(market, f"{pair}{len(combinations)}", metricTypeId) for market, pair, metricTypeId in combinations]
+    cursor.executemany(f"INSERT INTO {schema}.CurrencyPairMetric (market, pair, metricTypeId) VALUES (%s, %s, %s)",
+                       combinations[:numMetrics])
+    cursor.execute(f"SELECT id FROM {schema}.CurrencyPairMetric")
+    cpmIds = [row[0] for row in cursor.fetchall()]
+    # Every metric is tracked by at least one user, on average by two of them.
+    tracking = set((1 + i % numUsers, cpmId) for i, cpmId in enumerate(cpmIds))
+    tracking |= set((random.randint(1, numUsers), random.choice(cpmIds)) for _ in range(len(cpmIds)))
+    cursor.executemany(f"INSERT INTO {schema}.UserCurrencyPairMetric (userId, currencyPairMetricId, createdAt) VALUES (%s, %s, now())",
+                       sorted(tracking))
+    start = time.time()
+    levels = {cpmId: random.uniform(1, 50000) for cpmId in cpmIds}
+    rows = []
+    for minute in range(hours * 60, 0, -1):
+        queriedAt = now - datetime.timedelta(minutes=minute)
+        for cpmId in cpmIds:
+            levels[cpmId] *= random.uniform(0.995, 1.005)
+            rows.append((cpmId, levels[cpmId], queriedAt))
+        if len(rows) >= chunkSize:
+            cursor.executemany(f"INSERT INTO {schema}.MetricValue (currencyPairMetricId, value, queriedAt) VALUES (%s, %s, %s)", rows)
+            rows = []
+    if len(rows) > 0:
+        cursor.executemany(f"INSERT INTO {schema}.MetricValue (currencyPairMetricId, value, queriedAt) VALUES (%s, %s, %s)", rows)
+    print(f"--- Seeded {len(cpmIds) * hours * 60} MetricValues --- {round(time.time() - start, 4)} seconds ---")
+    cursor.execute(f"ANALYZE TABLE {schema}.MetricValue, {schema}.CurrencyPairMetric, {schema}.UserCurrencyPairMetric")
+    cursor.fetchall()
+    return sorted(cpmId for userId, cpmId in tracking if userId == 1)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seeds a schema, dropped and recreated, with users, metrics and history.")
+    parser.add_argument("--schema", default="crypto_benchmark")
+    parser.add_argument("--metrics", type=int, default=2400)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--migrate", action="store_true", help="Also apply the migrations, ex: for the current schema.")
+    parser.add_argument("--random-seed", type=int, default=42, help="Same seed, same data.")
+    args = parser.parse_args()
+    random.seed(args.random_seed)
+
+    db = connect()
+    createSchema(db.cursor(), args.schema)
+    if args.migrate:
+        applyMigrations(db, args.schema)
+    seed(db, args.schema, args.metrics, args.users, args.hours, args.chunk_size)
+    db.close()
@@ -0,0 +1,86 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.seed import ROOT_DIR
+
+POLLER_DIR = os.path.join(ROOT_DIR, "cryptowatch-querying")
+
+# Cold start of the scheduled jobs: under cron every cycle of the poller starts a new interpreter, so the time
+# spent importing counts against the BACKEND_THRESHOLD budget of the cycle. Each target is imported by a fresh
+# interpreter, several times, and the wall time (interpreter included), the import time and the peak RSS are
+# reported. The "before" targets add the dependencies query-cryptowatch.py and canary.py used to import when
+# they were loaded (pandas, numpy, re, unicodedata and sendgrid) to the same job modules. Nothing is run, no
+# database is needed. Run from the root of the repo:
+#   python -m benchmarks.startup --runs 20 --output bench_startup.json
+
+PREVIOUS_IMPORTS = """import pymysql
+import re
+import numpy as np
+import pandas as pd
+import unicodedata
+import requests
+import json
+import sendgrid
+from sendgrid.helpers.mail import *
+"""
+
+TARGETS = [
+    ("interpreter", "pass"),
+    ("poller (before)", PREVIOUS_IMPORTS + "import jobs.poller"),
+    ("poller", "import jobs.poller"),
+    ("canary (before)", PREVIOUS_IMPORTS + "import jobs.canary"),
+    ("canary", "import jobs.canary"),
+]
+
+CHILD_TEMPLATE = """import time
+start = time.perf_counter()
+{imports}
+importSeconds = time.perf_counter() - start
+import json, resource
+print(json.dumps({{"importSeconds": importSeconds, "maxRssKb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+
+# Imports the code in a fresh interpreter, runs times over.
+# Outputs: the medians of the wall and import times in ms and of the peak RSS in MB, or the error of the import.
+def measureTarget(imports, runs):
+    wallMs, importMs, rssMb = [], [], []
+    for i in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", CHILD_TEMPLATE.format(imports=imports)], cwd=POLLER_DIR,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        child = json.loads(result.stdout.strip().splitlines()[-1])
+        wallMs.append(wall * 1000)
+        importMs.append(child["importSeconds"] * 1000)
+        rssMb.append(child["maxRssKb"] / 1024)
+    return {"runs": runs, "p50WallMs": round(statistics.median(wallMs), 1), "p50ImportMs": round(statistics.median(importMs), 1),
+            "maxWallMs": round(max(wallMs), 1), "p50MaxRssMb": round(statistics.median(rssMb), 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start time and memory of the poller and the canary.")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters started per target.")
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    results = {"createdAt": datetime.datetime.now().isoformat(), "python": sys.version.split()[0], "targets": {}}
+    for name, imports in TARGETS:
+        result = results["targets"][name] = measureTarget(imports, args.runs)
+        if "error" in result:
+            print(f"{name:>16} failed to import: {result['error']}")
+        else:
+            print(f"{name:>16} wall p50 {result['p50WallMs']:>8} ms   imports p50 {result['p50ImportMs']:>8} ms   "
+                  f"peak RSS {result['p50MaxRssMb']:>6} MB")
+
+    with open(args.output, "w") as outputFile:
+        json.dump(results, outputFile, indent=2)
+    print(f"Results written to {args.output}")
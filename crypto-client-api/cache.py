@@ -0,0 +1,137 @@
+import bisect
+import threading
+from cachetools import LRUCache, TTLCache
+
+
+# Read-through cache of the full (times, values) series of each CurrencyPairMetric. MetricValue only changes
+# once per cycle of query-cryptowatch.py, which bumps crypto.CycleVersion, so the whole cache is dropped as soon
+# as a request sees a new version. It is bounded by the total number of points held, evicting the least
+# recently used series first.
+class SeriesCache:
+    def __init__(self, maxPoints):
+        self.lock = threading.Lock()
+        self.series = LRUCache(maxsize=maxPoints, getsizeof=lambda series: max(1, len(series[0])))
+        self.version = None
+
+    # Clears the cache when the cycle version read from the database has moved on.
+    def sync(self, version):
+        with self.lock:
+            if version != self.version:
+                self.series.clear()
+                self.version = version
+
+    # Returns a dictionary of currencyPairMetricId => (times, values) for the cached ids, and the list of missing ids.
+    def getMany(self, cpmIds):
+        found, missing = {}, []
+        with self.lock:
+            for cpmId in cpmIds:
+                series = self.series.get(cpmId)
+                if series is None:
+                    missing.append(cpmId)
+                else:
+                    found[cpmId] = series
+        return found, missing
+
+    # Only stores the series if no newer cycle has been seen since it was read from the database.
+    def put(self, cpmId, times, values, version):
+        with self.lock:
+            if version == self.version:
+                try:
+                    self.series[cpmId] = (times, values)
+                except ValueError:
+                    # A single series bigger than the whole cache is simply not cached.
+                    pass
+
+
+# In-process cache of the metadata the mutation endpoints validate against: the MetricTypes by name (seven rows,
+# loaded all at once), the ids of the active users, and the (market, pair, metricTypeId) => CurrencyPairMetric id
+# mapping, which never changes once a row exists. Entries expire after ttlSeconds, and can be dropped right away
+# with invalidate. Only hits are cached, so a new user or MetricType is found on its first request.
+class MetadataCache:
+    def __init__(self, ttlSeconds, maxEntries=100000):
+        self.lock = threading.Lock()
+        self.metricTypes = TTLCache(maxsize=1, ttl=ttlSeconds)
+        self.userIds = TTLCache(maxsize=maxEntries, ttl=ttlSeconds)
+        self.pairMetricIds = TTLCache(maxsize=maxEntries, ttl=ttlSeconds)
+
+    # Returns the (id, deletedAt) of the MetricType, None if there is no such name.
+    def getMetricType(self, cursor, name):
+        with self.lock:
+            metricTypes = self.metricTypes.get("all")
+        if metricTypes is None:
+            cursor.execute("SELECT name, id, deletedAt FROM crypto.MetricType")
+            metricTypes = {row['name']: (row['id'], row['deletedAt']) for row in cursor.fetchall()}
+            with self.lock:
+                self.metricTypes["all"] = metricTypes
+        return metricTypes.get(name)
+
+    def isActiveUser(self, cursor, userId):
+        with self.lock:
+            if self.userIds.get(userId):
+                return True
+        cursor.execute("SELECT id FROM crypto.User WHERE deletedAt is null AND id = %s", (userId,))
+        if cursor.fetchone() is None:
+            return False
+        with self.lock:
+            self.userIds[userId] = True
+        return True
+
+    # Returns the id of the CurrencyPairMetric, None if it was never created.
+    def getPairMetricId(self, cursor, market, pair, metricTypeId):
+        key = (market, pair, metricTypeId)
+        with self.lock:
+            cpmId = self.pairMetricIds.get(key)
+        if cpmId is None:
+            cursor.execute("""SELECT id FROM crypto.CurrencyPairMetric WHERE market = %s AND pair = %s AND metricTypeId = %s
+                              ORDER BY id LIMIT 1""", key)
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cpmId = self.putPairMetricId(market, pair, metricTypeId, row['id'])
+        return cpmId
+
+    def putPairMetricId(self, market, pair, metricTypeId, cpmId):
+        with self.lock:
+            self.pairMetricIds[(market, pair, metricTypeId)] = cpmId
+        return cpmId
+
+    # Drops everything, or only the entry of one user.
+    def invalidate(self, userId=None):
+        with self.lock:
+            if userId is not None:
+                self.userIds.pop(userId, None)
+                return
+            self.metricTypes.clear()
+            self.userIds.clear()
+            self.pairMetricIds.clear()
+
+
+# Cuts a cached series down to the queriedAt range [fromTime, toTime], None meaning unbounded.
+def sliceSeries(times, values, fromTime, toTime):
+    start = 0 if fromTime is None else bisect.bisect_left(times, fromTime)
+    end = len(times) if toTime is None else bisect.bisect_right(times, toTime)
+    if start == 0 and end == len(times):
+        return times, values
+    return times[start:end], values[start:end]
+
+
+# Cuts the series of the tracked metrics down to what a client holding everything up to since may be missing:
+# the values queried at or after since, and the ranks that changed at or after it. The bound is inclusive because
+# the poller workers all stamp a cycle with the same queriedAt but commit it one after the other, so a worker
+# committing late adds values at the time a client was already given, the client deduplicating on (metric, time).
+# Inputs: the rows of getTrackedMetrics, a dictionary of currencyPairMetricId => (times, values), since
+# Outputs: the list of the metrics with anything new, and nextSince, the latest queriedAt returned (or since)
+def seriesSince(metricData, allSeries, since):
+    allMetricData, nextSince = [], since
+    for row in metricData:
+        times, values = sliceSeries(*allSeries[row['id']], since, None)
+        rankChanged = row['rankChangedAt'] != None and row['rankChangedAt'] >= since
+        if len(times) == 0 and not rankChanged:
+            continue
+        rowDict = {'pair': row['pair'], 'market': row['market'], 'metric': row['metricName'], 'times': times, 'values': values}
+        if rankChanged:
+            rowDict['rankNum'], rowDict['rankDenom'] = row['rankNum'], row['rankDenom']
+        if len(times) > 0:
+            nextSince = max(nextSince, times[-1])
+        allMetricData.append(rowDict)
+    return allMetricData, nextSince
@@ -0,0 +1,77 @@
+import numpy as np
+
+AGGREGATIONS = ["mean", "minmax", "lttb"]
+
+
+# Assigns each point to one of numBuckets equally wide time buckets spanning the series.
+# times is an int64 array of epoch seconds in ascending order.
+def timeBuckets(times, numBuckets):
+    span = times[-1] - times[0]
+    if span <= 0:
+        return np.zeros(len(times), dtype=np.int64)
+    return np.minimum(((times - times[0]) * numBuckets // (span + 1)).astype(np.int64), numBuckets - 1)
+
+
+# Averages the points that fall in each time bucket. Each bucket is represented by its mean time and value,
+# and empty buckets (gaps in the data) are dropped rather than invented.
+def downsampleMean(times, values, maxPoints):
+    buckets = timeBuckets(times, maxPoints)
+    counts = np.bincount(buckets, minlength=maxPoints)
+    timeSums = np.bincount(buckets, weights=times, minlength=maxPoints)
+    valueSums = np.bincount(buckets, weights=values, minlength=maxPoints)
+    filled = counts > 0
+    return (timeSums[filled] / counts[filled]).astype(np.int64), valueSums[filled] / counts[filled]
+
+
+# Keeps the lowest and the highest point of each time bucket, in time order, so spikes survive downsampling.
+# A single point has no room for both, it is the mean.
+def downsampleMinMax(times, values, maxPoints):
+    if maxPoints < 2:
+        return downsampleMean(times, values, maxPoints)
+    buckets = timeBuckets(times, maxPoints // 2)
+    # Sorted by bucket then by value: the first point of every bucket is its min and the last its max.
+    order = np.lexsort((values, buckets))
+    sortedBuckets = buckets[order]
+    firsts = np.flatnonzero(np.r_[True, sortedBuckets[1:] != sortedBuckets[:-1]])
+    lasts = np.r_[firsts[1:] - 1, len(order) - 1]
+    keep = np.unique(np.concatenate([order[firsts], order[lasts]]))
+    return times[keep], values[keep]
+
+
+# Largest-Triangle-Three-Buckets: keeps the first and last points, and from every bucket in between the point
+# forming the largest triangle with the previously kept point and the average of the next bucket. It keeps
+# the visual shape of the series far better than averaging. The area of every candidate of a bucket is
+# computed in one vectorized step.
+def downsampleLTTB(times, values, maxPoints):
+    if maxPoints < 3:
+        return downsampleMean(times, values, maxPoints)
+    edges = np.linspace(1, len(times) - 1, maxPoints - 1).astype(np.int64)
+    x, y = times.astype(np.float64), values
+    keep = np.empty(maxPoints, dtype=np.int64)
+    keep[0], keep[-1] = 0, len(times) - 1
+    previous = 0
+    for i in range(maxPoints - 2):
+        start, end = edges[i], edges[i + 1]
+        nextStart, nextEnd = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else len(times)
+        nextX, nextY = x[nextStart:nextEnd].mean(), y[nextStart:nextEnd].mean()
+        areas = np.abs((x[previous] - nextX) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (nextY - y[previous]))
+        previous = keep[i + 1] = start + int(np.argmax(areas))
+    return times[keep], values[keep]
+
+
+# Reduces a series to at most maxPoints points with the requested aggregation.
+# Inputs: list of datetimes, list of floats, maximum number of points, one of AGGREGATIONS
+# Outputs: (list of datetimes, list of floats), unchanged if the series is already small enough.
+def downsample(times, values, maxPoints, aggregation):
+    if maxPoints is None or len(times) <= maxPoints:
+        return times, values
+    epochs = np.array(times, dtype="datetime64[s]").astype(np.int64)
+    floats = np.array(values, dtype=np.float64)
+    if aggregation == "minmax":
+        epochs, floats = downsampleMinMax(epochs, floats, maxPoints)
+    elif aggregation == "lttb":
+        epochs, floats = downsampleLTTB(epochs, floats, maxPoints)
+    else:
+        epochs, floats = downsampleMean(epochs, floats, maxPoints)
+    return epochs.astype("datetime64[s]").tolist(), floats.tolist()
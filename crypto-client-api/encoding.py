@@ -0,0 +1,108 @@
+import base64
+import datetime
+import gzip
+import json
+import zlib
+import numpy as np
+from flask import Response
+
+# format= values and the Accept header mimetypes that select them. json is the original row oriented
+# format, the others are columnar: epoch-second times and packed float values.
+FORMATS = {
+    "json": "application/json",
+    "columnar": "application/vnd.crypto-data-tracker.columnar+json",
+    "base64": "application/vnd.crypto-data-tracker.base64+json",
+    "msgpack": "application/x-msgpack",
+}
+
+# Payloads smaller than this are not worth the CPU of compressing them.
+MIN_COMPRESS_BYTES = 1024
+
+
+# Chooses the response format from the format= parameter first, then from a mimetype explicitly listed in the
+# Accept header (a wildcard such as */* keeps the original json). Returns None for an unknown format= value.
+def negotiateFormat(request):
+    requested = request.args.get("format")
+    if requested:
+        return requested if requested in FORMATS else None
+    accepted = [mimetype for mimetype, quality in request.accept_mimetypes if quality > 0]
+    for name, mimetype in FORMATS.items():
+        if mimetype in accepted:
+            return name
+    return "json"
+
+
+# Converts naive datetimes on the local clock, the one queriedAt is stored in and parseTime reads epochs into,
+# to epoch seconds. numpy takes naive datetimes for UTC, so the local UTC offset is taken off, looked up once per
+# distinct hour since it only changes on the hour (daylight saving time).
+def toEpochs(times):
+    wallClock = np.array(times, dtype="datetime64[s]").astype(np.int64)
+    if len(wallClock) == 0:
+        return wallClock
+    hours, inverse = np.unique(wallClock // 3600, return_inverse=True)
+    offsets = np.array([(datetime.datetime(1970, 1, 1) + datetime.timedelta(hours=int(hour))).astimezone().utcoffset().total_seconds()
+                        for hour in hours], dtype=np.int64)
+    return wallClock - offsets[inverse.reshape(-1)]
+
+
+# Times are sent as epoch seconds, and as just a start plus a fixed step when the cadence is perfectly regular.
+def encodeTimes(times):
+    epochs = toEpochs(times)
+    if len(epochs) > 1:
+        steps = np.diff(epochs)
+        if np.all(steps == steps[0]):
+            return {"start": int(epochs[0]), "step": int(steps[0]), "count": len(epochs)}
+    return epochs.tolist()
+
+
+# Values are float32 little-endian: a list of floats for columnar, base64 text for base64 and raw bytes for msgpack.
+def encodeValues(values, outputFormat):
+    if outputFormat == "columnar":
+        return [float(value) for value in values]
+    packed = np.array(values, dtype="<f4").tobytes()
+    return base64.b64encode(packed).decode("ascii") if outputFormat == "base64" else packed
+
+
+def toColumnar(body, outputFormat):
+    data = []
+    for metric in body["data"]:
+        columnarMetric = {k: v for k, v in metric.items() if k not in ("times", "values")}
+        columnarMetric["times"] = encodeTimes(metric["times"])
+        columnarMetric["values"] = encodeValues(metric["values"], outputFormat)
+        data.append(columnarMetric)
+    encodedBody = {k: v for k, v in body.items() if k != "data"}
+    encodedBody["encoding"] = {"times": "epoch-seconds", "values": "float32-le" if outputFormat != "columnar" else "float"}
+    encodedBody["data"] = data
+    return encodedBody
+
+
+# Compresses with gzip or deflate when the client accepts it and the payload is large enough.
+def compress(request, payload):
+    encoding = request.accept_encodings.best_match(["gzip", "deflate"])
+    if encoding is None or len(payload) < MIN_COMPRESS_BYTES:
+        return payload, None
+    if encoding == "gzip":
+        return gzip.compress(payload, compresslevel=6), "gzip"
+    return zlib.compress(payload, 6), "deflate"
+
+
+# Serializes the graph response body ({"code", "successfullyFinished", "data": [...]}) in the negotiated format
+# and content encoding. Times are datetimes and values floats within each metric of data.
+def encodeGraphResponse(request, body, status):
+    outputFormat = negotiateFormat(request)
+    if outputFormat is None:
+        message = f"format must be one of {', '.join(FORMATS.keys())}."
+        return Response(json.dumps({"code":400, "msg": message}), status=400, mimetype="application/json")
+    if outputFormat == "json":
+        payload = json.dumps(body, default = str).encode()
+    elif outputFormat == "msgpack":
+        import msgpack
+        payload = msgpack.packb(toColumnar(body, outputFormat), use_bin_type=True)
+    else:
+        payload = json.dumps(toColumnar(body, outputFormat), separators=(",", ":")).encode()
+    payload, contentEncoding = compress(request, payload)
+    response = Response(payload, status=status, mimetype=FORMATS[outputFormat])
+    if contentEncoding is not None:
+        response.headers["Content-Encoding"] = contentEncoding
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    return response
@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+
+# Production serving of the REST API: gunicorn -c gunicorn.conf.py wsgi:app
+# The gevent workers monkey patch the sockets, so a worker keeps serving other requests while one waits on
+# MySQL (PyMySQL is pure Python) instead of holding a whole process per request. Each worker imports the app
+# itself and holds its own mySQL pool: the connections opened on MySQL go up to workers * MAX_POOL_SIZE, keep
+# that below its max_connections. GET /pool-stats recommends MAX_POOL_SIZE from the demand each worker saw.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+# Concurrent requests per gevent worker, beyond MAX_POOL_SIZE of them wait on the pool for up to POOL_TIMEOUT.
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+# Long enough for a streamed graph response of a large watchlist.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 10))
+keepalive = 5
+# Recycles the workers now and then, staggered so they do not all restart at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+# The pool is opened when server.py is imported, loading it before the fork would share its sockets.
+preload_app = False
+
+
+# Drops the Prometheus samples of a dead worker when the metrics are aggregated across workers.
+def child_exit(server, worker):
+    if os.environ.get("prometheus_multiproc_dir"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,51 @@
+import os
+import time
+from flask import g, request, Response
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+
+# Prometheus metrics of the REST API, served on /metrics. With several Gunicorn workers, point the
+# prometheus_multiproc_dir environment variable to a directory shared by them so /metrics aggregates them all.
+# Gauges are then read from the values the workers last set, not computed when scraped: they are set as the
+# state they report changes, and their multiprocess_mode says how the workers are aggregated.
+
+REQUEST_SECONDS = Histogram("api_request_seconds", "Latency of the requests, by route.", ["route", "method", "status"],
+                            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+POOL_WAIT_SECONDS = Histogram("api_pool_wait_seconds", "Time spent waiting for a connection from the mySQL pool.",
+                              buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+ROWS_FETCHED = Histogram("api_rows_fetched", "Rows read from MySQL per query.", ["query"],
+                         buckets=(1, 10, 100, 1000, 10000, 100000, 1000000))
+RESPONSE_BYTES = Histogram("api_response_bytes", "Size of the serialized response bodies, by route.", ["route"],
+                           buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+POOL_CONNECTIONS = Gauge("api_pool_connections", "Connections of the mySQL pools, by state, summed over the workers.", ["state"],
+                         multiprocess_mode="livesum")
+POOL_CHECKOUTS = Counter("api_pool_checkouts_total", "Connections checked out of the mySQL pool.")
+POOL_TIMEOUTS = Counter("api_pool_timeouts_total", "Checkouts that gave up waiting for a connection after POOL_TIMEOUT.")
+POOL_LEAKS = Counter("api_pool_leaks_total", "Connections held for longer than POOL_LEAK_SECONDS.")
+POOL_RECOMMENDED_SIZE = Gauge("api_pool_recommended_size", "Pool size recommended from the demand observed, by bound "
+                              "(min and max), per live worker (take the max over their pid), 0 until enough checkouts were seen.",
+                              ["bound"], multiprocess_mode="liveall")
+
+
+# Times every request and measures its response body, labelled by the route rule rather than the path so
+# the userIds do not end up in the labels.
+def instrumentApp(app):
+    @app.before_request
+    def startRequestTimer():
+        g.requestStart = time.time()
+
+    @app.after_request
+    def observeRequest(response):
+        route = request.url_rule.rule if request.url_rule != None else "unmatched"
+        REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(time.time() - g.get("requestStart", time.time()))
+        # Streamed responses have no length up front, they are not measured here.
+        if response.content_length != None:
+            RESPONSE_BYTES.labels(route).observe(response.content_length)
+        return response
+
+
+def metricsResponse():
+    registry = REGISTRY
+    if os.environ.get("prometheus_multiproc_dir"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -1,4 +1,9 @@
 import os
+import datetime
+from downsampling import AGGREGATIONS
+from tiers import TIERS
+
+BULK_ACTIONS = ["add", "remove"]
 
 def validateAuthorization(request):
     return 'Authorization' in request.headers and os.environ.get("AUTHORIZATION_TOKEN") == request.headers['Authorization']
@@ -18,3 +23,82 @@ def checkParams(data):
         errorMessage += " this must be specified in order to add this metric."
         return errorMessage, None, None, None, None
     return "", data["userId"], data["market"], data["pair"], data["metric"]
+
+
+# Makes sure the body of /bulk-tracking-metrics has a userId and a list of at most maxOperations operations.
+def checkBulkParams(data, maxOperations):
+    operations = data.get("operations") if isinstance(data, dict) else None
+    if not isinstance(data, dict) or "userId" not in data or not isinstance(operations, list):
+        return "Missing userId or operations this must be specified in order to update the watchlist.", None, None
+    if len(operations) > maxOperations:
+        return f"At most {maxOperations} operations can be sent at once.", None, None
+    return "", data["userId"], operations
+
+
+# Validates the operations of /bulk-tracking-metrics one by one, the metric names being looked up through the
+# MetadataCache (see cache.py). An operation on the same metric as an earlier one is a duplicate.
+# Outputs: the list of results, one per operation, and the list of (index, action, key) of the valid ones.
+def validateOperations(cursor, metadataCache, operations):
+    results, valid, seen = [], [], {}
+    for index, operation in enumerate(operations):
+        result = {"index": index}
+        if not isinstance(operation, dict):
+            result.update({"code": 400, "msg": "Each operation must be an object."})
+            results.append(result)
+            continue
+        action, market, pair, metric = operation.get("action", "add"), operation.get("market"), operation.get("pair"), operation.get("metric")
+        result.update({"action": action, "market": market, "pair": pair, "metric": metric})
+        metricType = metadataCache.getMetricType(cursor, metric) if isinstance(metric, str) else None
+        if action not in BULK_ACTIONS:
+            result.update({"code": 400, "msg": f"action must be one of {', '.join(BULK_ACTIONS)}."})
+        elif not isinstance(market, str) or not isinstance(pair, str) or len(market) == 0 or len(pair) == 0:
+            result.update({"code": 400, "msg": "market and pair must be specified."})
+        elif metricType == None or metricType[1] != None:
+            result.update({"code": 400, "msg": "Invalid Metric"})
+        elif (market, pair, metricType[0]) in seen:
+            result.update({"code": 400, "msg": f"Duplicate of the operation {seen[(market, pair, metricType[0])]}."})
+        else:
+            seen[(market, pair, metricType[0])] = index
+            valid.append((index, action, (market, pair, metricType[0])))
+        results.append(result)
+    return results, valid
+
+
+# Reads a time boundary passed either as epoch seconds or as an ISO formatted datetime (ex: 2021-03-08T12:00:00).
+# Times with an offset are converted to local time, the naive clock queriedAt is stored in. Anything that is not a
+# time, including epochs out of the range of the datetimes (inf, nan, 1e20), raises a ValueError.
+def parseTime(value):
+    try:
+        seconds = float(value)
+    except ValueError:
+        parsed = datetime.datetime.fromisoformat(value)
+        return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo != None else parsed
+    try:
+        return datetime.datetime.fromtimestamp(seconds)
+    except (OverflowError, OSError, ValueError):
+        raise ValueError(f"{value} is not a valid epoch")
+
+
+# Validates the optional query parameters of the graph endpoint: from, to, maxPoints, aggregation and tier.
+# Returns the error message (empty when valid) followed by the parsed values, None for the ones not given.
+def checkGraphParams(args):
+    fromTime, toTime, maxPoints = None, None, None
+    try:
+        if args.get("from"): fromTime = parseTime(args.get("from"))
+        if args.get("to"): toTime = parseTime(args.get("to"))
+    except ValueError:
+        return "from and to must be epoch seconds or ISO formatted datetimes.", None, None, None, None, None
+    if args.get("maxPoints"):
+        try:
+            maxPoints = int(args.get("maxPoints"))
+        except ValueError:
+            maxPoints = 0
+        if maxPoints < 1:
+            return "maxPoints must be a positive integer.", None, None, None, None, None
+    aggregation = args.get("aggregation", "mean")
+    if aggregation not in AGGREGATIONS:
+        return f"aggregation must be one of {', '.join(AGGREGATIONS)}.", None, None, None, None, None
+    tier = args.get("tier")
+    if tier != None and tier not in TIERS:
+        return f"tier must be one of {', '.join(TIERS.keys())}.", None, None, None, None, None
+    return "", fromTime, toTime, maxPoints, aggregation, tier
@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pymysqlpool.pool import TimeoutError as PoolTimeoutError
+from instrumentation import POOL_WAIT_SECONDS, POOL_CHECKOUTS, POOL_TIMEOUTS, POOL_LEAKS, POOL_RECOMMENDED_SIZE, POOL_CONNECTIONS
+
+# Headroom applied on top of the p99 demand observed when recommending MAX_POOL_SIZE.
+SIZING_HEADROOM = 1.25
+# Below this many checkouts the demand observed is not worth a recommendation.
+SIZING_MIN_SAMPLES = 100
+# The recommendation sorts the samples, it is reported to the gauges once every this many checkouts.
+SIZING_REPORT_EVERY = 100
+
+
+# Nearest-rank percentile of a list of numbers.
+def percentile(values, q):
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+# Wraps the pymysql pool so that every connection is checked out and released in one place:
+#   with poolMonitor.connection() as (db, cursor):
+# always releases, whatever happens in the block (a streamed response, which outlives its view, releases its
+# connection from the close hook of the response instead). It counts the checkouts, the time spent waiting and the
+# checkouts that timed out, and reports connections held longer than leakSeconds as leaked (once each, they are
+# not taken back as a long streamed response can legitimately hold one). The demand seen by each checkout (the
+# connections in use plus the requests waiting for one) is sampled over the last windowSize checkouts to
+# recommend the pool size of this process, see recommendation. The connections in use and idle are reported on
+# every checkout and release, as the pool changes, and the recommendation every SIZING_REPORT_EVERY checkouts.
+class PoolMonitor:
+    def __init__(self, pool, leakSeconds, windowSize=10000):
+        self.pool = pool
+        self.leakSeconds = leakSeconds
+        self.lock = threading.Lock()
+        self.leases = {}
+        self.waiting = 0
+        self.peakDemand = 0
+        self.checkouts, self.timeouts, self.leaks = 0, 0, 0
+        self.demandSamples = deque(maxlen=windowSize)
+        self.waitSamples = deque(maxlen=windowSize)
+        self.reportConnections()
+        POOL_RECOMMENDED_SIZE.labels("min").set(0)
+        POOL_RECOMMENDED_SIZE.labels("max").set(0)
+
+    def checkout(self):
+        with self.lock:
+            self.waiting += 1
+            demand = len(self.leases) + self.waiting
+        start = time.time()
+        try:
+            connection = self.pool.get_conn()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc()
+            with self.lock:
+                self.waiting -= 1
+                self.timeouts += 1
+            raise
+        checkedOutAt = time.time()
+        POOL_WAIT_SECONDS.observe(checkedOutAt - start)
+        POOL_CHECKOUTS.inc()
+        with self.lock:
+            self.waiting -= 1
+            self.leases[connection] = [checkedOutAt, False]
+            self.checkouts += 1
+            checkouts = self.checkouts
+            self.peakDemand = max(self.peakDemand, demand)
+            self.demandSamples.append(demand)
+            self.waitSamples.append(checkedOutAt - start)
+            self.reportLeaks(checkedOutAt)
+        self.reportConnections()
+        if checkouts % SIZING_REPORT_EVERY == 0:
+            self.reportRecommendation()
+        return connection
+
+    # Releasing a connection twice is harmless, only the first release goes back to the pool.
+    def release(self, connection):
+        with self.lock:
+            if self.leases.pop(connection, None) == None:
+                return
+        self.pool.release(connection)
+        self.reportConnections()
+
+    @contextmanager
+    def connection(self):
+        connection = self.checkout()
+        try:
+            yield connection, connection.cursor()
+        finally:
+            self.release(connection)
+
+    def reportConnections(self):
+        POOL_CONNECTIONS.labels("inUse").set(len(self.pool.inuse_list))
+        POOL_CONNECTIONS.labels("idle").set(len(self.pool.unuse_list))
+
+    def reportRecommendation(self):
+        recommendation = self.recommendation()
+        POOL_RECOMMENDED_SIZE.labels("min").set(recommendation["recommendedMinPoolSize"] or 0)
+        POOL_RECOMMENDED_SIZE.labels("max").set(recommendation["recommendedMaxPoolSize"] or 0)
+
+    # Called with the lock held, on every checkout.
+    def reportLeaks(self, now):
+        for connection, lease in self.leases.items():
+            if not lease[1] and now - lease[0] > self.leakSeconds:
+                lease[1] = True
+                self.leaks += 1
+                POOL_LEAKS.inc()
+                print(f"--- Pooled connection held for more than {self.leakSeconds} seconds, it was probably leaked ---")
+
+    # Recommends MIN_POOL_SIZE as the median demand and MAX_POOL_SIZE as the p99 demand plus SIZING_HEADROOM,
+    # over the last checkouts of this process. Both are None until SIZING_MIN_SAMPLES checkouts were seen. Each
+    # Gunicorn worker holds its own pool, so the connections opened on MySQL go up to workers * MAX_POOL_SIZE.
+    def recommendation(self):
+        with self.lock:
+            demandSamples, waitSamples = list(self.demandSamples), list(self.waitSamples)
+            stats = {"checkouts": self.checkouts, "timeouts": self.timeouts, "leaks": self.leaks,
+                     "inUse": len(self.leases), "waiting": self.waiting, "peakDemand": self.peakDemand}
+        p50Demand, p99Demand = percentile(demandSamples, 50), percentile(demandSamples, 99)
+        p99Wait = percentile(waitSamples, 99)
+        enoughSamples = len(demandSamples) >= SIZING_MIN_SAMPLES
+        stats.update({
+            "samples": len(demandSamples),
+            "p50Demand": p50Demand,
+            "p99Demand": p99Demand,
+            "p99WaitMs": round(p99Wait * 1000, 3) if p99Wait != None else None,
+            "configuredMinPoolSize": self.pool.min_size,
+            "configuredMaxPoolSize": self.pool.max_size,
+            "recommendedMinPoolSize": max(1, p50Demand) if enoughSamples else None,
+            "recommendedMaxPoolSize": max(1, math.ceil(p99Demand * SIZING_HEADROOM)) if enoughSamples else None,
+        })
+        return stats
@@ -1,17 +1,22 @@
 from flask import Flask
 from flask import request
+from flask import Response
+from flask import stream_with_context
 from flask_cors import CORS
 from setup import init
-from middleware import validateAuthorization, checkParams
+from middleware import validateAuthorization, checkParams, checkGraphParams, checkBulkParams, validateOperations, parseTime
+from downsampling import downsample
+from encoding import encodeGraphResponse, negotiateFormat
+from cache import SeriesCache, MetadataCache, sliceSeries, seriesSince
+from tiers import TIERS, selectTier
+from instrumentation import instrumentApp, metricsResponse, ROWS_FETCHED
+from pooling import PoolMonitor, PoolTimeoutError
 from healthcheck import HealthCheck, EnvironmentDump
-import numpy as np
 from pymysqlpool.pool import Pool
-import requests
 import pymysql
 import json
-import time
-from threading import Thread
-from werkzeug.exceptions import HTTPException
+import hashlib
+import datetime
 import os
 
 
@@ -35,15 +40,26 @@ SQL_PASSWORD=os.environ.get('SQL_PASSWORD')
 SQL_SCHEMA=os.environ.get('SQL_SCHEMA')
 MAX_POOL_SIZE=os.environ.get('MAX_POOL_SIZE')
 MIN_POOL_SIZE=os.environ.get('MIN_POOL_SIZE')
-pool = Pool(host=SQL_IP, user=SQL_USER, password=SQL_PASSWORD, db=SQL_SCHEMA, autocommit=True, min_size=int(MIN_POOL_SIZE), max_size=int(MAX_POOL_SIZE))
+# Seconds a request waits for a connection before getting a 503, and seconds after which a checked out
+# connection is reported as leaked.
+POOL_TIMEOUT=float(os.environ.get('POOL_TIMEOUT', 10))
+POOL_LEAK_SECONDS=float(os.environ.get('POOL_LEAK_SECONDS', 60))
+pool = Pool(host=SQL_IP, user=SQL_USER, password=SQL_PASSWORD, db=SQL_SCHEMA, autocommit=True, min_size=int(MIN_POOL_SIZE), max_size=int(MAX_POOL_SIZE), timeout=POOL_TIMEOUT)
 pool.init()
 print("Pool initialized")
+poolMonitor = PoolMonitor(pool, POOL_LEAK_SECONDS)
+instrumentApp(app)
 
-# This returns the necessary objects to operate with the mySQL Pool.
-def connectToMySQL():
-    connection = pool.get_conn()
-    cursor = connection.cursor()
-    return connection, cursor, pool
+# Series of the tracked metrics kept in memory between cycles, bounded by the total number of points held.
+SERIES_CACHE_MAX_POINTS=int(os.environ.get('SERIES_CACHE_MAX_POINTS', 500000))
+seriesCache = SeriesCache(SERIES_CACHE_MAX_POINTS)
+
+# Hours of raw MetricValues kept by retention.py, older graph ranges are read from the hourly and daily rollups.
+HOURS_LOOKBACK=int(os.environ.get('HOURS_LOOKBACK', 24))
+
+# MetricTypes, active users and CurrencyPairMetric ids looked up by the mutation endpoints, kept for this many seconds.
+METADATA_CACHE_TTL=int(os.environ.get('METADATA_CACHE_TTL', 300))
+metadataCache = MetadataCache(METADATA_CACHE_TTL)
 
 # To be used for Debugging. Need to view the logs to see what happened.
 @app.errorhandler(Exception)
@@ -51,6 +67,12 @@ def handleException(e):
     print(e)
     return json.dumps({'success': 0, 'objects': [], 'errorHandler': 1})
 
+# Every connection of the pool was busy for POOL_TIMEOUT seconds, the client should retry shortly.
+@app.errorhandler(PoolTimeoutError)
+def handlePoolTimeout(e):
+    return Response(json.dumps({"code":503, "msg": "The database is busy, try again shortly."}), status=503,
+                    mimetype="application/json", headers={"Retry-After": "1"})
+
 @app.route('/')
 def validate_token():
     if validateAuthorization(request):
@@ -58,108 +80,159 @@ def validate_token():
     else:
         return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
 
-# Error handler that will return the proper error message as well as release the db from the pool.
-def returnErrorReleaseSQL(pool, db, errorMessage):
-    pool.release(db)
-    return json.dumps({"code":400, "msg": errorMessage}), 400
+# Statements of the mutation endpoints, parameterized so that the values sent by the clients never end up in
+# the SQL itself. Starting to track a metric the user is already tracking inserts nothing, and the matching on
+# (market, pair, metricTypeId) rather than on a single id also covers duplicated CurrencyPairMetric rows.
+insertPairMetricQuery = "INSERT INTO crypto.CurrencyPairMetric (market, pair, metricTypeId) VALUES (%s, %s, %s)"
+beginTrackingQuery = """
+    INSERT INTO crypto.UserCurrencyPairMetric (userId, currencyPairMetricId, createdAt)
+    SELECT %s, %s, now() FROM DUAL
+    WHERE NOT EXISTS (
+        SELECT 1 FROM crypto.UserCurrencyPairMetric ucpm JOIN crypto.CurrencyPairMetric cpm
+        ON ucpm.currencyPairMetricId = cpm.id
+        WHERE ucpm.deletedAt is null AND ucpm.userId = %s
+        AND cpm.market = %s AND cpm.pair = %s AND cpm.metricTypeId = %s
+    )
+"""
+endTrackingQuery = """
+    UPDATE crypto.UserCurrencyPairMetric ucpm JOIN crypto.CurrencyPairMetric cpm
+    ON ucpm.currencyPairMetricId = cpm.id
+    SET ucpm.deletedAt = now()
+    WHERE ucpm.deletedAt is null AND ucpm.userId = %s
+    AND cpm.market = %s AND cpm.pair = %s AND cpm.metricTypeId = %s
+"""
+
+# Returns the userId as an int, None when it is not a valid id.
+def parseUserId(userId):
+    try:
+        userId = int(userId)
+    except (TypeError, ValueError):
+        return None
+    return userId if userId > 0 else None
+
+# Validates the user and the metric name against the metadata cache.
+# Returns the error message (empty when valid) and the metricTypeId.
+def validateUserMetric(cursor, userId, metric):
+    if not metadataCache.isActiveUser(cursor, userId):
+        return "Invalid UserId", None
+    metricType = metadataCache.getMetricType(cursor, metric)
+    if metricType == None:
+        return "Invalid Metric", None
+    metricTypeId, deletedAt = metricType
+    if deletedAt != None:
+        return f"Metric was deleted at {deletedAt}", None
+    return "", metricTypeId
 
-# This adds the specified metric, pair, and market to be tracked for the user.
+# This adds the specified metric, pair, and market to be tracked for the user. With the metadata cached, this
+# is a single statement, plus the creation of the CurrencyPairMetric the first time a pair/metric is tracked.
 def addToDataBaseForTracking(userId, market, pair, metric):
-    if userId < 1:
+    userId = parseUserId(userId)
+    if userId == None:
         return json.dumps({"code":400, "msg": "Invalid UserId"}), 400
-    else:
-        db, cursor, pool = connectToMySQL()
-        userValidatingQuery = f"SELECT id FROM crypto.User WHERE deletedAt is null AND id = {userId};"
-        cursor.execute(userValidatingQuery)
-        if len(cursor.fetchall()) < 1:
-            return returnErrorReleaseSQL(pool, db, "Invalid UserId")
-
-        metricValidatingQuery = f"SELECT mt.deletedAt, mt.id FROM crypto.MetricType mt WHERE mt.deletedAt is null AND mt.name = '{metric}';"
-        cursor.execute(metricValidatingQuery)
-        metricData = cursor.fetchall()
-        if len(metricData) < 1:
-            return returnErrorReleaseSQL(pool, db, "Invalid Metric")
-        deletedAt, metricTypeId = metricData[0]['deletedAt'], metricData[0]['id']
-        if deletedAt != None:
-            return returnErrorReleaseSQL(pool, db, f"Metric was deleted at {deletedAt}")
-
-        # TO DO
-        # Add market and pair validation as well. I am assuming good behavior with these.
-
-        # Counter is for Debugging
+    with poolMonitor.connection() as (db, cursor):
         try:
-            failed = False
-            shortCircuit = False
-            counter = 0
-            # Step 0
-            check = f"""
-            SELECT cpm.id, CASE WHEN ucpm.userId = {userId} THEN 1 ELSE 0 END as alreadyTracking
-            FROM crypto.UserCurrencyPairMetric ucpm JOIN crypto.CurrencyPairMetric cpm
-            ON ucpm.currencyPairMetricId = cpm.id
-            WHERE ucpm.deletedAt is null
-            AND cpm.market = '{market}'
-            AND cpm.pair = '{pair}'
-            AND cpm.metricTypeId = {metricTypeId}
-            ORDER BY 2 DESC
-            LIMIT 1
-            """
-            cursor.execute(check)
-            pairMetricData = cursor.fetchall()
-
-            counter += 1
-            if len(pairMetricData) < 1:
-                # Step 1
-                insertionPairMetric = f"INSERT INTO crypto.CurrencyPairMetric (market, pair, metricTypeId) VALUES  ('{market}', '{pair}', {metricTypeId});"
-                print(insertionPairMetric)
-                cursor.execute(insertionPairMetric)
-                currencyPairMetricId = cursor.lastrowid
-                counter += 1
-                # Step 2 declares currencyPairMetricId using the cursor Function
-            else:
-                currencyPairMetricId = pairMetricData[0]['id']
-                alreadyTracking = pairMetricData[0]['alreadyTracking']
-                if alreadyTracking == 1:
-                    shortCircuit = True
-                    return
-                counter += 2
-                # Step 3 declares currencyPairMetricId via first row
-            userMetricRelationship = f"INSERT INTO crypto.UserCurrencyPairMetric (userId, currencyPairMetricId, createdAt) VALUES ({userId},{currencyPairMetricId}, now())"
-            cursor.execute(userMetricRelationship)
-        except:
-            print(f"Error occurred during step: {counter}")
-            failed = True
-            pass
-        finally:
-            pool.release(db)
-            if shortCircuit: return json.dumps({"code":200, "msg": "User already tracking that metric"}), 200
-            if failed: return json.dumps({"code":400, "msg": f"Something went wrong {metric} for {pair} on {market} for this user."}), 400
+            if not isinstance(market, str) or not isinstance(pair, str) or len(market) == 0 or len(pair) == 0:
+                return json.dumps({"code":400, "msg": "market and pair must be specified."}), 400
+            errorMessage, metricTypeId = validateUserMetric(cursor, userId, metric)
+            if len(errorMessage) > 0:
+                return json.dumps({"code":400, "msg": errorMessage}), 400
+            currencyPairMetricId = metadataCache.getPairMetricId(cursor, market, pair, metricTypeId)
+            if currencyPairMetricId == None:
+                cursor.execute(insertPairMetricQuery, (market, pair, metricTypeId))
+                currencyPairMetricId = metadataCache.putPairMetricId(market, pair, metricTypeId, cursor.lastrowid)
+            cursor.execute(beginTrackingQuery, (userId, currencyPairMetricId, userId, market, pair, metricTypeId))
+            if cursor.rowcount == 0:
+                return json.dumps({"code":200, "msg": "User already tracking that metric"}), 200
             return json.dumps({"code":201, "msg": f"Successfully Added {metric} for {pair} on {market} for this user."}), 201
+        except Exception as e:
+            print(f"Error occurred adding {metric} for {pair} on {market} for user {userId}: {e}")
+            return json.dumps({"code":400, "msg": f"Something went wrong {metric} for {pair} on {market} for this user."}), 400
 
 
-# This function returns the rank of the standard deviation using SQL
-# to compare to other metrics of that type, on that market that are being tracked.
-# It returns the numerator of the rank, and the denominator of the rank (being the total
-# of such metrics).
-def getRank(cursor, currencyPairMetricId, metricTypeId, market):
-    rankNum, rankDenom = 0, 0
-    rankQuery = f"""
-    SELECT stddev(mv.value), cpm.id FROM
-    crypto.MetricValue mv JOIN
-    crypto.CurrencyPairMetric cpm
-    ON mv.currencyPairMetricId = cpm.id
-    WHERE cpm.metricTypeId = {metricTypeId}
-    AND cpm.market = '{market}'
-    GROUP BY 2
-    ORDER BY 1 DESC
-    """
-    cursor.execute(rankQuery)
-    rankData = cursor.fetchall()
-    rowNum = 0
-    for row in rankData:
-        rowNum += 1
-        if row['id'] == currencyPairMetricId: rankNum = rowNum
-    rankDenom = rowNum
-    return rankNum, rankDenom
+# Bulk version of the two mutations above for a whole watchlist: every operation is validated on its own, then
+# the CurrencyPairMetrics are resolved and the missing ones created, the user's current tracking is read, and the
+# additions and removals are written, each with one set-based statement, in a single transaction.
+insertTrackingQuery = "INSERT INTO crypto.UserCurrencyPairMetric (userId, currencyPairMetricId, createdAt) VALUES (%s, %s, now())"
+BULK_MAX_OPERATIONS=int(os.environ.get('BULK_MAX_OPERATIONS', 1000))
+
+# Returns the (market, pair, metricTypeId) IN (...) condition matching the keys, and its parameters.
+def keysCondition(columns, keys):
+    return f"({columns}) IN ({', '.join(['(%s, %s, %s)'] * len(keys))})", [value for key in keys for value in key]
+
+# Returns a dictionary of (market, pair, metricTypeId) => currencyPairMetricId for the keys that exist.
+def resolvePairMetricIds(cursor, keys):
+    pairMetricIds = {}
+    if len(keys) > 0:
+        condition, params = keysCondition("market, pair, metricTypeId", keys)
+        cursor.execute(f"SELECT id, market, pair, metricTypeId FROM crypto.CurrencyPairMetric WHERE {condition} ORDER BY id DESC", params)
+        for row in cursor.fetchall():
+            pairMetricIds[(row['market'], row['pair'], row['metricTypeId'])] = row['id']
+    return pairMetricIds
+
+def bulkUpdateTracking(userId, operations):
+    userId = parseUserId(userId)
+    if userId == None:
+        return json.dumps({"code":400, "msg": "Invalid UserId"}), 400
+    with poolMonitor.connection() as (db, cursor):
+        try:
+            if not metadataCache.isActiveUser(cursor, userId):
+                return json.dumps({"code":400, "msg": "Invalid UserId"}), 400
+            results, valid = validateOperations(cursor, metadataCache, operations)
+            addKeys = [key for index, action, key in valid if action == "add"]
+            removeKeys = [key for index, action, key in valid if action == "remove"]
+            db.begin()
+            try:
+                pairMetricIds = resolvePairMetricIds(cursor, addKeys + removeKeys)
+                missingKeys = [key for key in addKeys if key not in pairMetricIds]
+                if len(missingKeys) > 0:
+                    cursor.executemany(insertPairMetricQuery, missingKeys)
+                    pairMetricIds.update(resolvePairMetricIds(cursor, missingKeys))
+
+                trackedKeys = set()
+                if len(valid) > 0:
+                    condition, params = keysCondition("cpm.market, cpm.pair, cpm.metricTypeId", addKeys + removeKeys)
+                    cursor.execute(f"""
+                        SELECT DISTINCT cpm.market, cpm.pair, cpm.metricTypeId
+                        FROM crypto.UserCurrencyPairMetric ucpm JOIN crypto.CurrencyPairMetric cpm
+                        ON ucpm.currencyPairMetricId = cpm.id
+                        WHERE ucpm.deletedAt is null AND ucpm.userId = %s AND {condition}
+                    """, [userId] + params)
+                    trackedKeys = set((row['market'], row['pair'], row['metricTypeId']) for row in cursor.fetchall())
+
+                newKeys = [key for key in addKeys if key not in trackedKeys]
+                if len(newKeys) > 0:
+                    cursor.executemany(insertTrackingQuery, [(userId, pairMetricIds[key]) for key in newKeys])
+                endedKeys = [key for key in removeKeys if key in trackedKeys]
+                if len(endedKeys) > 0:
+                    condition, params = keysCondition("cpm.market, cpm.pair, cpm.metricTypeId", endedKeys)
+                    cursor.execute(f"""
+                        UPDATE crypto.UserCurrencyPairMetric ucpm JOIN crypto.CurrencyPairMetric cpm
+                        ON ucpm.currencyPairMetricId = cpm.id
+                        SET ucpm.deletedAt = now()
+                        WHERE ucpm.deletedAt is null AND ucpm.userId = %s AND {condition}
+                    """, [userId] + params)
+                db.commit()
+            except:
+                db.rollback()
+                raise
+            for key, cpmId in pairMetricIds.items():
+                metadataCache.putPairMetricId(key[0], key[1], key[2], cpmId)
+
+            for index, action, (market, pair, metricTypeId) in valid:
+                metric = results[index]["metric"]
+                if action == "add" and (market, pair, metricTypeId) in trackedKeys:
+                    results[index].update({"code": 200, "msg": "User already tracking that metric"})
+                elif action == "add":
+                    results[index].update({"code": 201, "msg": f"Successfully Added {metric} for {pair} on {market} for this user."})
+                elif (market, pair, metricTypeId) in trackedKeys:
+                    results[index].update({"code": 200, "msg": f"Successfully ended tracking of {metric} for {pair} on {market} for this user."})
+                else:
+                    results[index].update({"code": 200, "msg": f"User was not tracking {metric} for {pair} on {market} for this user."})
+            return json.dumps({"code":200, "added": len(newKeys), "removed": len(endedKeys), "results": results}), 200
+        except Exception as e:
+            print(f"Error occurred during the bulk update of user {userId}: {e}")
+            return json.dumps({"code":400, "msg": "Something went wrong, none of the operations were applied."}), 400
+
 
 # This function takes in a cursor object as well as the currencyPairMetricIds.
 # It returns a Dictionary of Dictionaries.
@@ -167,18 +240,12 @@ def getRank(cursor, currencyPairMetricId, metricTypeId, market):
 # specific CurrencyPairMetric. The Value is a Dictionary with the keys being:
 # "times": X Array of the times that the metric was taken
 # "values": Y Array of the value of that metric at the corresponding times
-# such that the frontend can graph this data.
-def getAllUserGraphData(cursor, allUserCurrencyPairMetrics, indexDict):
-    # Special handling when there is only one metric vs multiple.
-    whereString = f" in {tuple(allUserCurrencyPairMetrics)} " if len(allUserCurrencyPairMetrics) > 1 else f" = {allUserCurrencyPairMetrics[0]} "
-    graphQuery = f"""
-    SELECT queriedAt, value, currencyPairMetricId
-    FROM crypto.MetricValue
-    WHERE currencyPairMetricId {whereString}
-    ORDER BY 3, 1 ASC
-    """
-    cursor.execute(graphQuery)
+# such that the frontend can graph this data. fromTime and toTime optionally bound the queriedAt range, and
+# tier is the table the values are read from (see tiers.py).
+def getAllUserGraphData(cursor, allUserCurrencyPairMetrics, indexDict, fromTime = None, toTime = None, tier = "raw"):
+    cursor.execute(*graphDataQuery(allUserCurrencyPairMetrics, fromTime, toTime, tier))
     graphData = cursor.fetchall()
+    ROWS_FETCHED.labels("graph").observe(len(graphData))
     resultsDict = {}
     # Taking advantage of the SQL Ordering
     prevId, xAr, yAr = 0, [], []
@@ -191,77 +258,224 @@ def getAllUserGraphData(cursor, allUserCurrencyPairMetrics, indexDict):
         xAr.append(row['queriedAt'])
         yAr.append(row['value'])
     # Still have to add the last one as the trigger condition would not have been hit yet
-    resultsDict[indexDict[prevId]] = {'times': xAr, 'values': yAr}
+    if prevId > 0:
+        resultsDict[indexDict[prevId]] = {'times': xAr, 'values': yAr}
     return resultsDict
 
-def getMetricsUserIsTracking(userId):
-    db, cursor, pool = connectToMySQL()
-    getMetrics = f"""
-    SELECT cpm.*, mt.name as metricName
+# Returns the query and parameters reading the values of the currencyPairMetricIds from the tier, ordered by
+# currencyPairMetricId then time so that each metric's values come as one contiguous group. The rollup tiers
+# are read as (queriedAt, value) rows too, with the start and the mean of each bucket.
+def graphDataQuery(allUserCurrencyPairMetrics, fromTime = None, toTime = None, tier = "raw"):
+    timeColumn, valueColumn = TIERS[tier]["time"], TIERS[tier]["value"]
+    # Special handling when there is only one metric vs multiple.
+    whereString = f" in {tuple(allUserCurrencyPairMetrics)} " if len(allUserCurrencyPairMetrics) > 1 else f" = {allUserCurrencyPairMetrics[0]} "
+    rangeString, rangeParams = "", []
+    if fromTime is not None:
+        rangeString += f" AND {timeColumn} >= %s "
+        rangeParams.append(fromTime)
+    if toTime is not None:
+        rangeString += f" AND {timeColumn} <= %s "
+        rangeParams.append(toTime)
+    graphQuery = f"""
+    SELECT {timeColumn} as queriedAt, {valueColumn} as value, currencyPairMetricId
+    FROM crypto.{TIERS[tier]["table"]}
+    WHERE currencyPairMetricId {whereString} {rangeString}
+    ORDER BY 3, 1 ASC
+    """
+    return graphQuery, rangeParams
+
+# The ETag of a graph response only changes when a new cycle landed (the version), when the user's tracked
+# metrics changed, or when a different representation (query parameters, format, encoding) was asked for.
+def graphETag(version, metricData, representation):
+    trackedIds = ",".join(str(row['id']) for row in metricData)
+    return hashlib.sha1(f"{version}|{trackedIds}|{representation}".encode()).hexdigest()
+
+# Reads the version bumped by query-cryptowatch.py after every cycle, and drops the series cache if it moved on.
+def syncCycleVersion(cursor):
+    cursor.execute("SELECT version FROM crypto.CycleVersion WHERE id = 1")
+    versionRow = cursor.fetchone()
+    version = versionRow['version'] if versionRow != None else 0
+    seriesCache.sync(version)
+    return version
+
+# Returns the rows of the CurrencyPairMetrics the user is tracking, ordered by id, with their metric name.
+# The ranks of the standard deviation compared to the other metrics of that type, on that market, are
+# materialized by the ingestion script after each cycle, so they come along with the metrics in one lookup.
+def getTrackedMetrics(cursor, userId):
+    getMetrics = """
+    SELECT cpm.*, mt.name as metricName,
+    COALESCE(mr.rankNum, 0) as rankNum, COALESCE(mr.rankDenom, 0) as rankDenom, mr.rankChangedAt
     FROM crypto.CurrencyPairMetric cpm
     JOIN crypto.MetricType mt on cpm.metricTypeId = mt.id
+    LEFT JOIN crypto.MetricRank mr on mr.currencyPairMetricId = cpm.id
     WHERE cpm.id IN
     (
     SELECT DISTINCT ucpm.currencyPairMetricId
     FROM UserCurrencyPairMetric ucpm
-    WHERE ucpm.deletedAt is null AND ucpm.userId = {userId}
+    WHERE ucpm.deletedAt is null AND ucpm.userId = %s
     )
+    ORDER BY cpm.id
     """
-    cursor.execute(getMetrics)
+    cursor.execute(getMetrics, (userId,))
     metricData = cursor.fetchall()
-    allMetricData = []
+    ROWS_FETCHED.labels("trackedMetrics").observe(len(metricData))
+    return metricData
+
+# Returns a Dictionary of currencyPairMetricId => (times, values) with the full series of each metric.
+# They are assembled from the series cache, only the missing ones are read from MetricValue (and cached).
+def getCachedSeries(cursor, allUserCurrencyPairMetrics, version):
+    allSeries, missing = seriesCache.getMany(allUserCurrencyPairMetrics)
+    if len(missing) > 0:
+        graphDataDict = getAllUserGraphData(cursor, missing, {cpmId: cpmId for cpmId in missing})
+        for cpmId in missing:
+            series = graphDataDict.get(cpmId, {'times': [], 'values': []})
+            allSeries[cpmId] = (series['times'], series['values'])
+            seriesCache.put(cpmId, series['times'], series['values'], version)
+    return allSeries
+
+# Returns a Dictionary of currencyPairMetricId => (times, values) read from one of the rollup tiers. These
+# series are short (a month is 720 hourly buckets) and only asked for by the long range views, so they are
+# read straight from the database rather than cached.
+def getRollupSeries(cursor, allUserCurrencyPairMetrics, fromTime, toTime, tier):
+    if len(allUserCurrencyPairMetrics) == 0:
+        return {}
+    graphDataDict = getAllUserGraphData(cursor, allUserCurrencyPairMetrics, {cpmId: cpmId for cpmId in allUserCurrencyPairMetrics},
+                                        fromTime, toTime, tier)
+    emptySeries = {'times': [], 'values': []}
+    return {cpmId: (graphDataDict.get(cpmId, emptySeries)['times'], graphDataDict.get(cpmId, emptySeries)['values'])
+            for cpmId in allUserCurrencyPairMetrics}
+
+# Returns the response body with all of the user's tracked metrics, their ranks and graph data, along with
+# the status code and ETag. When maxPoints is given every series longer than that is downsampled on the server
+# with the requested aggregation (see downsampling.py). Serializing the body is left to encodeGraphResponse.
+# If the ETag is in ifNoneMatch, no series are read at all and the body is None with a 304. The raw series go
+# through the series cache, the hourly and daily tiers are read from their rollup tables.
+def getMetricsUserIsTracking(userId, fromTime = None, toTime = None, maxPoints = None, aggregation = "mean", representation = "", ifNoneMatch = None, tier = "raw"):
+    with poolMonitor.connection() as (db, cursor):
+        version = syncCycleVersion(cursor)
+        metricData = getTrackedMetrics(cursor, userId)
+        etag = graphETag(version, metricData, representation)
+        if ifNoneMatch != None and ifNoneMatch.contains_weak(etag):
+            return None, 304, etag
+        allMetricData = []
+        try:
+            allUserCurrencyPairMetrics, indexDict, index = [], {}, 0
+            for row in metricData:
+                currencyPairMetricId = row['id']
+                allUserCurrencyPairMetrics.append(currencyPairMetricId)
+                indexDict[currencyPairMetricId] = index
+                rowDict = {'pair': row['pair'], 'market': row['market'], 'metric': row['metricName'],
+                            'rankNum': row['rankNum'], 'rankDenom': row['rankDenom'], 'times': [], 'values': []}
+                allMetricData.append(rowDict)
+                index += 1
+            if tier == "raw":
+                allSeries = getCachedSeries(cursor, allUserCurrencyPairMetrics, version)
+            else:
+                allSeries = getRollupSeries(cursor, allUserCurrencyPairMetrics, fromTime, toTime, tier)
+        except:
+            print(f"Error occurred {len(allMetricData)} / {len(metricData)} of the way through the loop.")
+            return {"code":200, "successfullyFinished": False, "tier": tier, "data": allMetricData}, 200, None
+    # The series are all in memory, the connection is back in the pool before they are downsampled.
     try:
-        allUserCurrencyPairMetrics, indexDict, index = [], {}, 0
-        for row in metricData:
-            currencyPairMetricId = row['id']
-            allUserCurrencyPairMetrics.append(currencyPairMetricId)
-            indexDict[currencyPairMetricId] = index
-            rankNum, rankDenom = getRank(cursor, currencyPairMetricId, row['metricTypeId'], row['market'])
-            rowDict = {'pair': row['pair'], 'market': row['market'], 'metric': row['metricName'],
-                        'rankNum': rankNum, 'rankDenom': rankDenom, 'times': [], 'values': []}
-            allMetricData.append(rowDict)
-            index += 1
-        graphDataDict = getAllUserGraphData(cursor, allUserCurrencyPairMetrics, indexDict)
-        for k, v in graphDataDict.items():
-            allMetricData[k]['times'] = v['times']
-            allMetricData[k]['values'] = v['values']
-        pool.release(db)
-        return json.dumps({"code":200, "successfullyFinished": True, "data": allMetricData}, default = str), 200
+        for cpmId, (times, values) in allSeries.items():
+            times, values = sliceSeries(times, values, fromTime, toTime)
+            allMetricData[indexDict[cpmId]]['times'], allMetricData[indexDict[cpmId]]['values'] = downsample(times, values, maxPoints, aggregation)
+        return {"code":200, "successfullyFinished": True, "tier": tier, "data": allMetricData}, 200, etag
+    except:
+        print(f"Error occurred downsampling the {len(metricData)} metrics.")
+        return {"code":200, "successfullyFinished": False, "tier": tier, "data": allMetricData}, 200, None
+
+# Streaming version of getMetricsUserIsTracking for very large watchlists: returns a generator of the json
+# response in chunks, along with the status code, the ETag and the function releasing the pooled connection.
+# The values are read through an unbuffered server side cursor, so only the group of the metric being assembled
+# is ever held in memory: each metric is serialized as soon as its currencyPairMetricId group closes. It bypasses
+# the series cache, which would hold every series at once. The connection outlives this call, so the caller
+# releases it when the response is closed (see getGraphsOfMetrics): a generator closed before it started, as
+# for a HEAD request or a client gone before the first chunk, never runs its own cleanup. As the status is sent
+# before the data, a failure part of the way through ends the array early with successfullyFinished false,
+# which is why that key comes last.
+def streamMetricsUserIsTracking(userId, fromTime = None, toTime = None, maxPoints = None, aggregation = "mean", representation = "", ifNoneMatch = None, tier = "raw"):
+    db = poolMonitor.checkout()
+    release = lambda: poolMonitor.release(db)
+    try:
+        cursor = db.cursor()
+        version = syncCycleVersion(cursor)
+        metricData = getTrackedMetrics(cursor, userId)
+    except:
+        release()
+        raise
+    etag = graphETag(version, metricData, representation)
+    if ifNoneMatch != None and ifNoneMatch.contains_weak(etag):
+        return None, 304, etag, release
+
+    def generateBody():
+        streamCursor = db.cursor(pymysql.cursors.SSDictCursor)
+        metricsSent, rowsRead = 0, 0
+        try:
+            yield f'{{"code": 200, "tier": "{tier}", "data": ['
+            if len(metricData) > 0:
+                streamCursor.execute(*graphDataQuery([row['id'] for row in metricData], fromTime, toTime, tier))
+            graphRows = streamCursor.fetchall_unbuffered() if len(metricData) > 0 else iter(())
+            # Both are ordered by currencyPairMetricId, so the groups of values are consumed metric by metric.
+            graphRow = next(graphRows, None)
+            for row in metricData:
+                xAr, yAr = [], []
+                while graphRow != None and graphRow['currencyPairMetricId'] == row['id']:
+                    xAr.append(graphRow['queriedAt'])
+                    yAr.append(graphRow['value'])
+                    graphRow = next(graphRows, None)
+                rowsRead += len(xAr)
+                xAr, yAr = downsample(xAr, yAr, maxPoints, aggregation)
+                rowDict = {'pair': row['pair'], 'market': row['market'], 'metric': row['metricName'],
+                            'rankNum': row['rankNum'], 'rankDenom': row['rankDenom'], 'times': xAr, 'values': yAr}
+                yield ("" if metricsSent == 0 else ", ") + json.dumps(rowDict, default = str)
+                metricsSent += 1
+            yield '], "successfullyFinished": true}'
+        except Exception as e:
+            print(f"Error occurred {metricsSent} / {len(metricData)} of the way through the stream: {e}")
+            yield '], "successfullyFinished": false}'
+        finally:
+            ROWS_FETCHED.labels("graph").observe(rowsRead)
+            # Reads whatever is left of the result set so the connection can be reused.
+            streamCursor.close()
+
+    return generateBody(), 200, etag, release
+
+# Returns the response body with only what changed for the user's tracked metrics since the previous call: the
+# values queried at or after since, and the ranks that changed at or after it (see seriesSince). Metrics without
+# either are left out. nextSince is the cursor to send on the next call, the latest queriedAt returned (or since
+# itself when nothing was new).
+def getMetricsUserIsTrackingSince(userId, since):
+    with poolMonitor.connection() as (db, cursor):
+        version = syncCycleVersion(cursor)
+        metricData = getTrackedMetrics(cursor, userId)
+        allMetricData = []
+        try:
+            allSeries = getCachedSeries(cursor, [row['id'] for row in metricData], version)
+        except:
+            print(f"Error occurred {len(allMetricData)} / {len(metricData)} of the way through the loop.")
+            return {"code":200, "successfullyFinished": False, "nextSince": since.isoformat(), "data": allMetricData}, 200
+    try:
+        allMetricData, nextSince = seriesSince(metricData, allSeries, since)
+        return {"code":200, "successfullyFinished": True, "nextSince": nextSince.isoformat(), "data": allMetricData}, 200
     except:
-        pool.release(db)
         print(f"Error occurred {len(allMetricData)} / {len(metricData)} of the way through the loop.")
-        return json.dumps({"code":200, "successfullyFinished": False, "data": allMetricData}, default = str), 200
+        return {"code":200, "successfullyFinished": False, "nextSince": since.isoformat(), "data": allMetricData}, 200
 
-# Properly handles when the User is not in the database as well as when the metric is not valid.
+# Properly handles when the User is not in the database as well as when the metric is not valid. With the
+# metadata cached, ending the tracking is a single statement.
 def safeRemoveFromDatabase(userId, market, pair, metric):
-    db, cursor, pool = connectToMySQL()
-    userValidatingQuery = f"SELECT id FROM crypto.User WHERE deletedAt is null AND id = {userId};"
-    cursor.execute(userValidatingQuery)
-    if len(cursor.fetchall()) < 1:
-        return returnErrorReleaseSQL(pool, db, "Invalid UserId")
-    metricValidatingQuery = f"SELECT mt.id FROM crypto.MetricType mt WHERE mt.deletedAt is null AND mt.name = '{metric}';"
-    cursor.execute(metricValidatingQuery)
-    metricData = cursor.fetchall()
-    if len(metricData) < 1:
-        return returnErrorReleaseSQL(pool, db, "Invalid Metric")
-    metricTypeId = metricData[0]['id']
-    check = f"""
-    SELECT ucpm.id
-    FROM crypto.UserCurrencyPairMetric ucpm JOIN crypto.CurrencyPairMetric cpm
-    ON ucpm.currencyPairMetricId = cpm.id
-    WHERE ucpm.deletedAt is null
-    AND cpm.market = '{market}'
-    AND cpm.pair = '{pair}'
-    AND cpm.metricTypeId = {metricTypeId}
-    """
-    cursor.execute(check)
-    checkUserMetricData = cursor.fetchall()
-    if len(checkUserMetricData) < 1:
-        pool.release(db)
-        return json.dumps({"code":200, "msg": f"User was not tracking {metric} for {pair} on {market} for this user."}), 200
-    userCurrencyPairMetricId = checkUserMetricData[0]['id']
-    cursor.execute(f"UPDATE crypto.UserCurrencyPairMetric SET deletedAt = now() where id = {userCurrencyPairMetricId}")
-    return json.dumps({"code":200, "msg": f"Successfully ended tracking of {metric} for {pair} on {market} for this user."}), 200
+    userId = parseUserId(userId)
+    if userId == None:
+        return json.dumps({"code":400, "msg": "Invalid UserId"}), 400
+    with poolMonitor.connection() as (db, cursor):
+        errorMessage, metricTypeId = validateUserMetric(cursor, userId, metric)
+        if len(errorMessage) > 0:
+            return json.dumps({"code":400, "msg": errorMessage}), 400
+        cursor.execute(endTrackingQuery, (userId, market, pair, metricTypeId))
+        if cursor.rowcount == 0:
+            return json.dumps({"code":200, "msg": f"User was not tracking {metric} for {pair} on {market} for this user."}), 200
+        return json.dumps({"code":200, "msg": f"Successfully ended tracking of {metric} for {pair} on {market} for this user."}), 200
 
 # This function adds the
 @app.route('/begin-tracking-metric', methods = ['POST'])
@@ -277,23 +491,93 @@ def addTrackingMetric():
         return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
 
 
+# Applies a whole watchlist of operations for a user at once, in a single transaction. The body is
+#   {'userId': 1, 'operations': [{'action': 'add' (default) or 'remove', 'market': ..., 'pair': ..., 'metric': ...}, ...]}
+# and the response has one result per operation, in order, with the same code and msg as the single routes.
+@app.route('/bulk-tracking-metrics', methods = ['POST'])
+def bulkTrackingMetrics():
+    if validateAuthorization(request):
+        errorMessage, userId, operations = checkBulkParams(request.get_json(silent=True), BULK_MAX_OPERATIONS)
+        if len(errorMessage) > 0:
+            return json.dumps({"code":400, "msg": errorMessage}), 400
+        return bulkUpdateTracking(userId, operations)
+    else:
+        return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
+
+
 # Takes in a userId and returns all of that users tracked metrics in a json object of
 # the format:
 #   {
 #     successfullyFinished: true,
+#     tier: 'raw', (or 'hourly', 'daily', the storage tier the values were read from)
 #     data: [{'pair': pairName, 'market': marketName, 'metric': metricName,
 #             'rankNum': rankNumerator, 'rankDenom': rankDenominator,
 #             'times': [], (AN ARRAY OF STRINGS, NEEDS TO BE CONVERTED ON FRONTEND TO GRAPH)
 #              'values': []    (AN ARRAY OF floats) }, ...
 #           ]
 #   }
-# IMPROVEMENT: Right now, if there is a user that is tracking many different metrics,
-# this function will return all of 1440 pairs for each one of the users' metrics which might
-# overload the cache for the frontend at scale.
+# Optional query parameters bound the size of the payload no matter how long the lookback is:
+#   from, to:     epoch seconds or ISO datetimes limiting the range of queriedAt
+#   maxPoints:    maximum number of points returned per metric
+#   aggregation:  how series longer than maxPoints are downsampled, mean (default), minmax or lttb
+#   tier:         raw, hourly or daily, by default raw within the lookback and else the coarsest rollup tier satisfying maxPoints (see tiers.py)
+# The format can be chosen with format= or the Accept header (see encoding.py): json (default), or one of the
+# columnar, base64 and msgpack formats, where times are epoch seconds (or start/step/count when the cadence is
+# regular) and values are floats or packed float32. Responses are gzip/deflate compressed when accepted.
+# Responses carry an ETag that only changes with a new ingestion cycle, so clients sending If-None-Match get
+# a 304 between cycles. With stream=1 the json is sent in chunks as it is read, see streamMetricsUserIsTracking.
 @app.route('/graphs-of-tracked-metrics/<userId>', methods = ['GET'])
 def getGraphsOfMetrics(userId):
     if validateAuthorization(request):
-        return getMetricsUserIsTracking(userId)
+        errorMessage, fromTime, toTime, maxPoints, aggregation, tier = checkGraphParams(request.args)
+        if len(errorMessage) > 0:
+            return json.dumps({"code":400, "msg": errorMessage}), 400
+        tier = selectTier(tier, fromTime, toTime, maxPoints, datetime.datetime.now(), HOURS_LOOKBACK)
+        representation = f"{request.full_path}|{request.headers.get('Accept', '')}|{request.headers.get('Accept-Encoding', '')}"
+        if request.args.get("stream") in ("1", "true"):
+            if negotiateFormat(request) != "json":
+                return json.dumps({"code":400, "msg": "Only the json format can be streamed."}), 400
+            chunks, status, etag, release = streamMetricsUserIsTracking(userId, fromTime, toTime, maxPoints, aggregation, representation, request.if_none_match, tier)
+            try:
+                response = Response(status=304) if status == 304 else Response(stream_with_context(chunks), status=status, mimetype="application/json")
+            except:
+                release()
+                raise
+            # Runs once the body was sent or dropped, after the generator was closed.
+            response.call_on_close(release)
+        else:
+            body, status, etag = getMetricsUserIsTracking(userId, fromTime, toTime, maxPoints, aggregation, representation, request.if_none_match, tier)
+            response = Response(status=304) if status == 304 else encodeGraphResponse(request, body, status)
+        if etag != None:
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    else:
+        return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
+
+
+# Companion of /graphs-of-tracked-metrics/<userId> for clients refreshing their graphs: takes a since
+# parameter (epoch seconds or ISO datetime, normally the nextSince of the previous response) and returns, in
+# the same formats, only the values queried at or after it plus the ranks that changed at or after it. The values
+# at since itself come back on every call, so the client keeps one value per (metric, time):
+#   {
+#     successfullyFinished: true,
+#     nextSince: '2021-03-08T12:01:00',
+#     data: [{'pair': pairName, 'market': marketName, 'metric': metricName,
+#             'times': [], 'values': [], ('rankNum', 'rankDenom' only when the rank changed) }, ...
+#           ]
+#   }
+@app.route('/graphs-of-tracked-metrics/<userId>/since', methods = ['GET'])
+def getGraphsOfMetricsSince(userId):
+    if validateAuthorization(request):
+        if not request.args.get("since"):
+            return json.dumps({"code":400, "msg": "Missing since this must be specified in order to get the new values."}), 400
+        try:
+            since = parseTime(request.args.get("since"))
+        except ValueError:
+            return json.dumps({"code":400, "msg": "since must be epoch seconds or an ISO formatted datetime."}), 400
+        body, status = getMetricsUserIsTrackingSince(userId, since)
+        return encodeGraphResponse(request, body, status)
     else:
         return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
 
@@ -308,7 +592,38 @@ def removeUserMetric(userId, market, pair, metric):
         return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
 
 
+# Drops the metadata cache of this process right away, ex: after a user was deleted or a MetricType changed,
+# instead of waiting for METADATA_CACHE_TTL. With a userId in the body, only that user is dropped, and without a
+# body everything is. This is best-effort: each Gunicorn worker holds its own cache and only the one answering
+# is invalidated, the others catch up within METADATA_CACHE_TTL.
+@app.route('/metadata-cache/invalidate', methods = ['POST'])
+def invalidateMetadataCache():
+    if validateAuthorization(request):
+        data = request.get_json(silent=True)
+        if (data == None and len(request.get_data()) > 0) or (data != None and not isinstance(data, dict)):
+            return json.dumps({"code":400, "msg": "The body must be a JSON object, or empty to drop the whole cache."}), 400
+        userId = None
+        if data != None and "userId" in data:
+            userId = parseUserId(data["userId"])
+            if userId == None:
+                return json.dumps({"code":400, "msg": "userId must be a positive integer."}), 400
+        metadataCache.invalidate(userId)
+        return json.dumps({"code":200, "msg": "Metadata cache of this worker invalidated"}), 200
+    else:
+        return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
+
+
 # Provides a HealthCheck route to make sure that the REST API is functioning correctly.
+# Reports the checkouts, waits, timeouts and leaks of this process's mySQL pool, and the MIN_POOL_SIZE and
+# MAX_POOL_SIZE recommended from the demand it observed (see pooling.py). Read it under production load.
+@app.route('/pool-stats', methods = ['GET'])
+def getPoolStats():
+    if validateAuthorization(request):
+        return json.dumps({"code":200, "pool": poolMonitor.recommendation()}), 200
+    else:
+        return json.dumps({"code":400, "msg": "Validation Not Correct"}), 400
+
+
 @app.route('/hc')
 def healthcheck():
     return health.run()
@@ -317,5 +632,10 @@ def healthcheck():
 def data_info():
     return env_dump.run()
 
+# Prometheus metrics of the API (see instrumentation.py), like /hc it is meant for the cluster only.
+@app.route('/metrics')
+def metrics():
+    return metricsResponse()
+
 if __name__ == '__main__':
     app.run(debug=True,host='0.0.0.0')
@@ -0,0 +1,41 @@
+import datetime
+
+from cache import seriesSince, sliceSeries
+
+START = datetime.datetime(2026, 1, 1)
+
+
+def minutes(count):
+    return START + datetime.timedelta(minutes=count)
+
+
+def trackedRow(cpmId, rankChangedAt=None):
+    return {'id': cpmId, 'pair': f"pair{cpmId}", 'market': "kraken", 'metricName': "price", 'rankNum': 1, 'rankDenom': 2,
+            'rankChangedAt': rankChangedAt}
+
+
+def test_slice_series_is_inclusive_on_both_ends():
+    times = [minutes(i) for i in range(5)]
+    assert sliceSeries(times, list(range(5)), minutes(1), minutes(3)) == (times[1:4], [1, 2, 3])
+    assert sliceSeries(times, list(range(5)), None, None) == (times, list(range(5)))
+
+
+def test_since_returns_what_a_late_worker_wrote_at_the_cursor():
+    metricData = [trackedRow(1), trackedRow(2)]
+    # A first worker has committed the cycle of minute 1, the second one has not yet.
+    allSeries = {1: ([minutes(0), minutes(1)], [1.0, 2.0]), 2: ([minutes(0)], [10.0])}
+    data, nextSince = seriesSince(metricData, allSeries, minutes(0))
+    assert nextSince == minutes(1)
+    # The second worker commits the same cycle, stamped with the time the client was already given.
+    allSeries[2] = ([minutes(0), minutes(1)], [10.0, 20.0])
+    data, nextSince = seriesSince(metricData, allSeries, nextSince)
+    assert [(row['pair'], row['values']) for row in data] == [("pair1", [2.0]), ("pair2", [20.0])]
+    assert nextSince == minutes(1)
+
+
+def test_since_leaves_out_metrics_with_nothing_new():
+    metricData = [trackedRow(1), trackedRow(2, rankChangedAt=minutes(5))]
+    allSeries = {1: ([minutes(0)], [1.0]), 2: ([minutes(0)], [10.0])}
+    data, nextSince = seriesSince(metricData, allSeries, minutes(5))
+    assert data == [{'pair': "pair2", 'market': "kraken", 'metric': "price", 'times': [], 'values': [], 'rankNum': 1, 'rankDenom': 2}]
+    assert nextSince == minutes(5)
@@ -0,0 +1,64 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from downsampling import AGGREGATIONS, downsample, downsampleLTTB, downsampleMean, downsampleMinMax, timeBuckets
+
+
+def series(count):
+    times = np.arange(count, dtype=np.int64) * 60
+    return times, np.sin(times / 600.0)
+
+
+@pytest.mark.parametrize("aggregation", AGGREGATIONS)
+@pytest.mark.parametrize("maxPoints", [1, 2, 3, 7, 100])
+def test_never_returns_more_than_max_points(aggregation, maxPoints):
+    start = datetime.datetime(2026, 1, 1)
+    times = [start + datetime.timedelta(minutes=i) for i in range(500)]
+    sampledTimes, sampledValues = downsample(times, list(np.sin(np.arange(500) / 10)), maxPoints, aggregation)
+    assert 1 <= len(sampledTimes) <= maxPoints
+    assert len(sampledTimes) == len(sampledValues)
+    assert sampledTimes == sorted(sampledTimes)
+
+
+def test_short_series_is_unchanged():
+    times, values = [datetime.datetime(2026, 1, 1)], [1.0]
+    assert downsample(times, values, 10, "lttb") == (times, values)
+    assert downsample(times, values, None, "mean") == (times, values)
+
+
+def test_time_buckets_cover_the_span():
+    times, values = series(10)
+    assert timeBuckets(times, 5).tolist() == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+    assert timeBuckets(np.zeros(3, dtype=np.int64), 5).tolist() == [0, 0, 0]
+
+
+def test_mean_drops_empty_buckets():
+    times = np.array([0, 1, 100, 101], dtype=np.int64)
+    sampledTimes, sampledValues = downsampleMean(times, np.array([1.0, 3.0, 5.0, 7.0]), 10)
+    assert sampledTimes.tolist() == [0, 100] and sampledValues.tolist() == [2.0, 6.0]
+
+
+def test_min_max_keeps_the_spikes():
+    times, values = series(1000)
+    values[123], values[777] = 50.0, -50.0
+    sampledTimes, sampledValues = downsampleMinMax(times, values, 20)
+    assert len(sampledTimes) <= 20
+    assert 50.0 in sampledValues and -50.0 in sampledValues
+
+
+def test_min_max_to_a_single_point_is_the_mean():
+    times, values = series(10)
+    sampledTimes, sampledValues = downsampleMinMax(times, values, 1)
+    assert len(sampledTimes) == 1 and sampledValues[0] == pytest.approx(values.mean())
+
+
+def test_lttb_keeps_the_ends_and_the_spike():
+    times, values = series(1000)
+    values[500] = 50.0
+    sampledTimes, sampledValues = downsampleLTTB(times, values, 50)
+    assert len(sampledTimes) == 50
+    assert sampledTimes[0] == times[0] and sampledTimes[-1] == times[-1]
+    assert 50.0 in sampledValues
+    assert np.all(np.diff(sampledTimes) > 0)
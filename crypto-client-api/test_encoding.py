@@ -0,0 +1,37 @@
+import datetime
+import time
+
+import pytest
+
+from encoding import encodeTimes, toEpochs
+from middleware import parseTime
+
+
+@pytest.fixture(params=["UTC", "America/New_York", "Asia/Kolkata"])
+def localZone(request, monkeypatch):
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_epochs_round_trip_through_parse_time(localZone):
+    times = [datetime.datetime(2021, 3, 8, 12, 0), datetime.datetime(2021, 7, 1, 0, 30, 15)]
+    epochs = toEpochs(times).tolist()
+    assert epochs == [int(t.timestamp()) for t in times]
+    assert [parseTime(str(epoch)) for epoch in epochs] == times
+
+
+def test_epochs_follow_daylight_saving_time(localZone):
+    # The clocks of New York go forward at 2:00 on 2021-03-14, 1:59 and 3:00 are a minute apart.
+    times = [datetime.datetime(2021, 3, 14, 1, 59), datetime.datetime(2021, 3, 14, 3, 0)]
+    assert toEpochs(times).tolist() == [int(t.timestamp()) for t in times]
+
+
+def test_regular_times_are_sent_as_start_and_step(localZone):
+    start = datetime.datetime(2021, 3, 8, 12)
+    times = [start + datetime.timedelta(minutes=i) for i in range(5)]
+    assert encodeTimes(times) == {"start": int(start.timestamp()), "step": 60, "count": 5}
+    assert encodeTimes(times[:1] + times[2:]) == [int(t.timestamp()) for t in times[:1] + times[2:]]
+    assert encodeTimes([]) == []
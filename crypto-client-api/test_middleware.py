@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+
+from cache import MetadataCache
+from middleware import checkBulkParams, checkGraphParams, parseTime, validateOperations
+
+
+# crypto.MetricType rows, answered to the query of MetadataCache.getMetricType.
+class FakeMetricTypeCursor:
+    def __init__(self):
+        self.queries = 0
+
+    def execute(self, query, params=None):
+        self.queries += 1
+
+    def fetchall(self):
+        return [{'name': "price", 'id': 1, 'deletedAt': None}, {'name': "volume", 'id': 2, 'deletedAt': None},
+                {'name': "spread", 'id': 3, 'deletedAt': datetime.datetime(2026, 1, 1)}]
+
+
+def test_parse_time_reads_epochs_and_iso_datetimes():
+    assert parseTime("1615204800") == datetime.datetime.fromtimestamp(1615204800)
+    assert parseTime("2021-03-08T12:00:00") == datetime.datetime(2021, 3, 8, 12)
+    offset = datetime.datetime(2021, 3, 8, 12, tzinfo=datetime.timezone.utc)
+    assert parseTime("2021-03-08T12:00:00+00:00") == offset.astimezone().replace(tzinfo=None)
+
+
+@pytest.mark.parametrize("value", ["inf", "-inf", "nan", "1e20", "-1e20", "yesterday", "2021-13-01"])
+def test_parse_time_rejects_what_is_not_a_time(value):
+    with pytest.raises(ValueError):
+        parseTime(value)
+
+
+def test_graph_params_reject_out_of_range_epochs():
+    message, fromTime, toTime, maxPoints, aggregation, tier = checkGraphParams({"from": "inf"})
+    assert message == "from and to must be epoch seconds or ISO formatted datetimes."
+
+
+def test_graph_params_reject_a_non_positive_max_points():
+    assert checkGraphParams({"maxPoints": "0"})[0] == "maxPoints must be a positive integer."
+    assert checkGraphParams({"maxPoints": "many"})[0] == "maxPoints must be a positive integer."
+    assert checkGraphParams({"maxPoints": "5"})[3] == 5
+
+
+def test_bulk_params_need_a_user_and_a_bounded_list_of_operations():
+    missing = "Missing userId or operations this must be specified in order to update the watchlist."
+    assert checkBulkParams(None, 10)[0] == missing
+    assert checkBulkParams([], 10)[0] == missing
+    assert checkBulkParams({"operations": []}, 10)[0] == missing
+    assert checkBulkParams({"userId": 1, "operations": {"market": "kraken"}}, 10)[0] == missing
+    assert checkBulkParams({"userId": 1, "operations": [{}] * 11}, 10)[0] == "At most 10 operations can be sent at once."
+    assert checkBulkParams({"userId": 1, "operations": [{}] * 10}, 10) == ("", 1, [{}] * 10)
+
+
+def test_each_operation_is_validated_on_its_own():
+    operations = [
+        {"market": "kraken", "pair": "btcusd", "metric": "price"},
+        "kraken btcusd price",
+        {"action": "replace", "market": "kraken", "pair": "btcusd", "metric": "price"},
+        {"action": "remove", "market": "", "pair": "btcusd", "metric": "price"},
+        {"action": "remove", "market": "kraken", "pair": "btcusd", "metric": "spread"},
+        {"action": "remove", "market": "kraken", "pair": "btcusd", "metric": "depth"},
+        {"action": "remove", "market": "kraken", "pair": "btcusd", "metric": "price"},
+        {"action": "remove", "market": "kraken", "pair": "btcusd", "metric": "volume"},
+    ]
+    cursor = FakeMetricTypeCursor()
+    results, valid = validateOperations(cursor, MetadataCache(300), operations)
+    assert [result.get("msg") for result in results] == [
+        None, "Each operation must be an object.", "action must be one of add, remove.", "market and pair must be specified.",
+        "Invalid Metric", "Invalid Metric", "Duplicate of the operation 0.", None]
+    assert [result["index"] for result in results] == list(range(8))
+    assert valid == [(0, "add", ("kraken", "btcusd", 1)), (7, "remove", ("kraken", "btcusd", 2))]
+    # The metric types are read once for the whole payload.
+    assert cursor.queries == 1
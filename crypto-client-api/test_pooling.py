@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from pooling import SIZING_MIN_SAMPLES, PoolMonitor, PoolTimeoutError, percentile
+
+
+class FakeConnection:
+    def cursor(self):
+        return self
+
+
+# Stands in for the pymysqlpool Pool: hands out new connections, or raises its TimeoutError once exhausted.
+class FakePool:
+    def __init__(self, maxSize=10, newConnection=FakeConnection):
+        self.min_size, self.max_size = 1, maxSize
+        self.newConnection = newConnection
+        self.inuse_list, self.unuse_list = [], []
+
+    def get_conn(self):
+        if len(self.inuse_list) >= self.max_size:
+            raise PoolTimeoutError("Waiting for connection timed out")
+        connection = self.unuse_list.pop() if len(self.unuse_list) > 0 else self.newConnection()
+        self.inuse_list.append(connection)
+        return connection
+
+    def release(self, connection):
+        self.inuse_list.remove(connection)
+        self.unuse_list.append(connection)
+
+
+# Checks out concurrent connections at once, then releases them, rounds times.
+def holdConnections(monitor, concurrent, rounds):
+    for i in range(rounds):
+        connections = [monitor.checkout() for j in range(concurrent)]
+        for connection in connections:
+            monitor.release(connection)
+
+
+def test_percentile_is_the_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile(list(reversed(values)), 1) == 1
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) == None
+
+
+def test_no_recommendation_below_the_minimum_samples():
+    monitor = PoolMonitor(FakePool(), 60)
+    holdConnections(monitor, 1, SIZING_MIN_SAMPLES - 1)
+    recommendation = monitor.recommendation()
+    assert recommendation["samples"] == SIZING_MIN_SAMPLES - 1
+    assert recommendation["recommendedMinPoolSize"] == None and recommendation["recommendedMaxPoolSize"] == None
+
+
+def test_recommendation_follows_the_demand():
+    monitor = PoolMonitor(FakePool(), 60)
+    # The checkouts see a demand of 1, 2 and 3 connections in turn.
+    holdConnections(monitor, 3, 50)
+    recommendation = monitor.recommendation()
+    assert recommendation["p50Demand"] == 2 and recommendation["p99Demand"] == 3 and recommendation["peakDemand"] == 3
+    assert recommendation["recommendedMinPoolSize"] == 2
+    # The p99 plus a quarter of headroom, rounded up.
+    assert recommendation["recommendedMaxPoolSize"] == 4
+    assert recommendation["configuredMaxPoolSize"] == 10 and recommendation["inUse"] == 0
+
+
+def test_timeouts_are_counted():
+    monitor = PoolMonitor(FakePool(maxSize=1), 60)
+    connection = monitor.checkout()
+    with pytest.raises(PoolTimeoutError):
+        monitor.checkout()
+    monitor.release(connection)
+    # Releasing twice only gives the connection back once.
+    monitor.release(connection)
+    recommendation = monitor.recommendation()
+    assert recommendation["timeouts"] == 1 and recommendation["waiting"] == 0 and recommendation["checkouts"] == 1
+    assert monitor.pool.unuse_list == [connection]
+
+
+def test_connection_held_too_long_is_reported_once():
+    monitor = PoolMonitor(FakePool(), 0.01)
+    held = monitor.checkout()
+    time.sleep(0.02)
+    for i in range(3):
+        monitor.release(monitor.checkout())
+    assert monitor.recommendation()["leaks"] == 1
+    assert monitor.recommendation()["inUse"] == 1 and monitor.pool.inuse_list == [held]
+
+
+def test_connection_is_released_when_the_block_raises():
+    monitor = PoolMonitor(FakePool(), 60)
+    with pytest.raises(RuntimeError):
+        with monitor.connection() as (db, cursor):
+            raise RuntimeError("query failed")
+    assert monitor.pool.inuse_list == [] and monitor.recommendation()["inUse"] == 0
@@ -0,0 +1,194 @@
+import datetime
+import os
+import re
+from unittest import mock
+
+import pytest
+from flask.testing import FlaskClient
+from pymysqlpool.pool import Pool
+
+from cache import MetadataCache, SeriesCache
+from pooling import PoolMonitor
+from test_pooling import FakePool
+
+os.environ.setdefault("SQL_IP", "localhost")
+os.environ.setdefault("MIN_POOL_SIZE", "0")
+os.environ.setdefault("MAX_POOL_SIZE", "2")
+os.environ["AUTHORIZATION_TOKEN"] = "S3CUR3K3Y"
+# The pool is swapped for a FakePool of two connections below, it must neither connect nor start its resizing thread.
+with mock.patch.object(Pool, "init"):
+    import server
+
+HEADERS = {"Authorization": "S3CUR3K3Y"}
+START = datetime.datetime(2026, 1, 2, 12)
+
+
+def minutes(count):
+    return START + datetime.timedelta(minutes=count)
+
+
+# The crypto schema in memory, answering the queries of server.py and cache.py the way MySQL would.
+class FakeDb:
+    def __init__(self):
+        self.version = 1
+        self.metricTypes = {"price": 1, "volume": 2}
+        self.users = {1}
+        self.pairMetrics = {("kraken", "btcusd", 1): 1, ("kraken", "ethusd", 1): 2}
+        self.tracking = {(1, 1), (1, 2)}
+        self.values = {1: [(minutes(i), 100.0 + i) for i in range(5)], 2: [(minutes(i), 10.0 + i) for i in range(5)]}
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def pairMetricRow(self, key, cpmId):
+        names = {metricTypeId: name for name, metricTypeId in self.metricTypes.items()}
+        return {'id': cpmId, 'market': key[0], 'pair': key[1], 'metricTypeId': key[2], 'metricName': names[key[2]],
+                'rankNum': 1, 'rankDenom': 2, 'rankChangedAt': None}
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        db = self.db
+        if "FROM crypto.CycleVersion" in query:
+            self.result = [{'version': db.version}]
+        elif "LEFT JOIN crypto.MetricRank" in query:
+            self.result = [db.pairMetricRow(key, cpmId) for key, cpmId in sorted(db.pairMetrics.items(), key=lambda item: item[1])
+                           if (int(params[0]), cpmId) in db.tracking]
+        elif "FROM crypto.MetricValue" in query:
+            match = re.search(r"currencyPairMetricId\s+(?:in \(([^)]*)\)|= (\d+))", query)
+            cpmIds = [int(cpmId) for cpmId in (match.group(1) or match.group(2)).split(",") if cpmId.strip()]
+            self.result = [{'queriedAt': queriedAt, 'value': value, 'currencyPairMetricId': cpmId}
+                           for cpmId in sorted(cpmIds) for queriedAt, value in db.values.get(cpmId, [])]
+        elif "FROM crypto.MetricType" in query:
+            self.result = [{'name': name, 'id': metricTypeId, 'deletedAt': None} for name, metricTypeId in db.metricTypes.items()]
+        elif "FROM crypto.User WHERE" in query:
+            self.result = [{'id': params[0]}] if params[0] in db.users else []
+        elif "SELECT id, market, pair, metricTypeId FROM crypto.CurrencyPairMetric" in query:
+            keys = [tuple(params[i:i + 3]) for i in range(0, len(params), 3)]
+            self.result = [db.pairMetricRow(key, db.pairMetrics[key]) for key in keys if key in db.pairMetrics]
+        elif "SELECT DISTINCT cpm.market" in query:
+            keys = [tuple(params[i:i + 3]) for i in range(1, len(params), 3)]
+            self.result = [db.pairMetricRow(key, db.pairMetrics[key]) for key in keys
+                           if key in db.pairMetrics and (params[0], db.pairMetrics[key]) in db.tracking]
+        elif "SET ucpm.deletedAt" in query:
+            keys = [tuple(params[i:i + 3]) for i in range(1, len(params), 3)]
+            ended = [(params[0], db.pairMetrics[key]) for key in keys if key in db.pairMetrics]
+            self.rowcount = len(db.tracking & set(ended))
+            db.tracking -= set(ended)
+
+    def executemany(self, query, rows):
+        for row in rows:
+            if query == server.insertPairMetricQuery:
+                self.db.pairMetrics[tuple(row)] = max(self.db.pairMetrics.values()) + 1
+            elif query == server.insertTrackingQuery:
+                self.db.tracking.add(tuple(row))
+
+    def fetchone(self):
+        return self.result[0] if len(self.result) > 0 else None
+
+    def fetchall(self):
+        return self.result
+
+    def fetchall_unbuffered(self):
+        return iter(self.result)
+
+    def close(self):
+        pass
+
+
+# Every connection of the pool reads and writes the same FakeDb.
+class ConnectionOf:
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDb()
+    monkeypatch.setattr(server, "poolMonitor", PoolMonitor(FakePool(2, lambda: ConnectionOf(db)), 60))
+    monkeypatch.setattr(server, "seriesCache", SeriesCache(100000))
+    monkeypatch.setattr(server, "metadataCache", MetadataCache(300))
+    return db
+
+
+# Reads and closes every response like a WSGI server does, unless buffered=False is passed.
+class BufferedClient(FlaskClient):
+    def open(self, *args, **kwargs):
+        kwargs.setdefault("buffered", True)
+        return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(server.app, "test_client_class", BufferedClient)
+    return server.app.test_client()
+
+
+def test_streamed_responses_release_their_connection_even_when_never_read(client):
+    url = "/graphs-of-tracked-metrics/1?stream=1"
+    for i in range(2):
+        assert client.head(url, headers=HEADERS).status_code == 200
+    response = client.get(url, headers=HEADERS, buffered=False)
+    response.close()
+    assert server.poolMonitor.leases == {}
+    assert client.get("/graphs-of-tracked-metrics/1", headers=HEADERS).status_code == 200
+    assert server.poolMonitor.leases == {}
+
+
+def test_streamed_graph_matches_the_buffered_one(client):
+    streamed = client.get("/graphs-of-tracked-metrics/1?stream=1", headers=HEADERS)
+    buffered = client.get("/graphs-of-tracked-metrics/1", headers=HEADERS)
+    assert streamed.status_code == 200 and streamed.get_json()["successfullyFinished"]
+    assert streamed.get_json()["data"] == buffered.get_json()["data"]
+    assert [row["values"] for row in buffered.get_json()["data"]] == [[100.0 + i for i in range(5)], [10.0 + i for i in range(5)]]
+    assert server.poolMonitor.leases == {}
+
+
+@pytest.mark.parametrize("stream", ["0", "1"])
+def test_graph_answers_304_until_a_new_cycle(client, db, stream):
+    url = f"/graphs-of-tracked-metrics/1?stream={stream}"
+    etag = client.get(url, headers=HEADERS).headers["ETag"]
+    assert client.get(url, headers={**HEADERS, "If-None-Match": etag}).status_code == 304
+    db.version += 1
+    assert client.get(url, headers={**HEADERS, "If-None-Match": etag}).status_code == 200
+    assert server.poolMonitor.leases == {}
+
+
+def test_since_returns_the_values_at_or_after_the_cursor(client):
+    response = client.get(f"/graphs-of-tracked-metrics/1/since?since={minutes(3).isoformat()}", headers=HEADERS)
+    body = response.get_json()
+    assert response.status_code == 200 and body["nextSince"] == minutes(4).isoformat()
+    assert [row["values"] for row in body["data"]] == [[103.0, 104.0], [13.0, 14.0]]
+    assert client.get("/graphs-of-tracked-metrics/1/since?since=yesterday", headers=HEADERS).status_code == 400
+
+
+def test_bulk_applies_the_valid_operations_in_one_go(client, db):
+    operations = [{"market": "kraken", "pair": "ltcusd", "metric": "price"},
+                  {"action": "remove", "market": "kraken", "pair": "ethusd", "metric": "price"},
+                  {"market": "kraken", "pair": "btcusd", "metric": "price"},
+                  {"market": "kraken", "pair": "xrpusd", "metric": "unknown"}]
+    response = client.post("/bulk-tracking-metrics", headers=HEADERS, json={"userId": 1, "operations": operations})
+    body = response.get_json(force=True)
+    assert response.status_code == 200 and body["added"] == 1 and body["removed"] == 1
+    assert [result["code"] for result in body["results"]] == [201, 200, 200, 400]
+    assert db.tracking == {(1, 1), (1, 3)}
+    assert client.post("/bulk-tracking-metrics", headers=HEADERS, json={"userId": 1}).status_code == 400
+    assert server.poolMonitor.leases == {}
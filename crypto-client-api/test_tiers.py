@@ -0,0 +1,36 @@
+import datetime
+
+from tiers import selectTier
+
+NOW = datetime.datetime(2026, 1, 31, 12)
+
+
+def ago(**delta):
+    return NOW - datetime.timedelta(**delta)
+
+
+def test_requested_tier_is_used_as_is():
+    assert selectTier("daily", ago(hours=1), None, 10, NOW, 24) == "daily"
+    assert selectTier("raw", ago(days=30), None, None, NOW, 24) == "raw"
+
+
+def test_range_within_the_lookback_is_read_from_raw():
+    assert selectTier(None, None, None, None, NOW, 24) == "raw"
+    assert selectTier(None, ago(hours=24), None, None, NOW, 24) == "raw"
+    # Even when maxPoints asks for fewer points than there are hours, raw is downsampled instead.
+    assert selectTier(None, None, None, 10, NOW, 24) == "raw"
+    assert selectTier(None, ago(hours=6), None, 1, NOW, 24) == "raw"
+
+
+def test_older_range_is_read_from_the_rollups():
+    assert selectTier(None, ago(hours=25), None, None, NOW, 24) == "hourly"
+    assert selectTier(None, ago(days=30), None, 200, NOW, 24) == "hourly"
+    assert selectTier(None, ago(days=365), None, 200, NOW, 24) == "daily"
+    # The buckets are exactly as long as the range divided by maxPoints.
+    assert selectTier(None, ago(days=30), None, 30, NOW, 24) == "daily"
+    assert selectTier(None, ago(days=30), None, 31, NOW, 24) == "hourly"
+
+
+def test_range_ending_before_now_is_measured_to_its_end():
+    assert selectTier(None, ago(days=365), ago(days=335), 200, NOW, 24) == "hourly"
+    assert selectTier(None, ago(days=30), ago(days=40), 10, NOW, 24) == "hourly"
@@ -0,0 +1,28 @@
+import datetime
+
+# Storage tiers of the values, finest first. raw is MetricValue, only kept for HOURS_LOOKBACK hours by
+# retention.py, hourly and daily are the OHLC/mean/count rollups query-cryptowatch.py maintains as the values
+# land. The graphs of the rollup tiers plot the mean of each bucket, at the start of the bucket.
+TIERS = {
+    "raw": {"table": "MetricValue", "time": "queriedAt", "value": "value", "seconds": 0},
+    "hourly": {"table": "MetricValueHourly", "time": "bucketStart", "value": "mean", "seconds": 3600},
+    "daily": {"table": "MetricValueDaily", "time": "bucketStart", "value": "mean", "seconds": 86400},
+}
+
+
+# Picks the tier of a range. raw only covers the last hoursLookback hours, so a range within it (the range being
+# the raw lookback when from is not given) is always read from raw and downsampled to maxPoints there, whatever
+# its resolution: a rollup tier would only trade its aggregation for bucket means. An older range is read from
+# the coarsest rollup tier whose buckets are no longer than the range divided by maxPoints, hourly without
+# maxPoints. An explicitly requested tier is always used as is.
+def selectTier(requestedTier, fromTime, toTime, maxPoints, now, hoursLookback):
+    if requestedTier != None:
+        return requestedTier
+    rawCutoff = now - datetime.timedelta(hours=hoursLookback)
+    if fromTime == None or fromTime >= rawCutoff:
+        return "raw"
+    if maxPoints == None:
+        return "hourly"
+    end = toTime if toTime != None else now
+    step = max(0, (end - fromTime).total_seconds()) / maxPoints
+    return "daily" if step >= TIERS["daily"]["seconds"] else "hourly"
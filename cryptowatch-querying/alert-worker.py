@@ -0,0 +1,66 @@
+import argparse
+import os
+import time
+import pymysql
+
+from notifications import deliverAlerts, RateLimiter, SendGridTransport, StubTransport
+
+# Delivers the client alerts queued in crypto.AlertOutbox by query-cryptowatch.py, so that a burst of alerts
+# during volatile markets never slows the ingestion cycle down. Runs until stopped, or drains the queue once:
+#   python alert-worker.py
+#   python alert-worker.py --once --stub alerts.jsonl    (writes the requests to a file instead of sending them)
+
+# This section is for running the service locally.
+if os.environ.get("SQL_IP") == None:
+    from dotenv import load_dotenv, find_dotenv
+    load_dotenv(find_dotenv())
+
+SQL_IP=os.environ.get('SQL_IP')
+SQL_USER=os.environ.get('SQL_USER')
+SQL_PASSWORD=os.environ.get('SQL_PASSWORD')
+SQL_SCHEMA=os.environ.get('SQL_SCHEMA')
+
+HOURS_FOR_ALERT=int(os.environ.get('HOURS_FOR_ALERT'))
+FACTOR_METRIC_THRESH_ALERT=int(os.environ.get('FACTOR_METRIC_THRESH_ALERT'))
+
+ALERT_TRANSPORT=os.environ.get('ALERT_TRANSPORT', 'sendgrid')
+ALERT_BATCH_SIZE=int(os.environ.get('ALERT_BATCH_SIZE', 100))
+ALERT_POLL_SECONDS=float(os.environ.get('ALERT_POLL_SECONDS', 5))
+ALERT_MAX_PER_SECOND=float(os.environ.get('ALERT_MAX_PER_SECOND', 5))
+ALERT_COOLDOWN_MINUTES=int(os.environ.get('ALERT_COOLDOWN_MINUTES', 60))
+ALERT_MAX_ATTEMPTS=int(os.environ.get('ALERT_MAX_ATTEMPTS', 5))
+ALERT_STALE_SECONDS=int(os.environ.get('ALERT_STALE_SECONDS', 300))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delivers the queued client alerts.")
+    parser.add_argument("--once", action="store_true", help="Drain the queue once, then exit.")
+    parser.add_argument("--stub", nargs="?", const="", default=None,
+                        help="Use the stub transport, optionally appending the requests to this file.")
+    args = parser.parse_args()
+
+    if args.stub != None or ALERT_TRANSPORT == 'stub':
+        transport = StubTransport(args.stub or None)
+    else:
+        transport = SendGridTransport(os.environ.get('SENDGRID_API_KEY'))
+    limiter = RateLimiter(ALERT_MAX_PER_SECOND)
+    db = pymysql.connect(host=SQL_IP, user=SQL_USER, password=SQL_PASSWORD, db=SQL_SCHEMA, autocommit=True)
+
+    while True:
+        db.ping(reconnect=True)
+        report = deliverAlerts(db, transport, limiter, ALERT_BATCH_SIZE, ALERT_COOLDOWN_MINUTES, ALERT_MAX_ATTEMPTS,
+                               ALERT_STALE_SECONDS, FACTOR_METRIC_THRESH_ALERT, HOURS_FOR_ALERT)
+        if report["claimed"] > 0:
+            print(f"--- Alerts: {report['sent']} sent in {report['requests']} requests, {report['suppressed']} suppressed, "
+                  f"{report['skipped']} skipped, {report['failed']} failed ---")
+        # A full batch means there is probably more waiting.
+        if report["claimed"] < ALERT_BATCH_SIZE:
+            if args.once:
+                break
+            time.sleep(ALERT_POLL_SECONDS)
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import datetime
+import numpy as np
+
+
+# Fixed capacity NumPy ring buffer of (epoch seconds, value) pairs for a single CurrencyPairMetric. It keeps
+# a running sum so the average over the window is O(1), and values fall out of the window as time passes.
+# An entry may also stand for several values, appended as their sum and number (see RollingAlertEngine.fillTotals),
+# count being the number of values in the window and entries the number of slots used.
+class RollingWindow:
+    def __init__(self, capacity):
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.start = 0
+        self.entries = 0
+        self.count = 0
+        self.total = 0.0
+
+    def popOldest(self):
+        self.total -= self.values[self.start]
+        self.count -= int(self.counts[self.start])
+        self.start = (self.start + 1) % len(self.values)
+        self.entries -= 1
+        # Resetting when empty keeps floating point drift of the running sum from building up forever.
+        if self.entries == 0:
+            self.total = 0.0
+
+    # Drops every entry queried at or before the cutoff (epoch seconds).
+    def expire(self, cutoff):
+        while self.entries > 0 and self.times[self.start] <= cutoff:
+            self.popOldest()
+
+    def append(self, when, value, count=1):
+        if self.entries == len(self.values):
+            self.popOldest()
+        index = (self.start + self.entries) % len(self.values)
+        self.times[index] = when
+        self.values[index] = value
+        self.counts[index] = count
+        self.total += value
+        self.entries += 1
+        self.count += count
+
+    def average(self):
+        return float(self.total / self.count) if self.count > 0 else 0
+
+
+# Keeps the last windowSeconds of values of every CurrencyPairMetric in memory so that each new value can
+# be checked against the average of its own metric in O(1), instead of an avg(value) query per metric.
+# expected is the number of values a metric should have in a full window, and acceptableMissing the share
+# of them that can be missing while still trusting the average (same rules as the environment variables).
+class RollingAlertEngine:
+    def __init__(self, windowSeconds, expected, acceptableMissing, factor):
+        self.windowSeconds = windowSeconds
+        self.expected = expected
+        self.acceptableMissing = acceptableMissing
+        self.factor = factor
+        # A bit of headroom so a window with a retried or doubled cycle does not evict values early.
+        self.capacity = max(1, int(expected * 1.1) + 1)
+        self.windows = {}
+
+    # Fills the alerting window of every metric from the (currencyPairMetricId, queriedAt, value) rows of
+    # crypto.MetricValue, ordered by metric then time so each ring buffer is filled oldest to newest. The rows
+    # may reach further back than the window (the poller reads them once for the screening too), those are left
+    # out. now is the naive datetime of the cycle, the same clock used for queriedAt.
+    def fill(self, windowRows, now):
+        cutoff = now - datetime.timedelta(seconds=self.windowSeconds)
+        for row in windowRows:
+            if row[1] > cutoff:
+                self.windowFor(row[0]).append(row[1].timestamp(), float(row[2]))
+
+    # Fills the alerting window of every metric from the (currencyPairMetricId, sum of the values, number of values,
+    # latest queriedAt) rows of crypto.MetricValue grouped by metric over the window, each metric getting a single
+    # entry. Its values can not expire one by one, so this is only for an engine used for a single cycle (the cron
+    # runs), which then reads a row per metric rather than all of the values of the window.
+    def fillTotals(self, totalRows):
+        for cpmId, total, count, lastQueriedAt in totalRows:
+            self.windowFor(cpmId).append(lastQueriedAt.timestamp(), float(total), int(count))
+
+    def windowFor(self, cpmId):
+        if cpmId not in self.windows:
+            self.windows[cpmId] = RollingWindow(self.capacity)
+        return self.windows[cpmId]
+
+    # Checks the new value against the metric's own average over the window, then adds it to the window.
+    # Inputs: currencyPairMetricId, its current value, naive datetime it was queried at
+    # Outputs: boolean if the alert is to be sent, metric's previous average to also include in the alert message
+    def observe(self, cpmId, value, when):
+        window = self.windowFor(cpmId)
+        window.expire(when.timestamp() - self.windowSeconds)
+        toSendAlert, previousAverage = False, 0
+        # Protecting against divide by zero errors in case the environment variables are configured poorly
+        if self.expected > 0 and ((self.expected - window.count) / self.expected) < self.acceptableMissing:
+            average = window.average()
+            if float(value) > self.factor * average:
+                toSendAlert, previousAverage = True, average
+        window.append(when.timestamp(), float(value))
+        return toSendAlert, previousAverage
+
+    # Forgets the metrics that are no longer being tracked so a long-running process does not grow forever.
+    def retain(self, activeIds):
+        for cpmId in set(self.windows.keys()) - set(activeIds):
+            del self.windows[cpmId]
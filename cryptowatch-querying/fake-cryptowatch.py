@@ -0,0 +1,144 @@
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fetcher import createSession, fetchSummaries
+
+
+# A local stand-in for https://api.cryptowat.ch that serves /markets/{market}/{pair}/summary with the same
+# payload shape as the real API, so the poller can be pointed at it (CRYPTOWATCH_URL=http://localhost:8765)
+# and its throughput measured offline. Every market/pair gets its own random walk so repeated calls move.
+# Usage:
+#   python fake-cryptowatch.py --port 8765 --latency 0.25 --jitter 0.1 --error-rate 0.02
+#   python fake-cryptowatch.py --port 8765 --dead-rate 0.05          (a share of the pairs always answer 404)
+#   python fake-cryptowatch.py --benchmark 300 --concurrency 32     (sequential vs concurrent fetch timings)
+# GET /stats returns the number of summaries served per market/pair, ex: to check that sharded pollers fetch
+# every pair exactly once per cycle, and DELETE /stats resets it.
+prices = {}
+hits = {}
+pricesLock = threading.Lock()
+
+
+def buildSummary(market, pair):
+    with pricesLock:
+        opening = prices.setdefault((market, pair), random.uniform(1, 50000))
+        last = prices[(market, pair)] = opening * random.uniform(0.995, 1.005)
+        hits[f"{market}/{pair}"] = hits.get(f"{market}/{pair}", 0) + 1
+    volume = random.uniform(10, 5000)
+    return {
+        "result": {
+            "price": {
+                "last": last,
+                "high": last * random.uniform(1.0, 1.05),
+                "low": last * random.uniform(0.95, 1.0),
+                "change": {
+                    "percentage": random.uniform(-0.05, 0.05),
+                    "absolute": random.uniform(-0.05, 0.05) * last
+                }
+            },
+            "volume": volume,
+            "volumeQuote": volume * last
+        },
+        "allowance": {"cost": 0.005, "remaining": 10, "upgrade": "Running against the local fake Cryptowatch server"}
+    }
+
+
+# latency is the base delay of every answer, plus up to jitter seconds. errorRate of the summaries are answered
+# with a 429 or a 500 instead, which the poller retries. deadRate of the market/pairs (always the same ones) are
+# answered with a 404, like a pair the exchange dropped, which opens their circuit in the poller.
+class SummaryHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    errorRate = 0.0
+    deadRate = 0.0
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["stats"]:
+            with pricesLock:
+                self.respond(200, {"total": sum(hits.values()), "pairs": len(hits), "hits": dict(hits)})
+            return
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if len(parts) != 4 or parts[0] != "markets" or parts[3] != "summary":
+            self.respond(404, {"error": "Route not found"})
+        elif zlib.crc32(f"{parts[1]}/{parts[2]}".encode()) % 10000 < self.deadRate * 10000:
+            self.respond(404, {"error": "Instrument not found"})
+        elif random.random() < self.errorRate:
+            self.respond(random.choice([429, 500]), {"error": "Injected failure"})
+        else:
+            self.respond(200, buildSummary(parts[1], parts[2]))
+
+    def do_DELETE(self):
+        if self.path.strip("/") != "stats":
+            self.respond(404, {"error": "Route not found"})
+            return
+        with pricesLock:
+            hits.clear()
+        self.respond(200, {"total": 0, "pairs": 0, "hits": {}})
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # Keeps the console quiet while the benchmark is hammering the server.
+    def log_message(self, format, *args):
+        pass
+
+
+def startServer(port, latency, jitter=0.0, errorRate=0.0, deadRate=0.0):
+    SummaryHandler.latency = latency
+    SummaryHandler.jitter = jitter
+    SummaryHandler.errorRate = errorRate
+    SummaryHandler.deadRate = deadRate
+    server = ThreadingHTTPServer(("0.0.0.0", port), SummaryHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# Times the same set of market/pairs once with a single worker (the old one-at-a-time loop) and once
+# with the configured concurrency, both through the pooled session used by query-cryptowatch.py.
+def runBenchmark(port, numPairs, concurrency, timeout):
+    baseUrl = f"http://localhost:{port}"
+    marketPairs = [("kraken", f"pair{i}") for i in range(numPairs)]
+    for workers in [1, concurrency]:
+        session = createSession(workers)
+        start = time.time()
+        results = fetchSummaries(session, baseUrl, marketPairs, workers, timeout, 0, 0)
+        failures = sum(1 for data, error in results if error is not None)
+        print(f"--- {numPairs} summaries with concurrency {workers} --- {round(time.time() - start, 4)} seconds --- {failures} failures ---")
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake of the Cryptowatch market summary API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.25, help="Seconds to wait before answering each request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many more seconds of random latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of the summaries answered with a 429 or a 500.")
+    parser.add_argument("--dead-rate", type=float, default=0.0, help="Share of the market/pairs always answered with a 404.")
+    parser.add_argument("--benchmark", type=int, default=0, help="Number of market/pairs to fetch, then exit.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    server = startServer(args.port, args.latency, args.jitter, args.error_rate, args.dead_rate)
+    if args.benchmark > 0:
+        runBenchmark(args.port, args.benchmark, args.concurrency, args.timeout)
+        server.shutdown()
+    else:
+        print(f"Fake Cryptowatch listening on http://localhost:{args.port}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,129 @@
+import random
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from instrumentation import UPSTREAM_LATENCY, UPSTREAM_ERRORS, FETCH_QUEUE_DEPTH
+from upstream import CircuitOpen, BudgetExhausted
+
+
+# Status codes that are worth retrying: the rate limiter and transient server side failures.
+# Any other 4xx means the market/pair itself is bad, so retrying would only burn allowance.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# Whether the error of a fetch will not go away by itself, ex: a 400 or 404 for a pair the exchange dropped.
+def isPermanentError(error):
+    response = getattr(error, "response", None)
+    return response is not None and 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUS_CODES
+
+
+# The allowance reported in the payload of a response, None when it has none (ex: a 429 of a proxy in front of the API).
+def allowanceOf(response):
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    return data.get("allowance") if isinstance(data, dict) else None
+
+
+# Builds one pooled HTTP session to be shared by every fetching thread. The connection pool is sized
+# to the concurrency limit so each thread can keep its keep-alive connection to the API open.
+def createSession(concurrency):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Fetches the summary for a single market/pair, retrying timeouts, connection errors and retryable
+# status codes with exponential backoff (plus a little jitter so the threads do not retry in lockstep).
+# Inputs: the shared session, base url of the API, market, pair, per-request timeout in seconds,
+# number of retries after the first attempt, the base backoff in seconds and the optional AllowanceBudget
+# (see upstream.py) every attempt is paid from.
+# Outputs: the decoded json payload. Raises the last error once the retries are exhausted, and BudgetExhausted
+# when the allowance cannot afford an attempt or a 429 reports it spent.
+def fetchSummary(session, baseUrl, market, pair, timeout, retries, backoff, budget=None):
+    url = f"{baseUrl}/markets/{market}/{pair}/summary"
+    attempt = 0
+    while True:
+        if budget is not None and not budget.acquire():
+            UPSTREAM_ERRORS.labels(market, "budget").inc()
+            raise BudgetExhausted(f"allowance budget exhausted before fetching {pair} on {market}")
+        start = time.time()
+        try:
+            result = session.get(url, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            UPSTREAM_ERRORS.labels(market, "timeout" if isinstance(e, requests.Timeout) else "connection").inc()
+            error = e
+        else:
+            UPSTREAM_LATENCY.labels(market).observe(time.time() - start)
+            if result.status_code >= 400:
+                UPSTREAM_ERRORS.labels(market, str(result.status_code)).inc()
+            if result.status_code == 429 and budget is not None and budget.throttled(allowanceOf(result)):
+                raise BudgetExhausted(f"allowance spent while fetching {pair} on {market}")
+            if result.status_code not in RETRYABLE_STATUS_CODES:
+                result.raise_for_status()
+                data = result.json()
+                if budget is not None:
+                    budget.settle(data.get("allowance"))
+                return data
+            error = requests.HTTPError(f"{result.status_code} returned for {url}", response=result)
+        if attempt >= retries:
+            raise error
+        time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
+        attempt += 1
+
+
+# Groups the active metric rows (cpm.id, pair, market, firstLevel, secondLevel, thirdLevel) by their (market, pair),
+# keeping the order of the query, so every market/pair summary only has to be requested once per cycle.
+# Outputs: dictionary of (market, pair) => list of (currencyPairMetricId, firstLevel, secondLevel, thirdLevel)
+def groupMetricsByPair(currentMetrics):
+    metricsByPair = {}
+    for row in currentMetrics:
+        cpmId, pair, market, firstLevel, secondLevel, thirdLevel = row[0], row[1], row[2], row[3], row[4], row[5]
+        metricsByPair.setdefault((market, pair), []).append((cpmId, firstLevel, secondLevel, thirdLevel))
+    return metricsByPair
+
+
+# Reads the value of one MetricType out of a market summary payload following its firstLevel/secondLevel/thirdLevel path.
+def extractMetricValue(data, firstLevel, secondLevel, thirdLevel):
+    if secondLevel == None:
+        return data["result"][firstLevel]
+    elif thirdLevel == None:
+        return data["result"][firstLevel][secondLevel]
+    return data["result"][firstLevel][secondLevel][thirdLevel]
+
+
+# Fetches the summaries of all of the (market, pair) tuples concurrently through a bounded thread pool.
+# The market/pairs whose circuit is open in the optional CircuitBreakers are not fetched at all, their error
+# is CircuitOpen. Recording the outcomes in the breakers is left to the caller, who also extracts the values.
+# Outputs: a list in the same order as the input of (data, error) tuples, exactly one of which is None,
+# so that a failing market/pair does not stop the rest of the cycle.
+def fetchSummaries(session, baseUrl, marketPairs, concurrency, timeout, retries, backoff, budget=None, breakers=None):
+    def fetchOne(marketPair):
+        market, pair = marketPair
+        try:
+            return fetchSummary(session, baseUrl, market, pair, timeout, retries, backoff, budget), None
+        except Exception as e:
+            return None, e
+        finally:
+            FETCH_QUEUE_DEPTH.dec()
+
+    results, toFetch = [None] * len(marketPairs), []
+    now = time.time()
+    for i, marketPair in enumerate(marketPairs):
+        retryAt = breakers.check(marketPair, now) if breakers is not None else None
+        if retryAt is not None:
+            results[i] = (None, CircuitOpen(retryAt))
+        else:
+            toFetch.append(i)
+    if len(toFetch) == 0:
+        return results
+    FETCH_QUEUE_DEPTH.set(len(toFetch))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(toFetch)))) as executor:
+        for i, result in zip(toFetch, executor.map(fetchOne, [marketPairs[i] for i in toFetch])):
+            results[i] = result
+    return results
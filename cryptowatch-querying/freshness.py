@@ -0,0 +1,46 @@
+# Judges the freshness of the market/pairs for the canary from crypto.PairFreshness, which the heartbeat of every
+# cycle keeps up to date (see heartbeat.py). Kept apart from jobs/canary.py, which reads its configuration when
+# imported, so that it can be tested without a database.
+
+# The latest fetch outcome of the market/pairs attempted within the last day that some user still tracks. A pair
+# nobody tracks anymore is not polled anymore either, and would otherwise look like its worker had stopped.
+pairFreshnessQuery = """
+    SELECT pf.market, pf.pair, pf.workerId, pf.consecutiveFailures, pf.lastError, pf.retryAt,
+    timestampdiff(SECOND, pf.lastAttemptAt, CURRENT_TIMESTAMP), timestampdiff(SECOND, pf.lastSuccessAt, CURRENT_TIMESTAMP),
+    timestampdiff(SECOND, pf.retryAt, CURRENT_TIMESTAMP)
+    FROM crypto.PairFreshness pf
+    WHERE pf.lastAttemptAt >= DATE_SUB(CURRENT_TIMESTAMP, INTERVAL 1 DAY)
+    AND EXISTS (
+        SELECT 1
+        FROM crypto.CurrencyPairMetric cpm
+        JOIN crypto.UserCurrencyPairMetric ucpm on ucpm.currencyPairMetricId = cpm.id
+        WHERE cpm.market = pf.market AND cpm.pair = pf.pair AND ucpm.deletedAt is null
+    )
+    ORDER BY pf.market, pf.pair
+"""
+
+
+# Sorts the rows of pairFreshnessQuery into fresh and stale market/pairs. A pair is stale when it has not been
+# fetched successfully within the gap and either its circuit is open (its probe is not overdue by more than the
+# gap, as the pairs skipped with an open circuit are not attempted), its fetches keep failing, or the worker that
+# last attempted it has not finished a cycle within the gap. A pair its live worker does not attempt anymore was
+# handed over to another shard, and is left out until that one attempts it.
+# Inputs: the rows of pairFreshnessQuery, a dictionary of workerId => seconds since its latest cycle ended, the gap
+# Outputs: the list of the (market, pair, reason) of the stale pairs, and dictionaries of market => number of
+# pairs judged and market => number of fresh pairs
+def classifyPairs(pairRows, workerAges, gap):
+    stalePairs, pairsByMarket, freshByMarket = [], {}, {}
+    for market, pair, workerId, consecutiveFailures, lastError, retryAt, attemptAge, successAge, retryAge in pairRows:
+        if successAge != None and successAge <= gap:
+            pairsByMarket[market] = pairsByMarket.get(market, 0) + 1
+            freshByMarket[market] = freshByMarket.get(market, 0) + 1
+        elif retryAt != None and retryAge <= gap:
+            pairsByMarket[market] = pairsByMarket.get(market, 0) + 1
+            stalePairs.append((market, pair, f"circuit open after {consecutiveFailures} failures, probed again at {retryAt}, last error: {lastError}"))
+        elif attemptAge <= gap:
+            pairsByMarket[market] = pairsByMarket.get(market, 0) + 1
+            stalePairs.append((market, pair, f"{consecutiveFailures} failed fetches in a row, last error: {lastError}"))
+        elif workerAges.get(workerId) == None or workerAges[workerId] > gap:
+            pairsByMarket[market] = pairsByMarket.get(market, 0) + 1
+            stalePairs.append((market, pair, f"not polled for {attemptAge} seconds, its worker {workerId} stopped"))
+    return stalePairs, pairsByMarket, freshByMarket
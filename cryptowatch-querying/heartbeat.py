@@ -0,0 +1,67 @@
+import datetime
+import json
+
+from upstream import BudgetExhausted
+
+# Per-cycle heartbeat of the poller, so that the freshness canary only has to read two small tables instead of
+# scanning MetricValue: crypto.PollerHeartbeat gets one row per cycle of each worker, and crypto.PairFreshness
+# keeps the latest fetch outcome of every market/pair, which catches a single exchange or pair going stale. The
+# retryAt of the market/pairs whose circuit is open (see upstream.py) is kept there too.
+
+heartbeatQuery = """
+    INSERT INTO crypto.PollerHeartbeat (workerId, cycleTime, cycleStart, cycleEnd, metricsExpected, valuesWritten,
+    pairsExpected, pairsFailed, pairsSkipped, failuresByMarket)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+pairSuccessQuery = """
+    INSERT INTO crypto.PairFreshness (market, pair, lastAttemptAt, lastSuccessAt, consecutiveFailures, lastError, retryAt, workerId)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    lastAttemptAt = VALUES(lastAttemptAt), lastSuccessAt = VALUES(lastSuccessAt),
+    consecutiveFailures = 0, lastError = null, retryAt = null, workerId = VALUES(workerId)
+"""
+
+pairFailureQuery = """
+    INSERT INTO crypto.PairFreshness (market, pair, lastAttemptAt, consecutiveFailures, lastError, retryAt, workerId)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    lastAttemptAt = VALUES(lastAttemptAt), consecutiveFailures = consecutiveFailures + VALUES(consecutiveFailures),
+    lastError = VALUES(lastError), retryAt = VALUES(retryAt), workerId = VALUES(workerId)
+"""
+
+
+# Records the outcome of a cycle.
+# Inputs: pymysql connection, the worker's id, the cycle's datetime, its start and end time.time(), the number
+# of metrics it was expected to poll and of values it wrote, the list of (market, pair, error, retryAt) of the
+# market/pairs it fetched, error being None for the successful ones and retryAt None unless their circuit is
+# open, and the number of market/pairs skipped as their circuit was open. The market/pairs that were not
+# fetched as the allowance ran out are recorded as failed, but not as one more failure in a row, as the circuit
+# breakers (loaded back from consecutiveFailures) do not count them either.
+# Outputs: the failures by market.
+def recordHeartbeat(db, workerId, cycleTime, cycleStart, cycleEnd, metricsExpected, valuesWritten, pairResults, pairsSkipped, chunkSize):
+    failuresByMarket = {}
+    for market, pair, error, retryAt in pairResults:
+        if error is not None:
+            failuresByMarket[market] = failuresByMarket.get(market, 0) + 1
+    # The constant columns are parameters too, so that executemany can still batch them into multi-row inserts.
+    successes = [(market, pair, cycleTime, cycleTime, 0, None, None, workerId)
+                 for market, pair, error, retryAt in pairResults if error is None]
+    failures = [(market, pair, cycleTime, 0 if isinstance(error, BudgetExhausted) else 1, str(error)[:1000], retryAt, workerId)
+                for market, pair, error, retryAt in pairResults if error is not None]
+    cursor = db.cursor()
+    try:
+        db.begin()
+        cursor.execute(heartbeatQuery, (workerId, cycleTime, datetime.datetime.fromtimestamp(int(cycleStart)),
+                                        datetime.datetime.fromtimestamp(int(cycleEnd)), metricsExpected, valuesWritten,
+                                        len(pairResults), len(failures), pairsSkipped, json.dumps(failuresByMarket)))
+        for rows, query in [(successes, pairSuccessQuery), (failures, pairFailureQuery)]:
+            for i in range(0, len(rows), chunkSize):
+                cursor.executemany(query, rows[i:i + chunkSize])
+        db.commit()
+    except:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return failuresByMarket
@@ -0,0 +1,87 @@
+import datetime
+
+insertionQuery = """
+    INSERT INTO crypto.MetricValue (currencyPairMetricId, value, queriedAt)
+    VALUES (%s, %s, %s)
+"""
+
+quarantineQuery = """
+    INSERT INTO crypto.MetricValueQuarantine (currencyPairMetricId, value, median, mad, reason, queriedAt)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+# Folds one new value into the rollup bucket of its metric: the first value of a bucket creates it, the next
+# ones update it. The cycles land in time order, so the open stays and the close is the newest value. The mean
+# is updated before the count since MySQL applies the assignments left to right.
+rollupQuery = """
+    INSERT INTO crypto.{table} (currencyPairMetricId, bucketStart, open, high, low, close, mean, count)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    high = GREATEST(high, VALUES(high)),
+    low = LEAST(low, VALUES(low)),
+    close = VALUES(close),
+    mean = (mean * count + VALUES(mean)) / (count + 1),
+    count = count + 1
+"""
+
+# The rollup tiers maintained as the values land, with the start of the bucket a queriedAt falls in.
+ROLLUP_TIERS = [
+    ("MetricValueHourly", lambda queriedAt: queriedAt.replace(minute=0, second=0, microsecond=0)),
+    ("MetricValueDaily", lambda queriedAt: datetime.datetime.combine(queriedAt.date(), datetime.time())),
+]
+
+
+# Writes a whole cycle's worth of values in a single transaction. pymysql rewrites executemany on an
+# INSERT ... VALUES statement into multi-row inserts, and chunkSize bounds how many rows go in each one.
+# Every row is stamped with the same cycle timestamp so the values of a cycle line up on the graphs. The hourly
+# and daily rollups of the values are updated in the same transaction, so they never miss or double count one,
+# and so are the values the screening stage quarantined.
+# Inputs: pymysql connection, list of (currencyPairMetricId, value), the cycle's datetime, rows per statement,
+# list of the quarantined (currencyPairMetricId, value, median, mad, reason)
+# Outputs: the number of rows written to MetricValue. Rolls back and re-raises if any chunk fails.
+def insertMetricValues(db, cycleValues, queriedAt, chunkSize, quarantined=()):
+    rows = [(cpmId, value, queriedAt) for cpmId, value in cycleValues]
+    quarantineRows = [(cpmId, value, median, mad, reason, queriedAt) for cpmId, value, median, mad, reason in quarantined]
+    if len(rows) == 0 and len(quarantineRows) == 0:
+        return 0
+    cursor = db.cursor()
+    try:
+        db.begin()
+        for i in range(0, len(rows), chunkSize):
+            cursor.executemany(insertionQuery, rows[i:i + chunkSize])
+        for table, bucketStart in ROLLUP_TIERS:
+            rollupRows = [(cpmId, bucketStart(queriedAt), value, value, value, value, value, 1) for cpmId, value in cycleValues]
+            for i in range(0, len(rollupRows), chunkSize):
+                cursor.executemany(rollupQuery.format(table=table), rollupRows[i:i + chunkSize])
+        for i in range(0, len(quarantineRows), chunkSize):
+            cursor.executemany(quarantineQuery, quarantineRows[i:i + chunkSize])
+        db.commit()
+    except:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+# Marks that a cycle's values and ranks are all written. The REST API drops its series cache whenever it sees
+# a new version, and uses it in the ETag of the graph responses.
+def bumpCycleVersion(db):
+    cursor = db.cursor()
+    cursor.execute("UPDATE crypto.CycleVersion SET version = version + 1, updatedAt = now() WHERE id = 1")
+    cursor.close()
+
+
+# Runs a SELECT restricted to some metrics, chunkSize of them at a time so the IN list of a single statement stays
+# bounded. query holds a {cpmIds} placeholder for that list, after the params. A query ordered by
+# currencyPairMetricId stays ordered across the chunks, the ids being sorted first.
+# Inputs: pymysql cursor, the query, tuple of its other params, iterable of currencyPairMetricId, ids per statement
+# Outputs: list of the rows of every chunk
+def selectForMetrics(cursor, query, params, cpmIds, chunkSize):
+    cpmIds = sorted(cpmIds)
+    rows = []
+    for i in range(0, len(cpmIds), chunkSize):
+        chunk = cpmIds[i:i + chunkSize]
+        cursor.execute(query.format(cpmIds=", ".join(["%s"] * len(chunk))), tuple(params) + tuple(chunk))
+        rows.extend(cursor.fetchall())
+    return rows
@@ -0,0 +1,49 @@
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server, write_to_textfile, push_to_gateway
+
+# Prometheus metrics of the polling pipeline. The daemon serves them over HTTP on METRICS_PORT, a cron run
+# writes them once it is done to METRICS_TEXTFILE (for the node exporter textfile collector) and/or pushes
+# them to PUSHGATEWAY_URL, see exportMetrics.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CYCLE_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120)
+
+UPSTREAM_LATENCY = Histogram("poller_upstream_request_seconds", "Latency of the Cryptowatch summary requests.",
+                             ["market"], buckets=LATENCY_BUCKETS)
+UPSTREAM_ERRORS = Counter("poller_upstream_errors_total", "Failed Cryptowatch summary requests, by reason "
+                          "(timeout, connection or the status code).", ["market", "reason"])
+FETCH_QUEUE_DEPTH = Gauge("poller_fetch_queue_depth", "Summaries of the current cycle still waiting to be fetched.")
+EXTRACTION_SECONDS = Histogram("poller_extraction_seconds", "Time to extract the values of a summary.",
+                               ["market"], buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1))
+DB_WRITE_SECONDS = Histogram("poller_db_write_seconds", "Time spent writing to MySQL per stage of the cycle.",
+                             ["stage"], buckets=LATENCY_BUCKETS)
+CYCLE_SECONDS = Histogram("poller_cycle_seconds", "Duration of the whole cycle.", buckets=CYCLE_BUCKETS)
+CYCLE_BUDGET_RATIO = Gauge("poller_cycle_budget_ratio", "Duration of the last cycle over the cadence period, "
+                           "the cycles are overrunning above 1.")
+LAST_CYCLE_TIMESTAMP = Gauge("poller_last_cycle_timestamp_seconds", "When the last cycle finished.")
+UPSTREAM_ALLOWANCE_REMAINING = Gauge("poller_upstream_allowance_remaining", "Cryptowatch credits left on the account, "
+                                     "as last reported by the API.")
+UPSTREAM_CREDITS_SPENT = Counter("poller_upstream_credits_spent_total", "Cryptowatch credits spent, as reported by the API.")
+CIRCUITS_OPEN = Gauge("poller_circuits_open", "Market/pairs not fetched until they are probed again, see upstream.py.")
+PAIRS_SKIPPED = Counter("poller_pairs_skipped_total", "Market/pairs not fetched in a cycle, by reason (circuit or budget).",
+                        ["reason"])
+EXTRACTION_ERRORS = Counter("poller_extraction_errors_total", "Metric values missing from their summary payload.", ["market"])
+SCREENING_SECONDS = Histogram("poller_screening_seconds", "Time to screen the values of a cycle, see screening.py.",
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+VALUES_QUARANTINED = Counter("poller_values_quarantined_total", "Values held back by the screening, by reason (invalid or outlier).",
+                             ["reason"])
+VALUES_WRITTEN = Counter("poller_values_written_total", "MetricValues written.")
+ALERTS_QUEUED = Counter("poller_alerts_queued_total", "Client alerts queued for alert-worker.py.")
+
+
+def serveMetrics(port):
+    if port > 0:
+        start_http_server(port)
+        print(f"--- Serving the metrics on http://0.0.0.0:{port}/metrics ---")
+
+
+# Exports the metrics of a single run, as the process will not be around to be scraped.
+def exportMetrics(textfilePath, pushgatewayUrl, job):
+    if textfilePath:
+        write_to_textfile(textfilePath, REGISTRY)
+    if pushgatewayUrl:
+        push_to_gateway(pushgatewayUrl, job=job, registry=REGISTRY)
@@ -0,0 +1,4 @@
+# The entry points of the scheduled jobs, importable without running them: query-cryptowatch.py runs
+# jobs.poller and canary.py runs jobs.canary. They only import what every run needs, the dependencies of the
+# rare paths (ex: sendgrid, see mail.py) are imported when first used, so that a cron run does not pay for them
+# on every cycle.
@@ -0,0 +1,119 @@
+import pymysql
+import time
+import json
+import os
+from jobs.mail import sendEmail
+from freshness import pairFreshnessQuery, classifyPairs
+
+
+start_time = time.time()
+
+# This section is for running the service locally.
+if os.environ.get("SQL_IP") == None:
+    from dotenv import load_dotenv, find_dotenv
+    load_dotenv(find_dotenv())
+
+# This loads the configuration needed to beginning the pool for the mySQL database
+SQL_IP=os.environ.get('SQL_IP')
+SQL_USER=os.environ.get('SQL_USER')
+SQL_PASSWORD=os.environ.get('SQL_PASSWORD')
+SQL_SCHEMA=os.environ.get('SQL_SCHEMA')
+
+BACKEND_EMAIL=os.environ.get('BACKEND_EMAIL')
+CADENCE_PER_MINUTE=int(os.environ.get('CADENCE_PER_MINUTE'))
+THRESHOLD=int(os.environ.get('FACTOR_DATA_FRESHNESS_THRESHOLD'))
+
+
+# Sends the notice to the Backend engineer responsible for timeouts and performance improvements
+def sendBackendDataPipelineAlert(secondsElapsed, gap):
+    subject = "ERROR: Data Failing Freshness Probe"
+    message =   f"""Hello,
+
+                    Our query shows that the latest cycle of the poller ended {secondsElapsed} seconds ago, and this is above the
+                    threshold by {round((secondsElapsed - gap)/gap, 2)}%. Please review and fix.
+
+                    Best,
+                    CryptoDataBot"""
+    sendEmail(subject, message, BACKEND_EMAIL)
+
+
+# Sends the notice for a partial outage: the poller is running, but some market/pairs are not getting fresh values.
+def sendStalePairsAlert(stalePairs, staleMarkets, gap):
+    subject = "ERROR: Market/Pairs Failing Freshness Probe"
+    pairLines = "\n".join(f"                    {market} {pair}: {reason}" for market, pair, reason in stalePairs)
+    message =   f"""Hello,
+
+                    {len(stalePairs)} market/pairs have not been fetched successfully for more than {gap} seconds.
+                    Markets with none of their pairs fresh: {', '.join(staleMarkets) if len(staleMarkets) > 0 else 'none'}.
+
+{pairLines}
+
+                    Please review and fix.
+
+                    Best,
+                    CryptoDataBot"""
+    sendEmail(subject, message, BACKEND_EMAIL)
+
+
+# Reads the freshness from the heartbeat tables the poller writes every cycle (see heartbeat.py) rather than
+# from MetricValue, so the probe stays cheap however big that table gets. It alerts when no worker finished a
+# cycle within the gap while metrics have been tracked for longer than it, and when some market/pairs are stale
+# while the poller runs: their fetches keep failing, their circuit is open (see upstream.py), or the worker that
+# polled them stopped and nobody took them over (see freshness.py). The pairs nobody tracks anymore are left out.
+def main():
+    db = pymysql.connect(SQL_IP,SQL_USER,SQL_PASSWORD,SQL_SCHEMA, autocommit = True)
+    cursor = db.cursor()
+    print("Database Initialized")
+    gap = THRESHOLD * 60 / CADENCE_PER_MINUTE
+
+    getWorkersQuery = """
+        SELECT workerId, timestampdiff(SECOND, MAX(cycleEnd), CURRENT_TIMESTAMP)
+        FROM crypto.PollerHeartbeat
+        WHERE cycleEnd >= DATE_SUB(CURRENT_TIMESTAMP, INTERVAL 1 DAY)
+        GROUP BY workerId
+    """
+    cursor.execute(getWorkersQuery)
+    workerAges = dict(cursor.fetchall())
+    cursor.execute("""
+        SELECT workerId, metricsExpected, valuesWritten, pairsExpected, pairsFailed, pairsSkipped, failuresByMarket
+        FROM crypto.PollerHeartbeat
+        WHERE cycleEnd >= DATE_SUB(CURRENT_TIMESTAMP, INTERVAL %s SECOND)
+        ORDER BY cycleEnd DESC
+    """, (gap,))
+    latestCycles = {}
+    for workerId, metricsExpected, valuesWritten, pairsExpected, pairsFailed, pairsSkipped, failuresByMarket in cursor.fetchall():
+        if workerId not in latestCycles:
+            latestCycles[workerId] = (metricsExpected, valuesWritten, pairsExpected, pairsFailed, pairsSkipped, json.loads(failuresByMarket))
+    for workerId, (metricsExpected, valuesWritten, pairsExpected, pairsFailed, pairsSkipped, failuresByMarket) in latestCycles.items():
+        print(f"--- {workerId}: wrote {valuesWritten} / {metricsExpected} Values, {pairsFailed} / {pairsExpected} Summaries failed {failuresByMarket}, "
+              f"{pairsSkipped} skipped with an open circuit ---")
+
+    # 60 Seconds in a minute times the threshold which is how many periods we NEED to have always.
+    latestAge = min(workerAges.values()) if len(workerAges) > 0 else None
+    if latestAge == None or latestAge > gap:
+        # Nobody tracking a metric for longer than the gap, there is nothing the poller should have written.
+        checkMetricsBeingTracked = """
+            SELECT count(*)
+            FROM crypto.UserCurrencyPairMetric WHERE deletedAt is null
+            AND createdAt < DATE_SUB(CURRENT_TIMESTAMP, INTERVAL %s SECOND)
+        """
+        cursor.execute(checkMetricsBeingTracked, (gap,))
+        countMetrics = cursor.fetchone()[0]
+        print(f"--- No cycle within {gap} seconds, {countMetrics} Metrics Tracked ---")
+        if countMetrics > 0:
+            sendBackendDataPipelineAlert(latestAge if latestAge != None else 86400, gap)
+    else:
+        cursor.execute(pairFreshnessQuery)
+        stalePairs, pairsByMarket, freshByMarket = classifyPairs(cursor.fetchall(), workerAges, gap)
+        for market, pairs in pairsByMarket.items():
+            print(f"--- {market}: {freshByMarket.get(market, 0)} / {pairs} Pairs Fresh ---")
+        if len(stalePairs) > 0:
+            staleMarkets = [market for market in pairsByMarket.keys() if freshByMarket.get(market, 0) == 0]
+            sendStalePairsAlert(stalePairs, staleMarkets, gap)
+
+    db.close()
+    print(f"--- Closed DB, Done --- {round(time.time() - start_time, 4)} seconds ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+
+
+# Thanks to https://github.com/sendgrid/sendgrid-python , this is a very easy way to send
+# an email via Python. sendgrid is imported on the first email rather than when the job starts, as most runs
+# never send one.
+def sendEmail(subject, body, recipient):
+    import sendgrid
+    from sendgrid.helpers.mail import Email, To, Content, Mail
+    sg = sendgrid.SendGridAPIClient(api_key=os.environ.get('SENDGRID_API_KEY'))
+    from_email = Email("bot@crypto-data-tracker.com")
+    to_email = To(recipient)
+    content = Content("text/plain", body)
+    mail = Mail(from_email, to_email, subject, content)
+    response = sg.client.mail.send.post(request_body=mail.get())
+    print(response.status_code)
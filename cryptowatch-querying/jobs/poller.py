@@ -0,0 +1,422 @@
+import pymysql
+import time
+import datetime
+import os
+import sys
+from jobs.mail import sendEmail
+from fetcher import createSession, fetchSummaries, isPermanentError, groupMetricsByPair, extractMetricValue
+from upstream import AllowanceBudget, CircuitBreakers, CircuitOpen, BudgetExhausted
+from ingestion import insertMetricValues, bumpCycleVersion, selectForMetrics
+from heartbeat import recordHeartbeat
+# numpy (alerting, screening) and prometheus_client (instrumentation) are used by every cycle, cron runs included,
+# so importing them lazily would not save a run anything.
+from alerting import RollingAlertEngine
+from screening import RobustScreen
+from ranking import refreshMetricRanks
+from partitions import ensureHourlyPartitions
+from scheduler import CadenceScheduler, currentBoundary
+from instrumentation import (EXTRACTION_SECONDS, DB_WRITE_SECONDS, CYCLE_SECONDS, CYCLE_BUDGET_RATIO, LAST_CYCLE_TIMESTAMP,
+                             VALUES_WRITTEN, ALERTS_QUEUED, PAIRS_SKIPPED, EXTRACTION_ERRORS, SCREENING_SECONDS, VALUES_QUARANTINED,
+                             serveMetrics, exportMetrics)
+from notifications import enqueueAlerts
+from sharding import StaticShards, LeaseShards, metricsForWorker, defaultWorkerId
+
+start_time = time.time()
+
+# This section is for running the service locally.
+if os.environ.get("SQL_IP") == None:
+    from dotenv import load_dotenv, find_dotenv
+    load_dotenv(find_dotenv())
+
+# This loads the configuration needed to beginning the pool for the mySQL database
+SQL_IP=os.environ.get('SQL_IP')
+SQL_USER=os.environ.get('SQL_USER')
+SQL_PASSWORD=os.environ.get('SQL_PASSWORD')
+SQL_SCHEMA=os.environ.get('SQL_SCHEMA')
+
+CADENCE_PER_MINUTE=int(os.environ.get('CADENCE_PER_MINUTE'))
+HOURS_LOOKBACK=int(os.environ.get('HOURS_LOOKBACK'))
+HOURS_FOR_ALERT=int(os.environ.get('HOURS_FOR_ALERT'))
+
+ACCEPTABLE_THRESH_MISSING_ALERT=float(os.environ.get('ACCEPTABLE_THRESH_MISSING_ALERT'))
+FACTOR_METRIC_THRESH_ALERT=int(os.environ.get('FACTOR_METRIC_THRESH_ALERT'))
+
+BACKEND_THRESHOLD=float(os.environ.get('BACKEND_THRESHOLD'))
+BACKEND_EMAIL=os.environ.get('BACKEND_EMAIL')
+
+# Configuration of the concurrent fetch stage, CRYPTOWATCH_URL can point to fake-cryptowatch.py for offline runs.
+CRYPTOWATCH_URL=os.environ.get('CRYPTOWATCH_URL', 'https://api.cryptowat.ch')
+FETCH_CONCURRENCY=int(os.environ.get('FETCH_CONCURRENCY', 16))
+FETCH_TIMEOUT=float(os.environ.get('FETCH_TIMEOUT', 10))
+FETCH_RETRIES=int(os.environ.get('FETCH_RETRIES', 2))
+FETCH_BACKOFF=float(os.environ.get('FETCH_BACKOFF', 0.5))
+
+# Budget of the Cryptowatch credit allowance and circuit breakers of the market/pairs, see upstream.py.
+# UPSTREAM_CREDITS 0 only follows the remaining allowance reported by the API.
+UPSTREAM_CREDITS=float(os.environ.get('UPSTREAM_CREDITS', 0))
+UPSTREAM_CREDIT_PERIOD=float(os.environ.get('UPSTREAM_CREDIT_PERIOD', 86400))
+UPSTREAM_REQUEST_COST=float(os.environ.get('UPSTREAM_REQUEST_COST', 0.005))
+UPSTREAM_EXHAUSTED_PAUSE=float(os.environ.get('UPSTREAM_EXHAUSTED_PAUSE', 60))
+BREAKER_FAILURES=int(os.environ.get('BREAKER_FAILURES', 3))
+BREAKER_BASE_SECONDS=float(os.environ.get('BREAKER_BASE_SECONDS', 300))
+BREAKER_MAX_SECONDS=float(os.environ.get('BREAKER_MAX_SECONDS', 3600))
+
+# Screening of the values against the recent values of their metric before they are written, see screening.py.
+# SCREEN_WINDOW values per metric, screened once they have SCREEN_MIN_SAMPLES of them, and quarantined when they are
+# more than SCREEN_MAD_THRESHOLD robust standard deviations and a factor of SCREEN_FACTOR away from its median, the
+# robust standard deviation being at least SCREEN_RELATIVE_FLOOR times the median.
+SCREEN_WINDOW=int(os.environ.get('SCREEN_WINDOW', 60))
+SCREEN_MIN_SAMPLES=int(os.environ.get('SCREEN_MIN_SAMPLES', 10))
+SCREEN_MAD_THRESHOLD=float(os.environ.get('SCREEN_MAD_THRESHOLD', 10))
+SCREEN_FACTOR=float(os.environ.get('SCREEN_FACTOR', 50))
+SCREEN_RESET_AFTER=int(os.environ.get('SCREEN_RESET_AFTER', 10))
+SCREEN_RELATIVE_FLOOR=float(os.environ.get('SCREEN_RELATIVE_FLOOR', 0.001))
+
+# Maximum number of MetricValue rows written by a single multi-row insert.
+INSERT_CHUNK_SIZE=int(os.environ.get('INSERT_CHUNK_SIZE', 1000))
+
+# Maximum number of metrics whose alerting and screening windows are read by a single query.
+WINDOW_CHUNK_SIZE=int(os.environ.get('WINDOW_CHUNK_SIZE', 1000))
+
+# How many hourly MetricValue partitions are kept ready ahead of the current hour (when the table is partitioned).
+PARTITION_HOURS_AHEAD=int(os.environ.get('PARTITION_HOURS_AHEAD', 6))
+
+# Daemon mode: what to do with the cycles missed when one runs past the next boundary, skip or catchup.
+SCHEDULER_OVERRUN_POLICY=os.environ.get('SCHEDULER_OVERRUN_POLICY', 'skip')
+SCHEDULER_MAX_CATCHUP=int(os.environ.get('SCHEDULER_MAX_CATCHUP', 3))
+
+# Sharding of the market/pairs between several workers, see sharding.py. static splits them in WORKER_SHARD_COUNT
+# fixed shards (the default of a single shard is one worker polling everything), lease (daemon mode only) splits
+# them between the workers holding a live lease in crypto.PollerLease. A static worker is shard-<index> unless
+# WORKER_ID says otherwise, so that the cron runs of a shard share the id the canary judges its pairs by.
+SHARD_MODE=os.environ.get('SHARD_MODE', 'static')
+WORKER_SHARD_INDEX=int(os.environ.get('WORKER_SHARD_INDEX', 0))
+WORKER_SHARD_COUNT=int(os.environ.get('WORKER_SHARD_COUNT', 1))
+WORKER_ID=os.environ.get('WORKER_ID') or (defaultWorkerId() if SHARD_MODE == 'lease' else f"shard-{WORKER_SHARD_INDEX}")
+LEASE_TTL=float(os.environ.get('LEASE_TTL', 60 / CADENCE_PER_MINUTE / 2))
+
+# Where the Prometheus metrics go (see instrumentation.py): served on METRICS_PORT by the daemon, written to
+# METRICS_TEXTFILE and/or pushed to PUSHGATEWAY_URL at the end of a cron run.
+METRICS_PORT=int(os.environ.get('METRICS_PORT', 9100))
+METRICS_TEXTFILE=os.environ.get('METRICS_TEXTFILE')
+PUSHGATEWAY_URL=os.environ.get('PUSHGATEWAY_URL')
+
+allowanceBudget = AllowanceBudget(UPSTREAM_CREDITS, UPSTREAM_CREDIT_PERIOD, UPSTREAM_REQUEST_COST, UPSTREAM_EXHAUSTED_PAUSE)
+circuitBreakers = CircuitBreakers(BREAKER_FAILURES, BREAKER_BASE_SECONDS, BREAKER_MAX_SECONDS)
+
+
+# Sends the notice to the Backend engineer responsible for timeouts and performance improvements
+def sendBackendTimeAlert(secondsElapsed, threshold):
+    subject = "Notice: script query-cryptowatch nearing threshold"
+    message =   f"""Hello,
+                    query-cryptowatch.py took {secondsElapsed} seconds to run, which is above the configured threshold:
+                    {round(threshold * 100,2)}% of the cadence time. If you are comfortable with this, feel free to ignore it or disable
+                    the check.
+
+                    Best,
+                    CryptoDataBot"""
+    sendEmail(subject, message, BACKEND_EMAIL)
+
+
+# Opens the connection to the mySQL database.
+def connectToMySQL():
+    db = pymysql.connect(SQL_IP,SQL_USER,SQL_PASSWORD,SQL_SCHEMA, autocommit = True)
+    print("Database Initialized")
+    return db
+
+
+# Gets all of the active metrics from the database that need to be tracked.
+def getActiveMetrics(cursor):
+    getActiveMetricsQuery = """
+        SELECT cpm.id, cpm.pair, cpm.market,
+        mt.firstLevel, mt.secondLevel, mt.thirdLevel
+        FROM crypto.CurrencyPairMetric cpm
+        JOIN crypto.MetricType mt on cpm.metricTypeId = mt.id
+        WHERE cpm.id IN
+        (
+        SELECT DISTINCT ucpm.currencyPairMetricId
+        FROM UserCurrencyPairMetric ucpm
+        WHERE ucpm.deletedAt is null
+        )
+        """
+    cursor.execute(getActiveMetricsQuery)
+    return cursor.fetchall()
+
+
+# Cheap fingerprint of UserCurrencyPairMetric: it changes whenever a metric starts or stops being tracked,
+# so a long-running poller only reloads the active metrics when there is something new.
+def getActiveMetricsSignature(cursor):
+    cursor.execute("""
+        SELECT COUNT(*), COALESCE(MAX(id), 0), COUNT(deletedAt), MAX(deletedAt)
+        FROM crypto.UserCurrencyPairMetric
+    """)
+    return tuple(cursor.fetchone())
+
+
+# Builds the alert engine and the screening stage, and loads their windows of the worker's metrics (cpmIds), reading
+# WINDOW_CHUNK_SIZE metrics per query. The screening reads the values of the last SCREEN_WINDOW cycles. The engine
+# of a cron run is only used for a single cycle, and reads the sum and number of the values of each metric over the
+# alerting window instead of the values themselves. A persistent engine (POLLER_MODE=daemon) expires the values of
+# its windows one by one as the cycles go, and reads the values of the longer of the two windows in one go.
+# Every new value is then screened and checked against the average of its own metric in memory. These environment
+# variables are to be configured by the engineers reponsible for upkeep of meeting product use cases for these
+# alerts. 60 Minutes in an Hour, based on the environment variables setup in basis of CADENCE_PER_MINUTE and
+# HOURS_FOR_ALERT.
+def loadWindows(cursor, cycleTime, cpmIds, persistent):
+    alertEngine = RollingAlertEngine(HOURS_FOR_ALERT * 3600, 60 * CADENCE_PER_MINUTE * HOURS_FOR_ALERT,
+                                     ACCEPTABLE_THRESH_MISSING_ALERT, FACTOR_METRIC_THRESH_ALERT)
+    screen = RobustScreen(SCREEN_WINDOW, SCREEN_MIN_SAMPLES, SCREEN_MAD_THRESHOLD, SCREEN_FACTOR, SCREEN_RESET_AFTER, SCREEN_RELATIVE_FLOOR)
+    screenSeconds = SCREEN_WINDOW * 60 / CADENCE_PER_MINUTE
+    alertCutoff = cycleTime - datetime.timedelta(seconds=alertEngine.windowSeconds)
+    windowQuery = """
+        SELECT currencyPairMetricId, queriedAt, value FROM crypto.MetricValue
+        WHERE queriedAt > %s AND currencyPairMetricId in ({cpmIds})
+        ORDER BY currencyPairMetricId, queriedAt
+    """
+    rowsCutoff = cycleTime - datetime.timedelta(seconds=screenSeconds)
+    if persistent:
+        rowsCutoff = min(rowsCutoff, alertCutoff)
+    windowRows = selectForMetrics(cursor, windowQuery, (rowsCutoff,), cpmIds, WINDOW_CHUNK_SIZE)
+    if persistent:
+        alertEngine.fill(windowRows, cycleTime)
+    else:
+        totalsQuery = """
+            SELECT currencyPairMetricId, SUM(value), COUNT(*), MAX(queriedAt) FROM crypto.MetricValue
+            WHERE queriedAt > %s AND currencyPairMetricId in ({cpmIds})
+            GROUP BY currencyPairMetricId
+        """
+        alertEngine.fillTotals(selectForMetrics(cursor, totalsQuery, (alertCutoff,), cpmIds, WINDOW_CHUNK_SIZE))
+    screen.load(cursor, cycleTime, screenSeconds, windowRows, cpmIds, WINDOW_CHUNK_SIZE)
+    return alertEngine, screen
+
+
+def createShards():
+    if SHARD_MODE == 'lease':
+        return LeaseShards(connectToMySQL, WORKER_ID, LEASE_TTL)
+    return StaticShards(WORKER_SHARD_INDEX, WORKER_SHARD_COUNT)
+
+
+# Runs one cycle for the given active metrics: fetches their summaries, screens their values, checks the alerts,
+# writes the values, the ranks and the cycle's heartbeat, and sends the alerts. cycleStart is the time.time() the cycle's duration
+# is measured from.
+# When the market/pairs are sharded, only the leader (the first worker of the cycle) does the table wide upkeep.
+def runCycle(db, session, alertEngine, screen, currentMetrics, cycleTime, cycleStart, leader=True):
+    # Makes sure the hourly partition this cycle writes to exists. A failure here only means the values land
+    # in the catch-all partition, so it should not stop the cycle.
+    if leader:
+        try:
+            with DB_WRITE_SECONDS.labels("partitions").time():
+                ensureHourlyPartitions(db, cycleTime, PARTITION_HOURS_AHEAD)
+        except Exception as e:
+            print(f"Error while creating the MetricValue partitions: {e}")
+
+    alertingData = []
+    cycleValues = []
+    pairResults = []
+    pairsSkipped = 0
+
+    # A single summary payload holds every metric type of its market/pair, so it is fetched once per distinct
+    # (market, pair) and fanned out to all of the metrics tracked on it. The summaries are fetched concurrently
+    # through a bounded thread pool over one pooled session, with per-request timeouts and retries, paid from the
+    # allowance budget. The market/pairs whose circuit is open are not requested at all.
+    metricsByPair = groupMetricsByPair(currentMetrics)
+    summaries = fetchSummaries(session, CRYPTOWATCH_URL, list(metricsByPair.keys()), FETCH_CONCURRENCY, FETCH_TIMEOUT,
+                               FETCH_RETRIES, FETCH_BACKOFF, allowanceBudget, circuitBreakers)
+    print(f"--- Fetched {len(summaries)} Summaries for {len(currentMetrics)} Metrics --- {round(time.time() - cycleStart, 4)} seconds ---")
+
+    # Every market/pair is handled on its own: a failed fetch or a payload missing some of its values only loses
+    # the values of that market/pair, and counts towards opening its circuit.
+    for (market, pair), (data, error) in zip(metricsByPair.keys(), summaries):
+        start_time_run_i = time.time()
+        if isinstance(error, CircuitOpen):
+            pairsSkipped += 1
+            PAIRS_SKIPPED.labels("circuit").inc()
+            continue
+        if isinstance(error, BudgetExhausted):
+            PAIRS_SKIPPED.labels("budget").inc()
+
+        valuesExtracted = 0
+        if error is None:
+            for cpmId, firstLevel, secondLevel, thirdLevel in metricsByPair[(market, pair)]:
+                # The shape of the payload changed, or this market/pair does not report this value.
+                try:
+                    value = extractMetricValue(data, firstLevel, secondLevel, thirdLevel)
+                except (KeyError, TypeError, IndexError) as e:
+                    EXTRACTION_ERRORS.labels(market).inc()
+                    print(f"Error extracting {firstLevel}/{secondLevel}/{thirdLevel} of {pair} on {market}: {repr(e)}")
+                    error = error or e
+                    continue
+                cycleValues.append((cpmId, value))
+                valuesExtracted += 1
+        else:
+            print(f"Error fetching the summary for {pair} on {market}: {error}")
+
+        # Running out of allowance says nothing about the market/pair itself, so its circuit is left alone. The
+        # bookkeeping of one market/pair's circuit failing should not stop the cycle of all of the others.
+        if valuesExtracted > 0:
+            error = None
+        retryAt = None
+        try:
+            if valuesExtracted > 0:
+                circuitBreakers.recordSuccess((market, pair))
+            elif not isinstance(error, BudgetExhausted):
+                circuitBreakers.recordFailure((market, pair), time.time(), isPermanentError(error))
+            retryAt = circuitBreakers.retryAt((market, pair))
+        except Exception as e:
+            print(f"Error while updating the circuit of {pair} on {market}: {repr(e)}")
+        pairResults.append((market, pair, error, retryAt))
+        EXTRACTION_SECONDS.labels(market).observe(time.time() - start_time_run_i)
+        print(f"--- Extracted {valuesExtracted} Values for {pair} on {market} --- {round(time.time() - start_time_run_i,4)} seconds ---")
+    if pairsSkipped > 0:
+        print(f"--- Skipped {pairsSkipped} Market/Pairs with an Open Circuit ---")
+
+    # The values of the whole cycle are screened at once, the suspect ones are quarantined rather than written, so
+    # they reach neither the series, nor the alerts, nor the ranks.
+    start_time_screen = time.time()
+    with SCREENING_SECONDS.time():
+        cycleValues, quarantined, resets = screen.screen(cycleValues)
+    for cpmId, value, median, mad, reason in quarantined:
+        VALUES_QUARANTINED.labels(reason).inc()
+        print(f"Quarantined the value {value} of the metric {cpmId} ({reason}), its median is {median} and its MAD {mad}")
+    for cpmId, value, median, mad, reason in resets:
+        print(f"Reset the metric {cpmId} to the value {value} after {SCREEN_RESET_AFTER} outliers in a row, its median was {median}")
+    print(f"--- Screened {len(cycleValues) + len(quarantined)} Values, Quarantined {len(quarantined)} --- {round(time.time() - start_time_screen, 4)} seconds ---")
+
+    for cpmId, value in cycleValues:
+        toSendAlert, previousValue = alertEngine.observe(cpmId, value, cycleTime)
+        if toSendAlert: alertingData.append({'currencyPairMetricId': cpmId, 'previousValue': previousValue, 'currentValue': value})
+
+    # The whole cycle is written at once in a single transaction instead of one autocommitted insert per metric. The
+    # resets are also written to the quarantine table, where the next runs find where the window of the metric starts.
+    start_time_insert = time.time()
+    with DB_WRITE_SECONDS.labels("insert").time():
+        rowsWritten = insertMetricValues(db, cycleValues, cycleTime, INSERT_CHUNK_SIZE, quarantined + resets)
+    VALUES_WRITTEN.inc(rowsWritten)
+    print(f"--- Inserted {rowsWritten} Values --- {round(time.time() - start_time_insert, 4)} seconds ---")
+
+    # Deleting the values beyond the lookback that the app promises is left to retention.py, on its own schedule.
+
+    # The stddev ranks shown by the API are materialized once per cycle rather than aggregated on every request.
+    if leader:
+        start_time_rank = time.time()
+        with DB_WRITE_SECONDS.labels("rank").time():
+            metricsRanked = refreshMetricRanks(db, cycleTime, INSERT_CHUNK_SIZE, HOURS_LOOKBACK)
+        print(f"--- Ranked {metricsRanked} Metrics --- {round(time.time() - start_time_rank, 4)} seconds ---")
+    bumpCycleVersion(db)
+
+    secondsElapsed = round(time.time() - cycleStart, 4)
+    CYCLE_SECONDS.observe(secondsElapsed)
+    CYCLE_BUDGET_RATIO.set(secondsElapsed * CADENCE_PER_MINUTE / 60)
+    LAST_CYCLE_TIMESTAMP.set_to_current_time()
+    print(f"--- Writing Script Over --- {secondsElapsed} seconds ---")
+
+    # The heartbeat is what canary.py checks the freshness of the data with, market/pair by market/pair. Failing
+    # to write it would make the canary report this cycle as missing, but it should not stop the cycle.
+    try:
+        with DB_WRITE_SECONDS.labels("heartbeat").time():
+            failuresByMarket = recordHeartbeat(db, WORKER_ID, cycleTime, cycleStart, time.time(), len(currentMetrics),
+                                               rowsWritten, pairResults, pairsSkipped, INSERT_CHUNK_SIZE)
+        if len(failuresByMarket) > 0:
+            print(f"--- Failed Summaries by Market: {failuresByMarket} ---")
+    except Exception as e:
+        print(f"Error while writing the cycle heartbeat: {e}")
+
+    if CADENCE_PER_MINUTE > 0 and secondsElapsed > BACKEND_THRESHOLD * (60 / CADENCE_PER_MINUTE):
+        sendBackendTimeAlert(secondsElapsed, BACKEND_THRESHOLD)
+
+    # The alerts are only queued here, alert-worker.py delivers them outside of the cycle.
+    if len(alertingData) > 0:
+        with DB_WRITE_SECONDS.labels("alerts").time():
+            alertsQueued = enqueueAlerts(db, alertingData, cycleTime)
+        ALERTS_QUEUED.inc(alertsQueued)
+        print(f"--- Queued {alertsQueued} Alerts ---")
+
+
+# Runs a single cycle and exits, this is how the script runs under the cron scheduler.
+def main():
+    if SHARD_MODE == 'lease':
+        print("SHARD_MODE=lease needs the workers to stay up, run with POLLER_MODE=daemon or use SHARD_MODE=static")
+        return
+    db = connectToMySQL()
+    cursor = db.cursor()
+
+    # Every value of this cycle is stamped with the cadence boundary the run was started for, rather than its own
+    # clock, so that the workers of the same cycle (SHARD_MODE=static) all stamp it with the same time.
+    periodSeconds = 60 / CADENCE_PER_MINUTE if CADENCE_PER_MINUTE > 0 else 60
+    cycleTime = datetime.datetime.fromtimestamp(currentBoundary(start_time, periodSeconds)).replace(microsecond=0)
+    currentMetrics = metricsForWorker(getActiveMetrics(cursor), WORKER_SHARD_INDEX, list(range(WORKER_SHARD_COUNT)))
+    alertEngine, screen = loadWindows(cursor, cycleTime, [row[0] for row in currentMetrics], False)
+    circuitBreakers.load(cursor)
+    session = createSession(FETCH_CONCURRENCY)
+    runCycle(db, session, alertEngine, screen, currentMetrics, cycleTime, start_time, WORKER_SHARD_INDEX == 0)
+    session.close()
+
+    db.close()
+    exportMetrics(METRICS_TEXTFILE, PUSHGATEWAY_URL, "query-cryptowatch")
+    print(f"--- Closed DB, Done --- {round(time.time() - start_time, 4)} seconds ---")
+
+
+# Long-running mode: one process keeps its mySQL connection, its HTTP session and the alerting windows between
+# cycles, only reloads the active metrics when they changed, and runs a cycle on every exact cadence boundary
+# (every 60 / CADENCE_PER_MINUTE seconds, which can be below a minute) with the configured overrun policy.
+# The workers of each cycle split the market/pairs between them, and the alerting windows are reloaded whenever
+# this worker's share of the metrics changes, ex: when it takes over the pairs of a worker that died.
+def runDaemon():
+    serveMetrics(METRICS_PORT)
+    db = connectToMySQL()
+    session = createSession(FETCH_CONCURRENCY)
+    shards = createShards()
+    shards.start()
+    state = {'signature': None, 'metrics': [], 'owned': None, 'alertEngine': None, 'screen': None}
+
+    def tick(scheduled):
+        cycleStart = time.time()
+        # Every value of this cycle is stamped with the boundary it was scheduled for.
+        cycleTime = datetime.datetime.fromtimestamp(scheduled).replace(microsecond=0)
+        db.ping(reconnect=True)
+        cursor = db.cursor()
+        signature = getActiveMetricsSignature(cursor)
+        if signature != state['signature']:
+            state['metrics'] = getActiveMetrics(cursor)
+            state['signature'] = signature
+            print(f"--- Reloaded {len(state['metrics'])} Active Metrics ---")
+        workers = shards.workers(cursor, scheduled)
+        if shards.workerId() not in workers:
+            cursor.close()
+            print(f"--- Skipping the cycle, the lease of {shards.workerId()} was not valid at its boundary ---")
+            return
+        currentMetrics = metricsForWorker(state['metrics'], shards.workerId(), workers)
+        owned = set(row[0] for row in currentMetrics)
+        if owned != state['owned']:
+            if state['alertEngine'] == None or not owned <= state['owned']:
+                state['alertEngine'], state['screen'] = loadWindows(cursor, cycleTime, owned, True)
+                # The circuits of the market/pairs taken over from other workers.
+                circuitBreakers.load(cursor)
+            state['alertEngine'].retain(owned)
+            state['screen'].retain(owned)
+            state['owned'] = owned
+            print(f"--- Polling {len(currentMetrics)} of {len(state['metrics'])} Active Metrics as {shards.workerId()} out of {len(workers)} Workers ---")
+        cursor.close()
+        runCycle(db, session, state['alertEngine'], state['screen'], currentMetrics, cycleTime, cycleStart, workers[0] == shards.workerId())
+
+    scheduler = CadenceScheduler(60 / CADENCE_PER_MINUTE, SCHEDULER_OVERRUN_POLICY, SCHEDULER_MAX_CATCHUP)
+    scheduler.installSignalHandlers()
+    print(f"--- Daemon started, running every {round(60 / CADENCE_PER_MINUTE, 4)} seconds ---")
+    scheduler.run(tick)
+
+    shards.stop()
+    session.close()
+    db.close()
+    print(f"--- Daemon stopped after {scheduler.overruns} overruns and {scheduler.skipped} skipped cycles ---")
+
+
+# Entry point of query-cryptowatch.py (and of python -m jobs.poller): one cycle, or the daemon.
+def run(argv):
+    if "--daemon" in argv or os.environ.get('POLLER_MODE') == 'daemon':
+        runDaemon()
+    else:
+        main()
+
+
+if __name__ == "__main__":
+    run(sys.argv)
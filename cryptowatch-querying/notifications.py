@@ -0,0 +1,235 @@
+import json
+import threading
+import time
+import uuid
+
+# Delivery of the client alerts through the crypto.AlertOutbox queue (migrations/0005). The poller only enqueues
+# the alerts of a cycle with a single insert, and alert-worker.py claims them in batches, resolves the recipients
+# of the whole batch with one query, and sends one personalized SendGrid request per alert (one personalization
+# per recipient) through a single reused client, within a maximum number of requests per second.
+
+FROM_EMAIL = "bot@crypto-data-tracker.com"
+
+# SendGrid accepts at most 1000 personalizations per request.
+MAX_PERSONALIZATIONS = 1000
+
+enqueueQuery = """
+    INSERT IGNORE INTO crypto.AlertOutbox (currencyPairMetricId, previousValue, currentValue, cycleTime, createdAt)
+    VALUES (%s, %s, %s, %s, now())
+"""
+
+recipientsQuery = """
+    SELECT DISTINCT ucpm.currencyPairMetricId, u.email, u.firstName, u.lastName, mt.name,
+    cpm.pair, cpm.market
+    FROM crypto.UserCurrencyPairMetric ucpm
+    JOIN crypto.User u on ucpm.userId = u.id
+    JOIN crypto.CurrencyPairMetric cpm on cpm.id = ucpm.currencyPairMetricId
+    JOIN crypto.MetricType mt on cpm.metricTypeId = mt.id
+    WHERE ucpm.deletedAt is null
+    AND u.email is not null
+    AND ucpm.currencyPairMetricId IN ({})
+"""
+
+
+# Queues the alerts of a cycle. Enqueuing the same metric twice for a cycle is ignored, ex: when a cycle is retried.
+# Inputs: pymysql connection, list of {'currencyPairMetricId', 'previousValue', 'currentValue'}, the cycle's datetime
+# Outputs: the number of alerts queued.
+def enqueueAlerts(db, alertingData, cycleTime):
+    rows = [(metricDict['currencyPairMetricId'], metricDict['previousValue'], metricDict['currentValue'], cycleTime)
+            for metricDict in alertingData]
+    if len(rows) == 0:
+        return 0
+    cursor = db.cursor()
+    cursor.executemany(enqueueQuery, rows)
+    cursor.close()
+    return len(rows)
+
+
+# Claims up to batchSize pending alerts for this worker, so several workers never send the same alert. Claims
+# left behind by a worker that died are released after staleSeconds.
+# Outputs: list of (id, currencyPairMetricId, previousValue, currentValue, cycleTime, attempts, deliveredThrough),
+# oldest first.
+def claimAlerts(db, batchSize, staleSeconds):
+    cursor = db.cursor()
+    token = uuid.uuid4().hex
+    cursor.execute("""
+        UPDATE crypto.AlertOutbox SET status = 'pending', claimToken = null
+        WHERE status = 'sending' AND claimedAt < DATE_SUB(now(), INTERVAL %s SECOND)
+    """, (staleSeconds,))
+    cursor.execute("""
+        UPDATE crypto.AlertOutbox SET status = 'sending', claimToken = %s, claimedAt = now()
+        WHERE status = 'pending' ORDER BY id LIMIT %s
+    """, (token, batchSize))
+    cursor.execute("""
+        SELECT id, currencyPairMetricId, previousValue, currentValue, cycleTime, attempts, deliveredThrough
+        FROM crypto.AlertOutbox WHERE claimToken = %s AND status = 'sending' ORDER BY id
+    """, (token,))
+    claimed = cursor.fetchall()
+    cursor.close()
+    return claimed
+
+
+# Keeps a single alert per metric: only the latest alert of a metric in the batch is sent, and none at all if
+# the metric already had an alert sent within the cooldown.
+# Outputs: (alerts to send, ids of the suppressed alerts)
+def deduplicateAlerts(cursor, alerts, cooldownMinutes):
+    latest = {}
+    for alert in alerts:
+        latest[alert[1]] = alert
+    suppressed = [alert[0] for alert in alerts if latest[alert[1]][0] != alert[0]]
+    if len(latest) == 0 or cooldownMinutes <= 0:
+        return list(latest.values()), suppressed
+    cpmIds = list(latest.keys())
+    cursor.execute(f"""
+        SELECT DISTINCT currencyPairMetricId FROM crypto.AlertOutbox
+        WHERE status = 'sent' AND sentAt > DATE_SUB(now(), INTERVAL %s MINUTE)
+        AND currencyPairMetricId IN ({', '.join(['%s'] * len(cpmIds))})
+    """, [cooldownMinutes] + cpmIds)
+    cooling = set(row[0] for row in cursor.fetchall())
+    suppressed += [latest[cpmId][0] for cpmId in cooling]
+    return [alert for cpmId, alert in latest.items() if cpmId not in cooling], suppressed
+
+
+# Resolves the recipients of every alerting metric with a single query.
+# Outputs: dictionary of currencyPairMetricId => list of (email, firstName, lastName, metric, pair, market), sorted
+# by email so that the requests of an alert can be resumed after the last recipient they were delivered to.
+def resolveRecipients(cursor, cpmIds):
+    recipients = {}
+    if len(cpmIds) == 0:
+        return recipients
+    cursor.execute(recipientsQuery.format(', '.join(['%s'] * len(cpmIds))), list(cpmIds))
+    for cpmId, email, firstName, lastName, metric, pair, market in cursor.fetchall():
+        recipients.setdefault(cpmId, []).append((email, firstName, lastName, metric, pair, market))
+    for metricRecipients in recipients.values():
+        metricRecipients.sort(key=lambda recipient: recipient[0])
+    return recipients
+
+
+# Builds the SendGrid v3 request bodies of one alert: the message is shared by all of its recipients and
+# personalized with their names through substitutions, in chunks of MAX_PERSONALIZATIONS recipients.
+def buildAlertMails(recipients, previousValue, value, factor, hoursForAlert):
+    metric, pair, market = recipients[0][3], recipients[0][4], recipients[0][5]
+    growth = f"{round(100 * (value - previousValue) / previousValue, 2)}%" if previousValue != 0 else "n/a"
+    message =   f"""Hello -firstName- -lastName-,
+
+                    I have been configured to tell you when any of your tracked metrics are above {factor}
+                    times what they have been averaging in the past {hoursForAlert} hours.
+
+                    This is the case for {metric} for {pair} on {market}, which just registered a value of {value} compared to
+                    its previous average of {previousValue}, marking a growth of {growth}.
+
+                    I hope you find this information useful!
+
+                    Best,
+                    CryptoDataBot"""
+    mails = []
+    for i in range(0, len(recipients), MAX_PERSONALIZATIONS):
+        mails.append({
+            "from": {"email": FROM_EMAIL},
+            "subject": f"Alert: {metric} for {pair} on {market}",
+            "content": [{"type": "text/plain", "value": message}],
+            "personalizations": [{"to": [{"email": email}],
+                                  "substitutions": {"-firstName-": firstName or "", "-lastName-": lastName or ""}}
+                                 for email, firstName, lastName, metric, pair, market in recipients[i:i + MAX_PERSONALIZATIONS]]
+        })
+    return mails
+
+
+# Spaces the requests out so that there are at most maxPerSecond of them per second.
+class RateLimiter:
+    def __init__(self, maxPerSecond):
+        self.interval = 1 / maxPerSecond if maxPerSecond > 0 else 0
+        self.nextAllowed = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.nextAllowed - now
+            self.nextAllowed = max(now, self.nextAllowed) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Sends through one SendGrid client built once for the lifetime of the worker.
+class SendGridTransport:
+    def __init__(self, apiKey):
+        import sendgrid
+        self.client = sendgrid.SendGridAPIClient(api_key=apiKey)
+
+    def send(self, mail):
+        response = self.client.client.mail.send.post(request_body=mail)
+        if response.status_code >= 300:
+            raise RuntimeError(f"SendGrid answered {response.status_code}: {response.body}")
+        return response.status_code
+
+
+# Local stand-in for SendGrid that keeps the request bodies in memory and, given a path, appends them to a
+# JSON lines file, so the pipeline can be run and checked without sending any email.
+class StubTransport:
+    def __init__(self, path=None):
+        self.path = path
+        self.sent = []
+
+    def send(self, mail):
+        self.sent.append(mail)
+        if self.path != None:
+            with open(self.path, "a") as stubFile:
+                stubFile.write(json.dumps(mail) + "\n")
+        print(f"Stub send of {mail['subject']} to {len(mail['personalizations'])} recipients")
+        return 202
+
+
+def markAlerts(cursor, ids, status, error=None):
+    if len(ids) == 0:
+        return
+    sentAt = "now()" if status == 'sent' else "sentAt"
+    attempts = "attempts + 1" if status in ['pending', 'failed'] else "attempts"
+    cursor.execute(f"""
+        UPDATE crypto.AlertOutbox SET status = %s, lastError = %s, claimToken = null, sentAt = {sentAt}, attempts = {attempts}
+        WHERE id IN ({', '.join(['%s'] * len(ids))})
+    """, [status, error] + list(ids))
+
+
+# Records that an alert was delivered to every recipient up to email, once a request of it went out.
+def markDelivered(cursor, alertId, email):
+    cursor.execute("UPDATE crypto.AlertOutbox SET deliveredThrough = %s WHERE id = %s", (email, alertId))
+
+
+# Claims and delivers one batch of alerts. An alert whose send fails goes back to pending until maxAttempts,
+# then is marked failed. Alerts of metrics that nobody tracks anymore are marked skipped. The recipients of an
+# alert can span several requests, so the last recipient of every request that went out is recorded, and a retry
+# only sends to the recipients after it.
+# Outputs: dictionary with the count of alerts per outcome and the number of requests sent.
+def deliverAlerts(db, transport, limiter, batchSize, cooldownMinutes, maxAttempts, staleSeconds, factor, hoursForAlert):
+    report = {"claimed": 0, "sent": 0, "suppressed": 0, "skipped": 0, "failed": 0, "requests": 0}
+    alerts = claimAlerts(db, batchSize, staleSeconds)
+    report["claimed"] = len(alerts)
+    if len(alerts) == 0:
+        return report
+    cursor = db.cursor()
+    toSend, suppressed = deduplicateAlerts(cursor, alerts, cooldownMinutes)
+    markAlerts(cursor, suppressed, 'suppressed')
+    report["suppressed"] = len(suppressed)
+    recipients = resolveRecipients(cursor, set(alert[1] for alert in toSend))
+    for alertId, cpmId, previousValue, value, cycleTime, attempts, deliveredThrough in toSend:
+        if cpmId not in recipients:
+            markAlerts(cursor, [alertId], 'skipped')
+            report["skipped"] += 1
+            continue
+        remaining = [recipient for recipient in recipients[cpmId] if deliveredThrough == None or recipient[0] > deliveredThrough]
+        try:
+            if len(remaining) > 0:
+                for mail in buildAlertMails(remaining, previousValue, value, factor, hoursForAlert):
+                    limiter.wait()
+                    transport.send(mail)
+                    report["requests"] += 1
+                    markDelivered(cursor, alertId, mail["personalizations"][-1]["to"][0]["email"])
+            markAlerts(cursor, [alertId], 'sent')
+            report["sent"] += 1
+        except Exception as e:
+            print(f"Error while sending the alert {alertId}: {e}")
+            markAlerts(cursor, [alertId], 'failed' if attempts + 1 >= maxAttempts else 'pending', str(e)[:1000])
+            report["failed"] += 1
+    cursor.close()
+    return report
@@ -0,0 +1,70 @@
+import datetime
+
+# MetricValue is range partitioned by the hour of queriedAt (migrations/0002_partition_metricvalue.sql). Each
+# hourly partition is named after the hour it holds, pYYYYMMDDHH, and pmax catches everything after the last one.
+
+partitionsQuery = """
+    SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    ORDER BY PARTITION_ORDINAL_POSITION
+"""
+
+
+def partitionName(hourStart):
+    return hourStart.strftime("p%Y%m%d%H")
+
+
+# Returns the datetime of the hour held by an hourly partition, None for pmax or any other partition.
+def partitionHour(name):
+    try:
+        return datetime.datetime.strptime(name, "p%Y%m%d%H")
+    except ValueError:
+        return None
+
+
+# Returns the list of (name, hour) of the hourly partitions of the table, oldest first. Empty when the table
+# is not partitioned, so every caller can simply do nothing on a schema without migration 0002.
+def listHourlyPartitions(cursor, schema, table):
+    cursor.execute(partitionsQuery, (schema, table))
+    hourly = []
+    for name, description in cursor.fetchall():
+        hour = partitionHour(name)
+        if hour != None:
+            hourly.append((name, hour))
+    return hourly
+
+
+def isPartitioned(cursor, schema, table):
+    cursor.execute(partitionsQuery, (schema, table))
+    return len(cursor.fetchall()) > 0
+
+
+# Splits hourly partitions off pmax so that there is always one ready for the current hour and the next
+# hoursAhead hours. pmax only holds future rows once this has run, so reorganizing it is cheap. The first
+# hourly partition also receives every older row that was still in pmax, unless firstHour is given to start
+# the hourly partitions further back (ex: to partition existing data).
+# Outputs: the number of partitions created.
+def ensureHourlyPartitions(db, now, hoursAhead, schema="crypto", table="MetricValue", firstHour=None):
+    cursor = db.cursor()
+    try:
+        if not isPartitioned(cursor, schema, table):
+            return 0
+        hourly = listHourlyPartitions(cursor, schema, table)
+        currentHour = now.replace(minute=0, second=0, microsecond=0)
+        if len(hourly) > 0:
+            nextHour = max(currentHour, hourly[-1][1] + datetime.timedelta(hours=1))
+        else:
+            nextHour = currentHour if firstHour == None else firstHour.replace(minute=0, second=0, microsecond=0)
+        newHours = []
+        while nextHour <= currentHour + datetime.timedelta(hours=hoursAhead):
+            newHours.append(nextHour)
+            nextHour += datetime.timedelta(hours=1)
+        if len(newHours) == 0:
+            return 0
+        definitions = [f"PARTITION {partitionName(hour)} VALUES LESS THAN (TO_SECONDS('{hour + datetime.timedelta(hours=1)}'))"
+                       for hour in newHours]
+        definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        cursor.execute(f"ALTER TABLE {schema}.{table} REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})")
+        return len(newHours)
+    finally:
+        cursor.close()
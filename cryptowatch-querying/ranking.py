@@ -0,0 +1,64 @@
+import datetime
+
+# The standard deviations of the values of the last hoursLookback hours, the window the graphs show. MetricValue
+# can hold up to an hour more until retention.py removes the hour, which must not count in the ranks.
+rankAggregationQuery = """
+    SELECT cpm.id, cpm.market, cpm.metricTypeId, stddev(mv.value)
+    FROM crypto.MetricValue mv JOIN crypto.CurrencyPairMetric cpm
+    ON mv.currencyPairMetricId = cpm.id
+    WHERE mv.queriedAt > %s AND mv.queriedAt <= %s
+    GROUP BY cpm.id, cpm.market, cpm.metricTypeId
+"""
+
+# rankChangedAt only moves when the rank itself changes, so the API can send the ranks that changed since a
+# client's last refresh. It must be assigned before rankNum and rankDenom, which MySQL updates left to right.
+rankUpsertQuery = """
+    INSERT INTO crypto.MetricRank (currencyPairMetricId, market, metricTypeId, stddev, rankNum, rankDenom, rankChangedAt, updatedAt)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    rankChangedAt = IF(rankNum <> VALUES(rankNum) OR rankDenom <> VALUES(rankDenom), VALUES(rankChangedAt), rankChangedAt),
+    market = VALUES(market), metricTypeId = VALUES(metricTypeId), stddev = VALUES(stddev),
+    rankNum = VALUES(rankNum), rankDenom = VALUES(rankDenom), updatedAt = VALUES(updatedAt)
+"""
+
+
+# Orders the standard deviations within each (market, metricTypeId), largest first, the same ranking the API
+# used to compute on every request. Rank numerators start at 1 and the denominator is the size of the group.
+# Equal deviations are ranked by currencyPairMetricId so that a tie does not move between cycles, and the metrics
+# without a deviation (a single value) come last.
+# Inputs: rows of (currencyPairMetricId, market, metricTypeId, stddev)
+# Outputs: list of (currencyPairMetricId, market, metricTypeId, stddev, rankNum, rankDenom)
+def rankByStandardDeviation(aggregateRows):
+    groups = {}
+    for cpmId, market, metricTypeId, stddev in aggregateRows:
+        groups.setdefault((market, metricTypeId), []).append((cpmId, stddev))
+    ranks = []
+    for (market, metricTypeId), members in groups.items():
+        members.sort(key=lambda member: (-member[1] if member[1] is not None else float("inf"), member[0]))
+        for rankNum, (cpmId, stddev) in enumerate(members, start=1):
+            ranks.append((cpmId, market, metricTypeId, stddev, rankNum, len(members)))
+    return ranks
+
+
+# Recomputes the materialized MetricRank table once per cycle with a single grouped aggregation, so the API
+# only has to read the ranks of a user's metrics instead of aggregating MetricValue for each one of them.
+# Only the values of the hoursLookback hours up to cycleTime are ranked, and the rows of metrics that have no
+# values in them are removed. Everything happens in one transaction.
+# Outputs: the number of ranked metrics.
+def refreshMetricRanks(db, cycleTime, chunkSize, hoursLookback):
+    cursor = db.cursor()
+    try:
+        cursor.execute(rankAggregationQuery, (cycleTime - datetime.timedelta(hours=hoursLookback), cycleTime))
+        ranks = rankByStandardDeviation(cursor.fetchall())
+        rows = [rank + (cycleTime, cycleTime) for rank in ranks]
+        db.begin()
+        for i in range(0, len(rows), chunkSize):
+            cursor.executemany(rankUpsertQuery, rows[i:i + chunkSize])
+        cursor.execute("DELETE FROM crypto.MetricRank WHERE updatedAt < %s", (cycleTime,))
+        db.commit()
+    except:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(rows)
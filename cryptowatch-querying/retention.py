@@ -0,0 +1,182 @@
+import datetime
+import os
+import time
+import pymysql
+
+from partitions import listHourlyPartitions
+
+# Removes the MetricValues older than the HOURS_LOOKBACK the app promises, separately from the ingestion cycle
+# so that it never holds long locks in the way of the inserts or the graph reads. Retention works on whole
+# hours: every hour that has fully expired is first checked to be rolled up into crypto.MetricValueHourly for
+# every metric it holds values of (ingestion normally did, see ingestion.py), and rolled up if not, then removed by either dropping its partition (when MetricValue is
+# partitioned, see migrations/0002) or deleting it in bounded primary key chunks with a pause in between.
+# Meant to run on its own schedule:
+#   python retention.py
+
+# The metrics of an hour whose rollup is missing or counts fewer values than MetricValue holds for them. One
+# counting more is left alone: its hour was rolled up whole and a retention run stopped halfway through deleting it.
+incompleteRollupQuery = """
+    SELECT raw.currencyPairMetricId FROM (
+        SELECT currencyPairMetricId, COUNT(*) as count FROM crypto.MetricValue
+        WHERE queriedAt >= %s AND queriedAt < %s
+        GROUP BY currencyPairMetricId
+    ) raw
+    LEFT JOIN crypto.MetricValueHourly hourly
+    ON hourly.currencyPairMetricId = raw.currencyPairMetricId AND hourly.bucketStart = %s
+    WHERE hourly.count is null OR hourly.count < raw.count
+"""
+
+# Rebuilds the hourly rollup of some metrics from their values, replacing whatever ingestion had written.
+rollupQuery = """
+    REPLACE INTO crypto.MetricValueHourly (currencyPairMetricId, bucketStart, open, high, low, close, mean, count)
+    SELECT currencyPairMetricId, %s,
+    SUBSTRING_INDEX(GROUP_CONCAT(value ORDER BY queriedAt ASC), ',', 1) + 0,
+    MAX(value), MIN(value),
+    SUBSTRING_INDEX(GROUP_CONCAT(value ORDER BY queriedAt DESC), ',', 1) + 0,
+    AVG(value), COUNT(*)
+    FROM crypto.MetricValue
+    WHERE queriedAt >= %s AND queriedAt < %s AND currencyPairMetricId IN ({ids})
+    GROUP BY currencyPairMetricId
+"""
+
+# Rebuilds the daily rollup of a day from its hours, for the days that had hours rolled up here.
+rollupDayQuery = """
+    REPLACE INTO crypto.MetricValueDaily (currencyPairMetricId, bucketStart, open, high, low, close, mean, count)
+    SELECT currencyPairMetricId, %s,
+    SUBSTRING_INDEX(GROUP_CONCAT(open ORDER BY bucketStart ASC), ',', 1) + 0,
+    MAX(high), MIN(low),
+    SUBSTRING_INDEX(GROUP_CONCAT(close ORDER BY bucketStart DESC), ',', 1) + 0,
+    SUM(mean * count) / SUM(count), SUM(count)
+    FROM crypto.MetricValueHourly
+    WHERE bucketStart >= %s AND bucketStart < %s
+    GROUP BY currencyPairMetricId
+"""
+
+
+# Returns the start of the first hour that has not fully expired: everything before it can be removed.
+def retentionCutoff(now, hoursLookback):
+    return (now - datetime.timedelta(hours=hoursLookback)).replace(minute=0, second=0, microsecond=0)
+
+
+# Makes sure every expired hour is rolled up for all of the metrics it holds values of, oldest first, before its
+# values are removed. Ingestion maintains the rollups as the values land, but an hour can be rolled up for only
+# some of its metrics or values (written before it did, or by a cycle whose rollup failed): the metrics whose
+# rollup misses values are rolled up again from MetricValue. It is safe to run again after a retention run
+# stopped halfway. The days of the hours rolled up here are then rebuilt in MetricValueDaily from their hours.
+# Outputs: the number of hours rolled up.
+def rollupExpiredHours(cursor, cutoff):
+    cursor.execute("SELECT MIN(queriedAt) FROM crypto.MetricValue")
+    oldest = cursor.fetchone()[0]
+    if oldest == None:
+        return 0
+    hour, hoursRolledUp, days = oldest.replace(minute=0, second=0, microsecond=0), 0, []
+    while hour < cutoff:
+        hourEnd = hour + datetime.timedelta(hours=1)
+        cursor.execute(incompleteRollupQuery, (hour, hourEnd, hour))
+        incompleteIds = [row[0] for row in cursor.fetchall()]
+        if len(incompleteIds) > 0:
+            cursor.execute(rollupQuery.format(ids=", ".join(["%s"] * len(incompleteIds))), [hour, hour, hourEnd] + incompleteIds)
+            hoursRolledUp += 1
+            day = hour.replace(hour=0)
+            if day not in days:
+                days.append(day)
+        hour += datetime.timedelta(hours=1)
+    for day in days:
+        cursor.execute(rollupDayQuery, (day, day, day + datetime.timedelta(days=1)))
+    return hoursRolledUp
+
+
+# Drops the hourly partitions that only hold expired rows.
+# Outputs: the (estimated, from the table statistics) number of rows removed.
+def dropExpiredPartitions(cursor, cutoff):
+    expired = [name for name, hour in listHourlyPartitions(cursor, "crypto", "MetricValue")
+               if hour + datetime.timedelta(hours=1) <= cutoff]
+    if len(expired) == 0:
+        return 0
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(TABLE_ROWS), 0) FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = 'crypto' AND TABLE_NAME = 'MetricValue' AND PARTITION_NAME IN ({', '.join(['%s'] * len(expired))})
+    """, expired)
+    rowsRemoved = int(cursor.fetchone()[0])
+    cursor.execute(f"ALTER TABLE crypto.MetricValue DROP PARTITION {', '.join(expired)}")
+    return rowsRemoved
+
+
+# Deletes the expired rows chunkSize primary keys at a time, pausing between chunks so the locks are short
+# and the inserts and graph reads can get in between.
+# Outputs: the number of rows removed.
+def deleteExpiredChunks(cursor, cutoff, chunkSize, pause):
+    rowsRemoved = 0
+    while True:
+        cursor.execute("SELECT id FROM crypto.MetricValue WHERE queriedAt < %s ORDER BY queriedAt LIMIT %s", (cutoff, chunkSize))
+        ids = [row[0] for row in cursor.fetchall()]
+        if len(ids) == 0:
+            return rowsRemoved
+        cursor.execute(f"DELETE FROM crypto.MetricValue WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        rowsRemoved += cursor.rowcount
+        time.sleep(pause)
+
+
+# Removes the poller heartbeats that ended before the cutoff, and the market/pairs nobody polled since then.
+# Outputs: the number of heartbeats removed.
+def pruneHeartbeats(cursor, cutoff):
+    cursor.execute("DELETE FROM crypto.PollerHeartbeat WHERE cycleEnd < %s", (cutoff,))
+    heartbeatsRemoved = cursor.rowcount
+    cursor.execute("DELETE FROM crypto.PairFreshness WHERE lastAttemptAt < %s", (cutoff,))
+    return heartbeatsRemoved
+
+
+# Removes the quarantined values queried before the cutoff. Outputs: the number of values removed.
+def pruneQuarantine(cursor, cutoff):
+    cursor.execute("DELETE FROM crypto.MetricValueQuarantine WHERE queriedAt < %s", (cutoff,))
+    return cursor.rowcount
+
+
+# Applies the retention policy once. mode is partitions, chunks, or auto to drop partitions when the table is
+# partitioned and delete in chunks otherwise. Rows older than the oldest hourly partition (ex: written before
+# the table was partitioned) are always cleaned up in chunks.
+# The heartbeats of the poller are kept for heartbeatDays, the quarantined values for quarantineDays.
+# Outputs: dictionary with the hours rolled up, the rows, heartbeats and quarantined values removed and the seconds spent.
+def applyRetention(db, now, hoursLookback, mode, chunkSize, pause, rollup, heartbeatDays, quarantineDays):
+    start = time.time()
+    cursor = db.cursor()
+    cutoff = retentionCutoff(now, hoursLookback)
+    hoursRolledUp = rollupExpiredHours(cursor, cutoff) if rollup else 0
+    rowsRemoved = 0
+    partitioned = len(listHourlyPartitions(cursor, "crypto", "MetricValue")) > 0
+    if mode == "partitions" or (mode == "auto" and partitioned):
+        rowsRemoved += dropExpiredPartitions(cursor, cutoff)
+    rowsRemoved += deleteExpiredChunks(cursor, cutoff, chunkSize, pause)
+    heartbeatsRemoved = pruneHeartbeats(cursor, now - datetime.timedelta(days=heartbeatDays))
+    quarantinedRemoved = pruneQuarantine(cursor, now - datetime.timedelta(days=quarantineDays))
+    cursor.close()
+    return {"cutoff": cutoff, "hoursRolledUp": hoursRolledUp, "rowsRemoved": rowsRemoved, "heartbeatsRemoved": heartbeatsRemoved,
+            "quarantinedRemoved": quarantinedRemoved, "seconds": round(time.time() - start, 4)}
+
+
+if __name__ == "__main__":
+    # This section is for running the service locally.
+    if os.environ.get("SQL_IP") == None:
+        from dotenv import load_dotenv, find_dotenv
+        load_dotenv(find_dotenv())
+
+    SQL_IP=os.environ.get('SQL_IP')
+    SQL_USER=os.environ.get('SQL_USER')
+    SQL_PASSWORD=os.environ.get('SQL_PASSWORD')
+    SQL_SCHEMA=os.environ.get('SQL_SCHEMA')
+    HOURS_LOOKBACK=int(os.environ.get('HOURS_LOOKBACK'))
+    RETENTION_MODE=os.environ.get('RETENTION_MODE', 'auto')
+    RETENTION_CHUNK_SIZE=int(os.environ.get('RETENTION_CHUNK_SIZE', 5000))
+    RETENTION_PAUSE=float(os.environ.get('RETENTION_PAUSE', 0.1))
+    RETENTION_ROLLUP=os.environ.get('RETENTION_ROLLUP', '1') == '1'
+    HEARTBEAT_RETENTION_DAYS=int(os.environ.get('HEARTBEAT_RETENTION_DAYS', 7))
+    QUARANTINE_RETENTION_DAYS=int(os.environ.get('QUARANTINE_RETENTION_DAYS', 30))
+
+    db = pymysql.connect(host=SQL_IP, user=SQL_USER, password=SQL_PASSWORD, db=SQL_SCHEMA, autocommit=True)
+    report = applyRetention(db, datetime.datetime.now(), HOURS_LOOKBACK, RETENTION_MODE,
+                            RETENTION_CHUNK_SIZE, RETENTION_PAUSE, RETENTION_ROLLUP, HEARTBEAT_RETENTION_DAYS,
+                            QUARANTINE_RETENTION_DAYS)
+    db.close()
+    print(f"--- Retention before {report['cutoff']}: rolled up {report['hoursRolledUp']} hours, "
+          f"removed {report['rowsRemoved']} rows, {report['heartbeatsRemoved']} heartbeats and {report['quarantinedRemoved']} "
+          f"quarantined values --- {report['seconds']} seconds ---")
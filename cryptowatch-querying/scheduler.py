@@ -0,0 +1,76 @@
+import signal
+import threading
+import time
+
+
+# Runs a task on exact cadence boundaries (multiples of periodSeconds since the epoch, so 15 second cadences fire
+# at :00, :15, :30 and :45) without drifting, whatever the task's own duration. The task receives the epoch
+# seconds of the boundary it runs for. When a run overruns past the next boundary, the missed boundaries are
+# either skipped (overrunPolicy "skip", the next run happens on the next future boundary) or caught up back to
+# back (overrunPolicy "catchup", at most maxCatchup of them, the older ones are skipped). clock returns the epoch
+# seconds, it is only replaced in the tests.
+class CadenceScheduler:
+    def __init__(self, periodSeconds, overrunPolicy="skip", maxCatchup=3, clock=time.time):
+        self.periodSeconds = periodSeconds
+        self.clock = clock
+        self.overrunPolicy = overrunPolicy
+        self.maxCatchup = maxCatchup
+        self.stopEvent = threading.Event()
+        self.overruns = 0
+        self.skipped = 0
+
+    def nextBoundary(self, now):
+        return (int(now // self.periodSeconds) + 1) * self.periodSeconds
+
+    # Stops the loop after the current run, ex: on SIGTERM when the GKE pod is rescheduled.
+    def stop(self, *args):
+        self.stopEvent.set()
+
+    def installSignalHandlers(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def runOnce(self, task, scheduled):
+        try:
+            task(scheduled)
+        except Exception as e:
+            print(f"Error during the cycle scheduled at {scheduled}: {e}")
+
+    # Returns the boundaries that were missed while the run for scheduled was going on, that are to be run
+    # right away according to the overrun policy, along with the next future boundary.
+    def dueBoundaries(self, scheduled, now):
+        missed = []
+        boundary = scheduled + self.periodSeconds
+        while boundary <= now:
+            missed.append(boundary)
+            boundary += self.periodSeconds
+        if len(missed) == 0:
+            return [], boundary
+        self.overruns += 1
+        catchup = missed[-self.maxCatchup:] if self.overrunPolicy == "catchup" and self.maxCatchup > 0 else []
+        self.skipped += len(missed) - len(catchup)
+        print(f"--- Overrun of the cycle scheduled at {scheduled}: catching up {len(catchup)} and skipping {len(missed) - len(catchup)} cycles ---")
+        return catchup, boundary
+
+    def run(self, task):
+        scheduled = self.nextBoundary(self.clock())
+        while True:
+            # Waiting on the event rather than sleeping so a stop request is honored right away.
+            if self.stopEvent.wait(max(0, scheduled - self.clock())):
+                return
+            self.runOnce(task, scheduled)
+            catchup, scheduled = self.dueBoundaries(scheduled, self.clock())
+            for boundary in catchup:
+                if self.stopEvent.is_set():
+                    return
+                self.runOnce(task, boundary)
+            # Catching up takes time too, anything that became due meanwhile is skipped.
+            if scheduled <= self.clock():
+                nextScheduled = self.nextBoundary(self.clock())
+                self.skipped += int((nextScheduled - scheduled) // self.periodSeconds)
+                scheduled = nextScheduled
+
+
+# Returns the epoch seconds of the cadence boundary at or before now, the cycle a run started by cron belongs to.
+def currentBoundary(now, periodSeconds):
+    return int(now // periodSeconds) * periodSeconds
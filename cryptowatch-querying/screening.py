@@ -0,0 +1,192 @@
+import datetime
+import numpy as np
+from ingestion import selectForMetrics
+
+# Scale of the median absolute deviation that makes it comparable to a standard deviation for normal data.
+MAD_SCALE = 1.4826
+
+
+# Screens every value of a cycle before it is written, against the robust statistics (median and median absolute
+# deviation) of the last windowSize accepted values of its own metric. The windows of all of the metrics are
+# the rows of one 2D NumPy array, used as ring buffers, so a whole cycle is screened in a few vectorized passes
+# however many metrics there are.
+# A value is suspect when it is not a finite number, or when it is both:
+#   - more than madThreshold robust standard deviations away from the median of its metric, the deviation being
+#     floored at relativeFloor times the median so that a metric that has been flat does not flag its next move,
+#   - and off by factor times from the median, up or down. For the signed metrics (ex: the changes, which cross
+#     0 all the time) the level means nothing, and it has to be more than factor robust standard deviations away.
+# A metric with no spread sitting at 0 (ex: the volume of a pair nobody trades) says nothing about its next
+# value, which is accepted. Metrics with less than minSamples values are not screened.
+# Suspect values never enter the windows, so they cannot shift the norm. A metric with resetAfter suspect values
+# in a row is taken to have moved to a new level for good (ex: a redenomination): its window starts over from
+# that value, which is accepted and recorded as a reset.
+class RobustScreen:
+    def __init__(self, windowSize, minSamples, madThreshold, factor, resetAfter, relativeFloor=0.001, capacity=1024):
+        self.windowSize = windowSize
+        self.minSamples = max(1, min(minSamples, windowSize))
+        self.madThreshold = madThreshold
+        self.factor = factor
+        self.resetAfter = resetAfter
+        self.relativeFloor = relativeFloor
+        self.rows = {}
+        self.values = np.full((capacity, windowSize), np.nan)
+        self.positions = np.zeros(capacity, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.strikes = np.zeros(capacity, dtype=np.int64)
+
+    # Loads the last windowSeconds of values of the metrics from windowRows, the (currencyPairMetricId, queriedAt,
+    # value) rows of crypto.MetricValue ordered by metric then time (the older rows are left out), and the outliers
+    # and resets of the same period from crypto.MetricValueQuarantine, so that a run of outliers carries over between
+    # the cron runs. Only the quarantined rows of cpmIds, the metrics of the worker, are read, chunkSize ids per
+    # query. now is the naive datetime of the cycle, the same clock used for queriedAt.
+    def load(self, cursor, now, windowSeconds, windowRows, cpmIds, chunkSize):
+        cutoff = now - datetime.timedelta(seconds=windowSeconds)
+        windowRows = [row for row in windowRows if row[1] > cutoff]
+        quarantineQuery = """
+            SELECT currencyPairMetricId, queriedAt, reason FROM crypto.MetricValueQuarantine
+            WHERE queriedAt > %s AND reason in ('outlier', 'reset') AND currencyPairMetricId in ({cpmIds})
+            ORDER BY currencyPairMetricId, queriedAt
+        """
+        self.fill(windowRows, selectForMetrics(cursor, quarantineQuery, (cutoff,), cpmIds, chunkSize))
+
+    # Fills the windows from the (currencyPairMetricId, queriedAt, value) rows, ordered by metric then time, leaving
+    # out the values written before the last reset of their metric. The outliers quarantined after the last value
+    # accepted for a metric are its current run of strikes. quarantineRows are (currencyPairMetricId, queriedAt,
+    # reason), in the same order.
+    def fill(self, windowRows, quarantineRows):
+        resetAt, outliers = {}, {}
+        for cpmId, queriedAt, reason in quarantineRows:
+            if reason == "reset":
+                resetAt[cpmId] = queriedAt
+                outliers[cpmId] = []
+            elif reason == "outlier":
+                outliers.setdefault(cpmId, []).append(queriedAt)
+        windowRows = [row for row in windowRows if row[0] not in resetAt or row[1] >= resetAt[row[0]]]
+        lastAccepted = {cpmId: queriedAt for cpmId, queriedAt, value in windowRows}
+        if len(windowRows) > 0:
+            self.append(self.rowsFor([row[0] for row in windowRows]), np.array([row[2] for row in windowRows], dtype=np.float64))
+        for cpmId, times in outliers.items():
+            strikes = sum(1 for queriedAt in times if cpmId not in lastAccepted or queriedAt > lastAccepted[cpmId])
+            if strikes > 0:
+                self.strikes[self.rowsFor([cpmId])[0]] = strikes
+
+    # Outputs: the array of the rows of the metrics, new rows being given to the metrics seen for the first time.
+    def rowsFor(self, cpmIds):
+        for cpmId in cpmIds:
+            if cpmId not in self.rows:
+                self.rows[cpmId] = len(self.rows)
+        if len(self.rows) > len(self.counts):
+            self.resize(max(len(self.rows), 2 * len(self.counts)))
+        return np.fromiter((self.rows[cpmId] for cpmId in cpmIds), dtype=np.int64, count=len(cpmIds))
+
+    def resize(self, capacity):
+        values = np.full((capacity, self.windowSize), np.nan)
+        values[:len(self.values)] = self.values
+        self.values = values
+        for name in ["positions", "counts", "strikes"]:
+            array = np.zeros(capacity, dtype=np.int64)
+            array[:len(getattr(self, name))] = getattr(self, name)
+            setattr(self, name, array)
+
+    # Adds the values to the windows of their rows. A row appearing several times gets its values in order, of
+    # which only the last windowSize are kept.
+    def append(self, rows, values):
+        if len(rows) == 0:
+            return
+        order = np.argsort(rows, kind="stable")
+        rows, values = rows[order], values[order]
+        uniqueRows, starts, sizes = np.unique(rows, return_index=True, return_counts=True)
+        ranks = np.arange(len(rows)) - np.repeat(starts, sizes)
+        kept = ranks >= np.repeat(sizes, sizes) - self.windowSize
+        slots = (self.positions[rows] + ranks) % self.windowSize
+        self.values[rows[kept], slots[kept]] = values[kept]
+        self.positions[uniqueRows] = (self.positions[uniqueRows] + sizes) % self.windowSize
+        self.counts[uniqueRows] = np.minimum(self.counts[uniqueRows] + sizes, self.windowSize)
+
+    # Median and median absolute deviation of every row of windows, counts being the number of values in each
+    # (the empty slots are NaNs). Sorting each row puts its NaNs last, so the median of a row of count values is
+    # read at the same indexes whether its window is full or not, and np.sort over the rows is several times
+    # faster than np.partition or np.nanmedian. The metrics with less than minSamples values get NaNs.
+    # Outputs: the medians, the MADs and the smallest value of each window.
+    def statistics(self, windows, counts):
+        lower, upper = np.maximum(counts - 1, 0)[:, None] // 2, counts[:, None] // 2
+        ordered = np.sort(windows, axis=1)
+        medians = (np.take_along_axis(ordered, lower, axis=1) + np.take_along_axis(ordered, upper, axis=1))[:, 0] / 2
+        deviations = np.sort(np.abs(windows - medians[:, None]), axis=1)
+        mads = (np.take_along_axis(deviations, lower, axis=1) + np.take_along_axis(deviations, upper, axis=1))[:, 0] / 2
+        tooFew = counts < self.minSamples
+        medians[tooFew], mads[tooFew] = np.nan, np.nan
+        return medians, mads, ordered[:, 0]
+
+    # Screens the values of a cycle, and adds the accepted ones to the windows of their metrics.
+    # Inputs: list of (currencyPairMetricId, value), each metric at most once
+    # Outputs: the list of the accepted (currencyPairMetricId, value), the list of the suspect
+    # (currencyPairMetricId, value, median, mad, reason), reason being invalid or outlier, and the list of the
+    # accepted values that reset their metric, in the same shape with the reason reset
+    def screen(self, cycleValues):
+        if len(cycleValues) == 0:
+            return [], [], []
+        rows = self.rowsFor([cpmId for cpmId, value in cycleValues])
+        values = toFloats([value for cpmId, value in cycleValues])
+        medians, mads, smallest = self.statistics(self.values[rows], self.counts[rows])
+
+        invalid = ~np.isfinite(values)
+        with np.errstate(invalid="ignore"):
+            scales = np.maximum(MAD_SCALE * mads, self.relativeFloor * np.abs(medians))
+            deviations = np.abs(values - medians)
+            farFromSpread = deviations > self.madThreshold * scales
+            signed = (smallest < 0) | (values < 0)
+            offLevel = np.where(signed, deviations > self.factor * scales,
+                                (values >= self.factor * medians) | (medians >= self.factor * values))
+            outlier = ~invalid & (scales > 0) & farFromSpread & offLevel
+
+        # Accepting the value that makes resetAfter outliers in a row, after emptying the window of its metric.
+        # An invalid value neither counts as an outlier nor breaks a row of them.
+        self.strikes[rows] = np.where(outlier, self.strikes[rows] + 1, np.where(invalid, self.strikes[rows], 0))
+        reset = outlier & (self.strikes[rows] >= self.resetAfter)
+        resetValues = [(cycleValues[i][0], float(values[i]), nullable(medians[i]), nullable(mads[i]), "reset")
+                       for i in np.flatnonzero(reset)]
+        if reset.any():
+            resetRows = rows[reset]
+            self.values[resetRows] = np.nan
+            self.positions[resetRows], self.counts[resetRows], self.strikes[resetRows] = 0, 0, 0
+            outlier &= ~reset
+
+        accepted = ~(invalid | outlier)
+        self.append(rows[accepted], values[accepted])
+        if accepted.all():
+            return cycleValues, [], resetValues
+        acceptedValues = [cycleValues[i] for i in np.flatnonzero(accepted)]
+        suspectValues = [(cycleValues[i][0], None if invalid[i] else float(values[i]), nullable(medians[i]), nullable(mads[i]),
+                          "invalid" if invalid[i] else "outlier") for i in np.flatnonzero(~accepted)]
+        return acceptedValues, suspectValues, resetValues
+
+    # Forgets the metrics that are no longer being tracked so a long-running process does not grow forever.
+    def retain(self, activeIds):
+        activeIds = set(activeIds)
+        kept = [cpmId for cpmId in self.rows.keys() if cpmId in activeIds]
+        keptRows = np.array([self.rows[cpmId] for cpmId in kept], dtype=np.int64)
+        self.rows = {cpmId: row for row, cpmId in enumerate(kept)}
+        self.values = self.values[keptRows]
+        self.positions, self.counts, self.strikes = self.positions[keptRows], self.counts[keptRows], self.strikes[keptRows]
+        if len(self.counts) == 0:
+            self.resize(1)
+
+
+# The values extracted from a summary are whatever its json held: anything that is not a number is invalid.
+def toFloats(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([toFloat(value) for value in values], dtype=np.float64)
+
+
+def toFloat(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def nullable(number):
+    return float(number) if np.isfinite(number) else None
@@ -0,0 +1,132 @@
+import datetime
+import os
+import socket
+import threading
+import zlib
+import pymysql
+
+# Splits the (market, pair) keys between cooperating poller workers so the workload can be scaled horizontally.
+# Every key goes to the worker with the highest crc32 weight for it (rendezvous hashing), which everyone computes
+# the same way from the same list of workers, and which only moves the keys of the workers that joined or left.
+# The list of workers is either static (WORKER_SHARD_INDEX out of WORKER_SHARD_COUNT) or the live leases of
+# crypto.PollerLease (migrations/0004), which the daemons keep renewing from a background thread.
+
+leaseRenewQuery = """
+    INSERT INTO crypto.PollerLease (workerId, acquiredAt, expiresAt)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+    acquiredAt = IF(expiresAt < VALUES(acquiredAt), VALUES(acquiredAt), acquiredAt),
+    expiresAt = VALUES(expiresAt)
+"""
+
+# Every process leases under its own id, so the leases of the workers that died without releasing them are
+# deleted by the live ones once they have been expired for this long.
+expiredLeaseRetention = datetime.timedelta(hours=1)
+
+expiredLeaseDeleteQuery = "DELETE FROM crypto.PollerLease WHERE expiresAt < %s"
+
+
+def pairWeight(market, pair, worker):
+    return zlib.crc32(f"{worker}/{market}/{pair}".encode())
+
+
+# Returns the worker, out of workers, responsible for the market/pair.
+def ownerOf(market, pair, workers):
+    return max(workers, key=lambda worker: (pairWeight(market, pair, worker), str(worker)))
+
+
+# Keeps the active metric rows (cpm.id, pair, market, ...) whose market/pair belong to the worker.
+def metricsForWorker(currentMetrics, worker, workers):
+    owners = {}
+    owned = []
+    for row in currentMetrics:
+        key = (row[2], row[1])
+        if key not in owners:
+            owners[key] = ownerOf(key[0], key[1], workers)
+        if owners[key] == worker:
+            owned.append(row)
+    return owned
+
+
+def defaultWorkerId():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+# Fixed shards, ex: one per replica of a StatefulSet or an indexed Job, configured through the environment.
+class StaticShards:
+    def __init__(self, shardIndex, shardCount):
+        self.shardIndex = shardIndex
+        self.shardCount = shardCount
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def workers(self, cursor, scheduled):
+        return list(range(self.shardCount))
+
+    def workerId(self):
+        return self.shardIndex
+
+
+# Shards leased in MySQL: every worker renews its own lease every ttlSeconds / 3 from a background thread with
+# its own connection, and the workers of a cycle are the ones whose lease was valid at the cycle's boundary.
+# Judging every lease at the boundary rather than at read time gives all of the workers the same list for a
+# cycle, and as the ttl is shorter than the cadence, the pairs of a worker that died are picked up by the others
+# on the next cycle. A worker that stops cleanly releases its lease right away, and the leases left behind by the
+# others are deleted an hour after they expired.
+class LeaseShards:
+    def __init__(self, connect, workerId, ttlSeconds):
+        self.connect = connect
+        self.id = workerId
+        self.ttlSeconds = ttlSeconds
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def renew(self, cursor):
+        now = datetime.datetime.now()
+        cursor.execute(leaseRenewQuery, (self.id, now, now + datetime.timedelta(seconds=self.ttlSeconds)))
+        cursor.execute(expiredLeaseDeleteQuery, (now - expiredLeaseRetention,))
+
+    def heartbeat(self):
+        db = None
+        while not self.stopEvent.is_set():
+            try:
+                if db == None:
+                    db = self.connect()
+                self.renew(db.cursor())
+            except pymysql.MySQLError as e:
+                print(f"Error while renewing the lease of {self.id}: {e}")
+                db = None
+            self.stopEvent.wait(self.ttlSeconds / 3)
+        if db != None:
+            db.cursor().execute("DELETE FROM crypto.PollerLease WHERE workerId = %s", (self.id,))
+            db.close()
+
+    # Takes the lease before returning, so the worker already counts for its first cycle.
+    def start(self):
+        db = self.connect()
+        self.renew(db.cursor())
+        db.close()
+        self.thread = threading.Thread(target=self.heartbeat, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread != None:
+            self.thread.join()
+
+    # Inputs: the cursor and the epoch seconds of the cycle's boundary.
+    # Outputs: the sorted ids of the workers whose lease was valid at the boundary. Every worker computes the
+    # same list, so one whose own lease was not valid (ex: it started late or failed to renew) is not in it and
+    # has to sit the cycle out rather than take a share of the pairs the others do not know about.
+    def workers(self, cursor, scheduled):
+        boundary = datetime.datetime.fromtimestamp(scheduled)
+        cursor.execute("SELECT workerId FROM crypto.PollerLease WHERE acquiredAt <= %s AND expiresAt > %s",
+                       (boundary, boundary))
+        return sorted(set(row[0] for row in cursor.fetchall()))
+
+    def workerId(self):
+        return self.id
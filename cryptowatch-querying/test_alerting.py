@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+from alerting import RollingAlertEngine, RollingWindow
+
+START = datetime.datetime(2026, 1, 1)
+
+
+def minutes(count):
+    return START + datetime.timedelta(minutes=count)
+
+
+def test_window_average_follows_appends_and_expiry():
+    window = RollingWindow(4)
+    for when, value in [(1, 1.0), (2, 2.0), (3, 3.0)]:
+        window.append(when, value)
+    assert window.average() == 2.0
+    window.expire(2)
+    assert window.count == 1 and window.average() == 3.0
+    window.expire(3)
+    assert window.count == 0 and window.average() == 0 and window.total == 0.0
+
+
+def test_full_window_drops_its_oldest_value():
+    window = RollingWindow(3)
+    for when in range(5):
+        window.append(when, float(when))
+    assert window.count == 3 and window.average() == 3.0
+    window.expire(2)
+    assert window.count == 2 and window.average() == 3.5
+
+
+def test_engine_alerts_on_a_value_far_above_the_average():
+    engine = RollingAlertEngine(3600, 60, 0.25, 3)
+    for i in range(60):
+        assert engine.observe(1, 10.0, minutes(i)) == (False, 0)
+    toSendAlert, previousAverage = engine.observe(1, 31.0, minutes(60))
+    assert toSendAlert and previousAverage == pytest.approx(10.0)
+
+
+def test_engine_does_not_trust_a_window_missing_too_many_values():
+    engine = RollingAlertEngine(3600, 60, 0.25, 3)
+    for i in range(40):
+        engine.observe(1, 10.0, minutes(i))
+    assert engine.observe(1, 100.0, minutes(40)) == (False, 0)
+
+
+def test_fill_keeps_the_window_and_retain_forgets_metrics():
+    engine = RollingAlertEngine(1800, 30, 0.25, 3)
+    rows = [(cpmId, minutes(i), 1.0) for cpmId in (1, 2) for i in range(60)]
+    engine.fill(rows, minutes(60))
+    assert engine.windows[1].count == 29 and engine.windows[2].count == 29
+    engine.retain([2])
+    assert list(engine.windows.keys()) == [2]
+
+
+def test_aggregated_entry_counts_all_of_its_values():
+    window = RollingWindow(3)
+    window.append(1, 30.0, 3)
+    window.append(2, 4.0)
+    assert window.entries == 2 and window.count == 4 and window.average() == 8.5
+    window.expire(1)
+    assert window.entries == 1 and window.count == 1 and window.average() == 4.0
+
+
+def test_fill_totals_gives_the_same_alerts_as_the_raw_rows():
+    rows = [(1, minutes(i), 10.0) for i in range(60)] + [(2, minutes(i), 10.0) for i in range(30, 60)]
+    totals = [(1, 600.0, 60, minutes(59)), (2, 300.0, 30, minutes(59))]
+    alerts = []
+    for cpmId, value in [(1, 31.0), (1, 29.0), (2, 31.0)]:
+        raw, aggregated = RollingAlertEngine(3600, 60, 0.25, 3), RollingAlertEngine(3600, 60, 0.25, 3)
+        raw.fill(rows, minutes(60))
+        aggregated.fillTotals(totals)
+        alerts.append(aggregated.observe(cpmId, value, minutes(60)))
+        assert alerts[-1] == raw.observe(cpmId, value, minutes(60))
+    # Metric 2 misses half of its window.
+    assert [toSendAlert for toSendAlert, previousAverage in alerts] == [True, False, False]
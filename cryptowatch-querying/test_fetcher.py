@@ -0,0 +1,27 @@
+import pytest
+
+from fetcher import extractMetricValue, groupMetricsByPair
+
+SUMMARY = {"result": {"price": {"last": 101.5, "change": {"percentage": -0.02, "absolute": -2.1}}, "volume": 1234.5}}
+
+
+def test_metrics_are_grouped_by_market_and_pair_in_query_order():
+    rows = [(1, "btcusd", "kraken", "price", "last", None), (2, "ethusd", "kraken", "volume", None, None),
+            (3, "btcusd", "binance", "price", "last", None), (4, "btcusd", "kraken", "price", "change", "percentage")]
+    metricsByPair = groupMetricsByPair(rows)
+    assert list(metricsByPair.keys()) == [("kraken", "btcusd"), ("kraken", "ethusd"), ("binance", "btcusd")]
+    assert metricsByPair[("kraken", "btcusd")] == [(1, "price", "last", None), (4, "price", "change", "percentage")]
+    assert groupMetricsByPair([]) == {}
+
+
+def test_values_are_read_at_every_depth_of_the_summary():
+    assert extractMetricValue(SUMMARY, "volume", None, None) == 1234.5
+    assert extractMetricValue(SUMMARY, "price", "last", None) == 101.5
+    assert extractMetricValue(SUMMARY, "price", "change", "percentage") == -0.02
+
+
+def test_value_missing_from_the_summary_raises():
+    with pytest.raises(KeyError):
+        extractMetricValue(SUMMARY, "price", "high", None)
+    with pytest.raises(KeyError):
+        extractMetricValue({"error": "Instrument not found"}, "volume", None, None)
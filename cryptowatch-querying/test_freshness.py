@@ -0,0 +1,58 @@
+import datetime
+
+from freshness import pairFreshnessQuery, classifyPairs
+
+GAP = 240
+RETRY_AT = datetime.datetime(2026, 1, 2, 12, 30)
+
+
+# crypto.PairFreshness joined with the tracked metrics, answering pairFreshnessQuery the way MySQL would: only
+# the market/pairs some user still tracks are returned.
+class FakeFreshnessCursor:
+    def __init__(self, rows, tracked):
+        self.rows = rows
+        self.tracked = tracked
+        self.result = []
+
+    def execute(self, query, params=None):
+        assert query == pairFreshnessQuery
+        self.result = [row for row in self.rows if (row[0], row[1]) in self.tracked]
+
+    def fetchall(self):
+        return self.result
+
+
+def freshnessRow(pair, workerId, attemptAge, successAge, failures=0, retryAge=None):
+    retryAt = RETRY_AT if retryAge != None else None
+    return ("kraken", pair, workerId, failures, "timed out" if failures > 0 else None, retryAt, attemptAge, successAge, retryAge)
+
+
+def staleReasons(rows, tracked, workerAges):
+    cursor = FakeFreshnessCursor(rows, tracked)
+    cursor.execute(pairFreshnessQuery)
+    stalePairs, pairsByMarket, freshByMarket = classifyPairs(cursor.fetchall(), workerAges, GAP)
+    return {pair: reason for market, pair, reason in stalePairs}
+
+
+def test_untracked_pair_is_not_reported_as_stale():
+    # btcusd was untracked 50 minutes ago: its cron worker of the time has not run since, and no one polls it.
+    rows = [freshnessRow("btcusd", "host-42", 3000, 3000), freshnessRow("ethusd", "shard-0", 30, 30)]
+    assert staleReasons(rows, {("kraken", "ethusd")}, {"shard-0": 30}) == {}
+
+
+def test_pair_of_a_stopped_shard_is_reported():
+    rows = [freshnessRow("btcusd", "shard-1", 3000, 3000), freshnessRow("ethusd", "shard-0", 30, 30)]
+    reasons = staleReasons(rows, {("kraken", "btcusd"), ("kraken", "ethusd")}, {"shard-0": 30, "shard-1": 3000})
+    assert reasons == {"btcusd": "not polled for 3000 seconds, its worker shard-1 stopped"}
+
+
+def test_pair_left_by_a_live_worker_is_not_reported():
+    rows = [freshnessRow("btcusd", "shard-0", 3000, 3000)]
+    assert staleReasons(rows, {("kraken", "btcusd")}, {"shard-0": 30}) == {}
+
+
+def test_open_circuit_is_reported_whatever_worker_last_probed_it():
+    # The probe is due in ten minutes, and the worker that opened the circuit has been replaced since.
+    rows = [freshnessRow("deadusd", "host-42", 1200, None, failures=5, retryAge=-600)]
+    reasons = staleReasons(rows, {("kraken", "deadusd")}, {"host-43": 30})
+    assert reasons["deadusd"].startswith("circuit open after 5 failures")
@@ -0,0 +1,114 @@
+import datetime
+
+import pytest
+
+from ingestion import insertMetricValues, insertionQuery, quarantineQuery, rollupQuery, selectForMetrics
+
+CYCLE = datetime.datetime(2026, 1, 2, 12, 1)
+
+
+# Records the statements of a transaction, and only keeps them once it is committed. failOn makes the executemany
+# of that query raise, the way a dropped connection would.
+class FakeIngestionDb:
+    def __init__(self, failOn=None):
+        self.failOn = failOn
+        self.pending = []
+        self.committed = []
+        self.rolledBack = False
+
+    def cursor(self):
+        return self
+
+    def begin(self):
+        self.pending = []
+
+    def commit(self):
+        self.committed += self.pending
+
+    def rollback(self):
+        self.pending = []
+        self.rolledBack = True
+
+    def close(self):
+        pass
+
+    def executemany(self, query, rows):
+        if query == self.failOn:
+            raise ConnectionError("Lost connection to MySQL server during query")
+        self.pending.append((query, list(rows)))
+
+    def statements(self, query):
+        return [rows for statementQuery, rows in self.committed if statementQuery == query]
+
+
+def test_values_are_inserted_in_chunks_stamped_with_the_cycle():
+    db = FakeIngestionDb()
+    cycleValues = [(cpmId, float(cpmId)) for cpmId in range(1, 8)]
+    assert insertMetricValues(db, cycleValues, CYCLE, 3) == 7
+    inserts = db.statements(insertionQuery)
+    assert [len(rows) for rows in inserts] == [3, 3, 1]
+    assert [row for rows in inserts for row in rows] == [(cpmId, value, CYCLE) for cpmId, value in cycleValues]
+
+
+def test_chunk_size_dividing_the_cycle_has_no_empty_statement():
+    db = FakeIngestionDb()
+    insertMetricValues(db, [(cpmId, 1.0) for cpmId in range(6)], CYCLE, 3)
+    assert [len(rows) for rows in db.statements(insertionQuery)] == [3, 3]
+    insertMetricValues(db, [(1, 1.0)], CYCLE, 1000)
+    assert [len(rows) for rows in db.statements(insertionQuery)] == [3, 3, 1]
+
+
+def test_values_are_rolled_up_into_the_bucket_of_the_cycle():
+    db = FakeIngestionDb()
+    insertMetricValues(db, [(1, 10.0), (2, 20.0)], CYCLE, 1)
+    assert db.statements(rollupQuery.format(table="MetricValueHourly")) == [[(1, datetime.datetime(2026, 1, 2, 12), 10.0, 10.0, 10.0, 10.0, 10.0, 1)],
+                                                                          [(2, datetime.datetime(2026, 1, 2, 12), 20.0, 20.0, 20.0, 20.0, 20.0, 1)]]
+    assert [rows[0][1] for rows in db.statements(rollupQuery.format(table="MetricValueDaily"))] == [datetime.datetime(2026, 1, 2)] * 2
+
+
+def test_quarantined_values_and_resets_are_written_with_the_cycle():
+    db = FakeIngestionDb()
+    # The value of the reset is written like any accepted value, and recorded in the quarantine table as well.
+    quarantined = [(2, None, None, None, "invalid"), (3, 100000.0, 100.0, 0.5, "outlier"), (4, 5000.0, 50.0, 0.2, "reset")]
+    assert insertMetricValues(db, [(1, 10.0), (4, 5000.0)], CYCLE, 2, quarantined) == 2
+    assert db.statements(quarantineQuery) == [[(2, None, None, None, "invalid", CYCLE), (3, 100000.0, 100.0, 0.5, "outlier", CYCLE)],
+                                              [(4, 5000.0, 50.0, 0.2, "reset", CYCLE)]]
+    assert [row[0] for rows in db.statements(insertionQuery) for row in rows] == [1, 4]
+
+
+def test_cycle_with_only_quarantined_values_is_still_written():
+    db = FakeIngestionDb()
+    assert insertMetricValues(db, [], CYCLE, 10, [(3, 100000.0, 100.0, 0.5, "outlier")]) == 0
+    assert db.statements(insertionQuery) == [] and len(db.statements(quarantineQuery)) == 1
+    assert insertMetricValues(FakeIngestionDb(), [], CYCLE, 10) == 0
+
+
+def test_failing_chunk_rolls_the_whole_cycle_back():
+    db = FakeIngestionDb(failOn=quarantineQuery)
+    with pytest.raises(ConnectionError):
+        insertMetricValues(db, [(1, 10.0)], CYCLE, 10, [(3, 100000.0, 100.0, 0.5, "outlier")])
+    assert db.rolledBack and db.committed == []
+
+
+# Answers every SELECT with one row per metric id of its IN list, recording the statements.
+class FakeSelectCursor:
+    def __init__(self):
+        self.statements = []
+        self.result = []
+
+    def execute(self, query, params):
+        self.statements.append((query, params))
+        self.result = [(cpmId, params[0]) for cpmId in params[1:]]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_select_for_metrics_reads_the_sorted_ids_in_chunks():
+    cursor = FakeSelectCursor()
+    query = "SELECT currencyPairMetricId, %s FROM crypto.MetricValue WHERE currencyPairMetricId in ({cpmIds})"
+    rows = selectForMetrics(cursor, query, (CYCLE,), {5, 1, 4, 2, 3}, 2)
+    assert rows == [(cpmId, CYCLE) for cpmId in range(1, 6)]
+    assert [params for statement, params in cursor.statements] == [(CYCLE, 1, 2), (CYCLE, 3, 4), (CYCLE, 5)]
+    assert cursor.statements[-1][0].endswith("in (%s)")
+    assert selectForMetrics(cursor, query, (CYCLE,), [], 2) == [] and len(cursor.statements) == 3
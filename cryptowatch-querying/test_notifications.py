@@ -0,0 +1,194 @@
+import datetime
+import time
+
+from notifications import MAX_PERSONALIZATIONS, RateLimiter, StubTransport, buildAlertMails, deliverAlerts, enqueueAlerts
+
+CYCLE = datetime.datetime(2026, 1, 1, 12)
+
+
+# crypto.AlertOutbox and the recipients of each metric in memory, answering the queries of notifications.py the way
+# MySQL would. The alerts of the metrics in recentlySent had an alert sent within the cooldown.
+class FakeOutboxDb:
+    def __init__(self, recipients, recentlySent=()):
+        self.recipients = recipients
+        self.recentlySent = set(recentlySent)
+        self.alerts = {}
+        self.result = []
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def executemany(self, query, rows):
+        for cpmId, previousValue, currentValue, cycleTime in rows:
+            if not any(alert["cpmId"] == cpmId and alert["cycleTime"] == cycleTime for alert in self.alerts.values()):
+                self.alerts[len(self.alerts) + 1] = {"cpmId": cpmId, "previousValue": previousValue, "currentValue": currentValue,
+                                                     "cycleTime": cycleTime, "attempts": 0, "status": "pending",
+                                                     "claimToken": None, "lastError": None, "deliveredThrough": None}
+
+    def execute(self, query, params=None):
+        if "SET status = 'sending'" in query:
+            token, batchSize = params
+            for alertId in sorted(self.alerts)[:]:
+                alert = self.alerts[alertId]
+                if alert["status"] == "pending" and batchSize > 0:
+                    alert["status"], alert["claimToken"] = "sending", token
+                    batchSize -= 1
+        elif "SELECT id, currencyPairMetricId" in query:
+            self.result = [(alertId, alert["cpmId"], alert["previousValue"], alert["currentValue"], alert["cycleTime"], alert["attempts"],
+                            alert["deliveredThrough"])
+                           for alertId, alert in sorted(self.alerts.items())
+                           if alert["claimToken"] == params[0] and alert["status"] == "sending"]
+        elif "SELECT DISTINCT currencyPairMetricId FROM crypto.AlertOutbox" in query:
+            self.result = [(cpmId,) for cpmId in params[1:] if cpmId in self.recentlySent]
+        elif "FROM crypto.UserCurrencyPairMetric" in query:
+            self.result = [(cpmId,) + recipient for cpmId in params for recipient in self.recipients.get(cpmId, [])]
+        elif "SET deliveredThrough" in query:
+            email, alertId = params
+            self.alerts[alertId]["deliveredThrough"] = email
+        elif "SET status = %s" in query:
+            status, error = params[0], params[1]
+            for alertId in params[2:]:
+                alert = self.alerts[alertId]
+                alert["status"], alert["lastError"], alert["claimToken"] = status, error, None
+                if status in ["pending", "failed"]:
+                    alert["attempts"] += 1
+
+    def fetchall(self):
+        return self.result
+
+    def statuses(self):
+        return {alertId: alert["status"] for alertId, alert in self.alerts.items()}
+
+
+# Fails every send of the alerts of the given pairs.
+class FailingTransport(StubTransport):
+    def __init__(self, failingPairs):
+        super().__init__()
+        self.failingPairs = failingPairs
+
+    def send(self, mail):
+        if any(pair in mail["subject"] for pair in self.failingPairs):
+            raise RuntimeError("SendGrid answered 503")
+        return super().send(mail)
+
+
+# Fails the given number of sends, the first ones excepted.
+class FlakyTransport(StubTransport):
+    def __init__(self, succeedFirst, failures):
+        super().__init__()
+        self.succeedFirst = succeedFirst
+        self.failures = failures
+
+    def send(self, mail):
+        if len(self.sent) >= self.succeedFirst and self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("SendGrid answered 503")
+        return super().send(mail)
+
+
+def recipient(name, pair):
+    return (f"{name}@example.com", name, "Doe", "price", pair, "kraken")
+
+
+def alert(cpmId, previousValue, currentValue):
+    return {'currencyPairMetricId': cpmId, 'previousValue': previousValue, 'currentValue': currentValue}
+
+
+def deliver(db, transport, maxAttempts=3, cooldownMinutes=60):
+    return deliverAlerts(db, transport, RateLimiter(0), 100, cooldownMinutes, maxAttempts, 300, 3, 1)
+
+
+def test_alerts_are_sent_once_per_metric_to_all_of_their_recipients():
+    db = FakeOutboxDb({1: [recipient("ann", "btcusd"), recipient("bob", "btcusd")], 2: [recipient("cat", "ethusd")]})
+    assert enqueueAlerts(db, [alert(1, 10, 40), alert(2, 5, 20)], CYCLE) == 2
+    enqueueAlerts(db, [alert(1, 10, 50)], CYCLE + datetime.timedelta(minutes=1))
+    transport = StubTransport()
+    report = deliver(db, transport)
+    assert report == {"claimed": 3, "sent": 2, "suppressed": 1, "skipped": 0, "failed": 0, "requests": 2}
+    # Only the latest alert of the metric 1 is sent.
+    assert db.statuses() == {1: "suppressed", 2: "sent", 3: "sent"}
+    btcMail = [mail for mail in transport.sent if "btcusd" in mail["subject"]][0]
+    assert [p["to"][0]["email"] for p in btcMail["personalizations"]] == ["ann@example.com", "bob@example.com"]
+    assert btcMail["personalizations"][1]["substitutions"] == {"-firstName-": "bob", "-lastName-": "Doe"}
+    assert "value of 50" in btcMail["content"][0]["value"]
+
+
+def test_enqueuing_a_metric_twice_for_a_cycle_is_ignored():
+    db = FakeOutboxDb({})
+    enqueueAlerts(db, [alert(1, 10, 40)], CYCLE)
+    enqueueAlerts(db, [alert(1, 10, 40)], CYCLE)
+    assert len(db.alerts) == 1
+    assert enqueueAlerts(db, [], CYCLE) == 0
+
+
+def test_metric_in_its_cooldown_is_suppressed():
+    db = FakeOutboxDb({1: [recipient("ann", "btcusd")]}, recentlySent=[1])
+    enqueueAlerts(db, [alert(1, 10, 40)], CYCLE)
+    transport = StubTransport()
+    assert deliver(db, transport)["suppressed"] == 1
+    assert transport.sent == [] and db.statuses() == {1: "suppressed"}
+
+
+def test_metric_nobody_tracks_anymore_is_skipped():
+    db = FakeOutboxDb({})
+    enqueueAlerts(db, [alert(1, 10, 40)], CYCLE)
+    assert deliver(db, StubTransport())["skipped"] == 1
+    assert db.statuses() == {1: "skipped"}
+
+
+def test_failed_send_is_retried_until_max_attempts():
+    db = FakeOutboxDb({1: [recipient("ann", "btcusd")], 2: [recipient("cat", "ethusd")]})
+    enqueueAlerts(db, [alert(1, 10, 40), alert(2, 5, 20)], CYCLE)
+    transport = FailingTransport(["btcusd"])
+    report = deliver(db, transport, maxAttempts=2)
+    assert report["failed"] == 1 and report["sent"] == 1
+    assert db.statuses() == {1: "pending", 2: "sent"}
+    assert db.alerts[1]["attempts"] == 1 and "503" in db.alerts[1]["lastError"]
+    assert deliver(db, transport, maxAttempts=2)["claimed"] == 1
+    assert db.statuses() == {1: "failed", 2: "sent"} and db.alerts[1]["attempts"] == 2
+    assert deliver(db, transport, maxAttempts=2)["claimed"] == 0
+
+
+def test_retry_of_a_chunked_send_skips_the_chunks_already_delivered():
+    recipients = [recipient(f"user{i:04d}", "btcusd") for i in range(MAX_PERSONALIZATIONS + 1)]
+    db = FakeOutboxDb({1: list(reversed(recipients))})
+    enqueueAlerts(db, [alert(1, 10, 40)], CYCLE)
+    transport = FlakyTransport(1, 1)
+    assert deliver(db, transport)["failed"] == 1
+    assert db.statuses() == {1: "pending"} and db.alerts[1]["deliveredThrough"] == recipients[MAX_PERSONALIZATIONS - 1][0]
+    report = deliver(db, transport)
+    assert report["sent"] == 1 and report["requests"] == 1
+    emails = [p["to"][0]["email"] for mail in transport.sent for p in mail["personalizations"]]
+    assert sorted(emails) == [r[0] for r in recipients]
+
+
+def test_stub_transport_appends_the_requests_to_its_file(tmp_path):
+    path = tmp_path / "alerts.jsonl"
+    transport = StubTransport(str(path))
+    mail = buildAlertMails([recipient("ann", "btcusd")], 10, 40, 3, 1)[0]
+    assert transport.send(mail) == 202
+    transport.send(mail)
+    assert len(path.read_text().splitlines()) == 2 and transport.sent == [mail, mail]
+
+
+def test_mails_are_split_into_chunks_of_personalizations():
+    recipients = [recipient(f"user{i}", "btcusd") for i in range(MAX_PERSONALIZATIONS + 1)]
+    mails = buildAlertMails(recipients, 0, 40, 3, 1)
+    assert [len(mail["personalizations"]) for mail in mails] == [MAX_PERSONALIZATIONS, 1]
+    assert "growth of n/a" in mails[0]["content"][0]["value"]
+
+
+def test_rate_limiter_spaces_the_requests_out():
+    limiter = RateLimiter(20)
+    start = time.monotonic()
+    for i in range(4):
+        limiter.wait()
+    assert time.monotonic() - start >= 3 / 20 * 0.9
+    unlimited = RateLimiter(0)
+    start = time.monotonic()
+    for i in range(100):
+        unlimited.wait()
+    assert time.monotonic() - start < 0.1
@@ -0,0 +1,78 @@
+import datetime
+
+from ranking import rankAggregationQuery, rankByStandardDeviation, rankUpsertQuery, refreshMetricRanks
+
+CYCLE = datetime.datetime(2026, 1, 2, 12)
+
+
+# crypto.MetricValue rows of (currencyPairMetricId, market, metricTypeId, queriedAt, value) and crypto.MetricRank
+# in memory, answering the queries of refreshMetricRanks the way MySQL would.
+class FakeRankDb:
+    def __init__(self, values, ranks=None):
+        self.values = values
+        self.ranks = dict(ranks or {})
+        self.result = []
+        self.committed = False
+
+    def cursor(self):
+        return self
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute(self, query, params=None):
+        if query == rankAggregationQuery:
+            start, end = params
+            groups = {}
+            for cpmId, market, metricTypeId, queriedAt, value in self.values:
+                if start < queriedAt <= end:
+                    groups.setdefault((cpmId, market, metricTypeId), []).append(value)
+            self.result = []
+            for key, values in groups.items():
+                mean = sum(values) / len(values)
+                self.result.append(key + ((sum((value - mean) ** 2 for value in values) / len(values)) ** 0.5,))
+        elif query.startswith("DELETE FROM crypto.MetricRank"):
+            self.ranks = {cpmId: rank for cpmId, rank in self.ranks.items() if rank[-1] >= params[0]}
+
+    def executemany(self, query, rows):
+        assert query == rankUpsertQuery
+        for row in rows:
+            self.ranks[row[0]] = row[1:]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_ranks_are_ordered_by_deviation_within_each_market_and_type():
+    ranks = rankByStandardDeviation([(1, "kraken", 1, 0.5), (2, "kraken", 1, 2.0), (3, "kraken", 2, 1.0), (4, "kraken", 1, 1.0), (5, "binance", 1, 9.0)])
+    assert sorted(ranks) == [(1, "kraken", 1, 0.5, 3, 3), (2, "kraken", 1, 2.0, 1, 3), (3, "kraken", 2, 1.0, 1, 1),
+                             (4, "kraken", 1, 1.0, 2, 3), (5, "binance", 1, 9.0, 1, 1)]
+
+
+def test_ties_are_ranked_by_metric_whatever_the_row_order():
+    rows = [(3, "kraken", 1, 1.0), (1, "kraken", 1, 1.0), (2, "kraken", 1, None), (4, "kraken", 1, 2.0)]
+    for ordered in [rows, list(reversed(rows))]:
+        assert [(cpmId, rankNum) for cpmId, market, metricTypeId, stddev, rankNum, rankDenom in rankByStandardDeviation(ordered)] == \
+            [(4, 1), (1, 2), (3, 3), (2, 4)]
+
+
+def test_only_the_values_of_the_lookback_are_ranked():
+    values = [(1, "kraken", 1, CYCLE - datetime.timedelta(minutes=i), 100.0 + i % 2) for i in range(60)]
+    # Metric 2 swung wildly in the hour before the lookback, that retention.py has not removed yet.
+    values += [(2, "kraken", 1, CYCLE - datetime.timedelta(hours=24, minutes=i), 1000.0 * (i % 2)) for i in range(1, 60)]
+    values += [(2, "kraken", 1, CYCLE - datetime.timedelta(minutes=i), 100.0) for i in range(60)]
+    # Metric 3 only has values before the lookback: its rank of the previous cycle is removed.
+    values += [(3, "kraken", 1, CYCLE - datetime.timedelta(hours=25), 1.0)]
+    db = FakeRankDb(values, {3: ("kraken", 1, 0.0, 1, 1, CYCLE, CYCLE - datetime.timedelta(minutes=1))})
+    assert refreshMetricRanks(db, CYCLE, 1, 24) == 2
+    assert db.committed
+    assert {cpmId: rank[3:5] for cpmId, rank in db.ranks.items()} == {1: (1, 2), 2: (2, 2)}
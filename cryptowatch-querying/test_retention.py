@@ -0,0 +1,168 @@
+import datetime
+
+from partitions import partitionName, partitionsQuery
+from retention import deleteExpiredChunks, dropExpiredPartitions, incompleteRollupQuery, retentionCutoff, rollupExpiredHours
+
+NOW = datetime.datetime(2026, 1, 2, 12, 30)
+
+
+def hourOf(queriedAt):
+    return queriedAt.replace(minute=0, second=0, microsecond=0)
+
+
+# crypto.MetricValue and crypto.MetricValueHourly in memory, answering the queries of retention.py the way MySQL would.
+# partitionHours are the hours of the hourly partitions of MetricValue, none when it is not partitioned.
+class FakeRetentionDb:
+    def __init__(self, values, hourly=None, partitionHours=()):
+        self.values = {i + 1: value for i, value in enumerate(values)}
+        self.hourly = dict(hourly or {})
+        self.partitions = {partitionName(hour): hour for hour in partitionHours}
+        self.dropped = []
+        self.deletes = 0
+        self.rolledUp = []
+        self.daysRolledUp = []
+        self.result = []
+        self.rowcount = 0
+
+    # The partition a row is in: the first hourly partition ending after its queriedAt, which for the first one
+    # includes every older row, else pmax.
+    def partitionOf(self, queriedAt):
+        for name, hour in sorted(self.partitions.items(), key=lambda partition: partition[1]):
+            if queriedAt < hour + datetime.timedelta(hours=1):
+                return name
+        return "pmax"
+
+    def inRange(self, start, end):
+        return [(cpmId, queriedAt, value) for cpmId, queriedAt, value in self.values.values() if start <= queriedAt < end]
+
+    def execute(self, query, params=None):
+        if query == "SELECT MIN(queriedAt) FROM crypto.MetricValue":
+            self.result = [(min([queriedAt for cpmId, queriedAt, value in self.values.values()], default=None),)]
+        elif query == incompleteRollupQuery:
+            start, end, bucket = params
+            counts = {}
+            for cpmId, queriedAt, value in self.inRange(start, end):
+                counts[cpmId] = counts.get(cpmId, 0) + 1
+            self.result = [(cpmId,) for cpmId, count in sorted(counts.items()) if self.hourly.get((cpmId, bucket), {"count": 0})["count"] < count]
+        elif "REPLACE INTO crypto.MetricValueHourly" in query:
+            bucket, start, end = params[:3]
+            for cpmId in params[3:]:
+                values = [value for valueCpmId, queriedAt, value in sorted(self.inRange(start, end), key=lambda row: row[1]) if valueCpmId == cpmId]
+                self.hourly[(cpmId, bucket)] = {"mean": sum(values) / len(values), "count": len(values)}
+                self.rolledUp.append((cpmId, bucket))
+        elif "REPLACE INTO crypto.MetricValueDaily" in query:
+            self.daysRolledUp.append(params[0])
+        elif query == partitionsQuery:
+            self.result = [(name, f"TO_DAYS('{hour}')") for name, hour in sorted(self.partitions.items())] + [("pmax", "MAXVALUE")]
+        elif "information_schema.PARTITIONS" in query:
+            self.result = [(sum(1 for cpmId, queriedAt, value in self.values.values() if self.partitionOf(queriedAt) in params),)]
+        elif query.startswith("ALTER TABLE crypto.MetricValue DROP PARTITION"):
+            names = query[len("ALTER TABLE crypto.MetricValue DROP PARTITION "):].split(", ")
+            self.values = {id: row for id, row in self.values.items() if self.partitionOf(row[1]) not in names}
+            self.dropped += [self.partitions.pop(name) for name in names]
+        elif query.startswith("SELECT id FROM crypto.MetricValue"):
+            cutoff, limit = params
+            expired = sorted((queriedAt, id) for id, (cpmId, queriedAt, value) in self.values.items() if queriedAt < cutoff)
+            self.result = [(id,) for queriedAt, id in expired[:limit]]
+        elif query.startswith("DELETE FROM crypto.MetricValue WHERE id IN"):
+            self.deletes += 1
+            self.rowcount = len([id for id in params if self.values.pop(id, None) != None])
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0]
+
+
+def minuteValues(cpmId, hour, count):
+    return [(cpmId, hour + datetime.timedelta(minutes=i), float(i)) for i in range(count)]
+
+
+def test_cutoff_is_the_start_of_the_hour_that_has_not_fully_expired():
+    assert retentionCutoff(NOW, 24) == datetime.datetime(2026, 1, 1, 12)
+
+
+def test_rollups_missing_or_short_are_rolled_up_again():
+    cutoff = retentionCutoff(NOW, 24)
+    first, second = cutoff - datetime.timedelta(hours=2), cutoff - datetime.timedelta(hours=1)
+    values = minuteValues(1, first, 60) + minuteValues(2, first, 60) + minuteValues(1, second, 60) + minuteValues(1, cutoff, 30)
+    hourly = {(1, first): {"mean": 29.5, "count": 60}, (2, first): {"mean": 14.5, "count": 30}}
+    db = FakeRetentionDb(values, hourly)
+    assert rollupExpiredHours(db, cutoff) == 2
+    # Metric 2 missed half of its first hour and the second hour was never rolled up. The hour of the cutoff has
+    # not expired.
+    assert db.rolledUp == [(2, first), (1, second)]
+    assert db.hourly[(2, first)] == {"mean": 29.5, "count": 60}
+    assert db.daysRolledUp == [datetime.datetime(2026, 1, 1)]
+
+
+def test_rollup_counting_more_values_is_left_alone():
+    cutoff = retentionCutoff(NOW, 24)
+    hour = cutoff - datetime.timedelta(hours=1)
+    # A previous run rolled the hour up whole and stopped halfway through deleting it.
+    db = FakeRetentionDb(minuteValues(1, hour, 60)[30:], {(1, hour): {"mean": 29.5, "count": 60}})
+    assert rollupExpiredHours(db, cutoff) == 0
+    assert db.hourly[(1, hour)] == {"mean": 29.5, "count": 60} and db.daysRolledUp == []
+
+
+def test_rollup_of_an_empty_table_does_nothing():
+    assert rollupExpiredHours(FakeRetentionDb([]), retentionCutoff(NOW, 24)) == 0
+
+
+def test_days_of_the_hours_rolled_up_are_rebuilt_once():
+    cutoff = retentionCutoff(NOW, 24)
+    values = [(1, datetime.datetime(2025, 12, 31, hour), 1.0) for hour in range(22, 24)] + [(1, datetime.datetime(2026, 1, 1, 3), 1.0)]
+    db = FakeRetentionDb(values)
+    assert rollupExpiredHours(db, cutoff) == 3
+    assert db.daysRolledUp == [datetime.datetime(2025, 12, 31), datetime.datetime(2026, 1, 1)]
+
+
+def hoursOfValues(db):
+    return sorted(set(hourOf(queriedAt) for cpmId, queriedAt, value in db.values.values()))
+
+
+def test_chunked_delete_stops_once_nothing_expired_is_left():
+    cutoff = retentionCutoff(NOW, 24)
+    values = minuteValues(1, cutoff - datetime.timedelta(hours=2), 120) + minuteValues(1, cutoff, 30)
+    db = FakeRetentionDb(values)
+    # 120 expired rows in chunks of 50: two full chunks, a partial one, and the query finding none left.
+    assert deleteExpiredChunks(db, cutoff, 50, 0) == 120
+    assert db.deletes == 3
+    assert hoursOfValues(db) == [cutoff] and len(db.values) == 30
+
+
+def test_chunked_delete_with_nothing_expired_deletes_nothing():
+    cutoff = retentionCutoff(NOW, 24)
+    db = FakeRetentionDb(minuteValues(1, cutoff, 30))
+    assert deleteExpiredChunks(db, cutoff, 50, 0) == 0
+    assert db.deletes == 0
+
+
+def test_only_partitions_ending_by_the_cutoff_are_dropped():
+    cutoff = retentionCutoff(NOW, 24)
+    hours = [cutoff + datetime.timedelta(hours=offset) for offset in range(-3, 3)]
+    db = FakeRetentionDb([value for hour in hours[:4] for value in minuteValues(1, hour, 10)], partitionHours=hours)
+    assert dropExpiredPartitions(db, cutoff) == 30
+    assert db.dropped == hours[:3]
+    assert sorted(db.partitions.values()) == hours[3:] and hoursOfValues(db) == [cutoff]
+    # Nothing is left to drop on the next run.
+    assert dropExpiredPartitions(db, cutoff) == 0 and db.dropped == hours[:3]
+
+
+def test_rows_older_than_the_first_partition_go_with_it():
+    cutoff = retentionCutoff(NOW, 24)
+    partitioned = [cutoff - datetime.timedelta(hours=1), cutoff]
+    # Rows written before the table was partitioned sit in the first hourly partition.
+    values = minuteValues(1, cutoff - datetime.timedelta(hours=5), 10) + minuteValues(1, partitioned[0], 10) + minuteValues(1, cutoff, 10)
+    db = FakeRetentionDb(values, partitionHours=partitioned)
+    assert dropExpiredPartitions(db, cutoff) == 20
+    assert deleteExpiredChunks(db, cutoff, 4, 0) == 0
+    assert hoursOfValues(db) == [cutoff]
+
+
+def test_partition_of_the_cutoff_hour_is_kept_whatever_it_holds():
+    cutoff = retentionCutoff(NOW, 24)
+    db = FakeRetentionDb(minuteValues(1, cutoff, 10), partitionHours=[cutoff, cutoff + datetime.timedelta(hours=1)])
+    assert dropExpiredPartitions(db, cutoff) == 0
+    assert db.dropped == [] and len(db.partitions) == 2
@@ -0,0 +1,111 @@
+from scheduler import CadenceScheduler, currentBoundary
+
+
+# Clock of the scheduler, moved forward by the runs of the task and by the waits of the loop instead of the time
+# actually going by.
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# Stands in for the stop event of the scheduler: waiting moves the clock to the end of the wait right away.
+class FakeStopEvent:
+    def __init__(self, clock):
+        self.clock = clock
+        self.stopped = False
+
+    def wait(self, seconds):
+        self.clock.now += seconds
+        return self.stopped
+
+    def set(self):
+        self.stopped = True
+
+    def is_set(self):
+        return self.stopped
+
+
+# Runs the scheduler with the fake clock starting at now, until the task ran runs times. The task takes
+# durations[i] seconds for its i-th run (0 past the end of durations).
+# Outputs: the boundaries the task ran for, and the scheduler.
+def runScheduler(scheduler, now, durations, runs):
+    clock = FakeClock(now)
+    scheduler.clock = clock
+    scheduler.stopEvent = FakeStopEvent(clock)
+    ran = []
+
+    def task(scheduled):
+        clock.now += durations[len(ran)] if len(ran) < len(durations) else 0
+        ran.append(scheduled)
+        if len(ran) == runs:
+            scheduler.stop()
+
+    scheduler.run(task)
+    return ran
+
+
+def test_run_on_time_has_nothing_due():
+    for policy in ["skip", "catchup"]:
+        scheduler = CadenceScheduler(15, policy)
+        assert scheduler.dueBoundaries(60, 74.9) == ([], 75)
+        assert scheduler.overruns == 0 and scheduler.skipped == 0
+
+
+def test_run_late_by_one_boundary():
+    scheduler = CadenceScheduler(15, "skip")
+    assert scheduler.dueBoundaries(60, 76) == ([], 90)
+    assert scheduler.overruns == 1 and scheduler.skipped == 1
+    scheduler = CadenceScheduler(15, "catchup")
+    assert scheduler.dueBoundaries(60, 76) == ([75], 90)
+    assert scheduler.overruns == 1 and scheduler.skipped == 0
+
+
+def test_run_ending_on_a_boundary_has_missed_it():
+    scheduler = CadenceScheduler(15, "catchup")
+    assert scheduler.dueBoundaries(60, 75) == ([75], 90)
+
+
+def test_run_late_by_many_boundaries():
+    scheduler = CadenceScheduler(15, "skip")
+    assert scheduler.dueBoundaries(60, 140) == ([], 150)
+    assert scheduler.overruns == 1 and scheduler.skipped == 5
+    # Only the latest maxCatchup are caught up, the older ones are skipped.
+    scheduler = CadenceScheduler(15, "catchup", maxCatchup=3)
+    assert scheduler.dueBoundaries(60, 140) == ([105, 120, 135], 150)
+    assert scheduler.overruns == 1 and scheduler.skipped == 2
+    scheduler = CadenceScheduler(15, "catchup", maxCatchup=0)
+    assert scheduler.dueBoundaries(60, 140) == ([], 150)
+    assert scheduler.skipped == 5
+
+
+def test_loop_runs_on_the_boundaries_without_drifting():
+    scheduler = CadenceScheduler(15)
+    assert runScheduler(scheduler, 61, [7, 14.5, 3], 4) == [75, 90, 105, 120]
+    assert scheduler.overruns == 0
+
+
+def test_loop_skips_the_boundaries_missed_by_an_overrun():
+    scheduler = CadenceScheduler(15, "skip")
+    assert runScheduler(scheduler, 61, [40], 3) == [75, 120, 135]
+    assert scheduler.overruns == 1 and scheduler.skipped == 2
+
+
+def test_loop_catches_up_the_boundaries_missed_by_an_overrun():
+    scheduler = CadenceScheduler(15, "catchup", maxCatchup=3)
+    assert runScheduler(scheduler, 61, [40], 4) == [75, 90, 105, 120]
+    assert scheduler.skipped == 0
+
+
+def test_loop_skips_what_became_due_while_catching_up():
+    scheduler = CadenceScheduler(15, "catchup", maxCatchup=1)
+    # The run of 75 ends at 106: 90 is skipped, 105 is caught up until 130, so 120 is skipped too.
+    assert runScheduler(scheduler, 61, [31, 25], 3) == [75, 105, 135]
+    assert scheduler.skipped == 2
+
+
+def test_cron_run_belongs_to_the_boundary_it_started_after():
+    assert currentBoundary(74.9, 15) == 60
+    assert currentBoundary(75, 15) == 75
@@ -0,0 +1,146 @@
+import datetime
+
+import numpy as np
+
+from screening import RobustScreen
+
+START = datetime.datetime(2026, 1, 1)
+
+
+def newScreen(windowSize=20, minSamples=5, resetAfter=3):
+    return RobustScreen(windowSize, minSamples, 10, 50, resetAfter)
+
+
+# Fills the window of the metric 1 with the values, as if they had been accepted one cycle after the other.
+def filled(values, **options):
+    screen = newScreen(**options)
+    screen.append(screen.rowsFor([1] * len(values)), np.array(values, dtype=np.float64))
+    return screen
+
+
+# crypto.MetricValueQuarantine rows, answered to the query of RobustScreen.load.
+class FakeCursor:
+    def __init__(self, quarantineRows):
+        self.quarantineRows = quarantineRows
+        self.result = []
+
+    def execute(self, query, params=None):
+        self.result = self.quarantineRows
+
+    def fetchall(self):
+        return self.result
+
+
+def minutes(count):
+    return START + datetime.timedelta(minutes=count)
+
+
+def test_corrupted_price_is_quarantined():
+    screen = filled([100 + i * 0.1 for i in range(20)])
+    accepted, quarantined, resets = screen.screen([(1, 100000.0)])
+    assert accepted == [] and resets == []
+    assert [(cpmId, value, reason) for cpmId, value, median, mad, reason in quarantined] == [(1, 100000.0, "outlier")]
+
+
+def test_value_that_is_not_a_number_is_invalid():
+    screen = filled([100.0] * 20)
+    accepted, quarantined, resets = screen.screen([(1, None), (2, "n/a")])
+    assert accepted == []
+    assert [(cpmId, value, reason) for cpmId, value, median, mad, reason in quarantined] == [(1, None, "invalid"), (2, None, "invalid")]
+
+
+def test_flat_zero_volume_accepts_its_first_trade():
+    screen = filled([0.0] * 20)
+    assert screen.screen([(1, 0.8)]) == ([(1, 0.8)], [], [])
+
+
+def test_identical_prices_accept_a_normal_tick():
+    screen = filled([42000.0] * 20)
+    assert screen.screen([(1, 42010.0)]) == ([(1, 42010.0)], [], [])
+
+
+def test_change_crossing_zero_is_accepted():
+    screen = filled([0.0123 + 0.0005 * np.sin(i) for i in range(20)])
+    assert screen.screen([(1, -0.0004)]) == ([(1, -0.0004)], [], [])
+
+
+def test_alternating_signed_metric_is_accepted():
+    screen = filled([0.5 if i % 2 == 0 else -0.5 for i in range(20)])
+    assert screen.screen([(1, 0.5)]) == ([(1, 0.5)], [], [])
+    assert screen.screen([(1, -0.5)]) == ([(1, -0.5)], [], [])
+
+
+def test_too_few_values_are_not_screened():
+    screen = filled([100.0] * 4)
+    assert screen.screen([(1, 100000.0)]) == ([(1, 100000.0)], [], [])
+
+
+def test_metric_resets_after_outliers_in_a_row():
+    screen = filled([100.0 + i * 0.1 for i in range(20)], resetAfter=3)
+    for i in range(2):
+        accepted, quarantined, resets = screen.screen([(1, 100000.0)])
+        assert accepted == [] and len(quarantined) == 1
+    accepted, quarantined, resets = screen.screen([(1, 100000.0)])
+    assert accepted == [(1, 100000.0)] and quarantined == []
+    assert [(cpmId, value, reason) for cpmId, value, median, mad, reason in resets] == [(1, 100000.0, "reset")]
+    assert screen.counts[screen.rows[1]] == 1 and screen.strikes[screen.rows[1]] == 0
+
+
+def test_invalid_value_neither_counts_nor_breaks_a_run_of_outliers():
+    screen = filled([100.0 + i * 0.1 for i in range(20)], resetAfter=2)
+    screen.screen([(1, 100000.0)])
+    screen.screen([(1, None)])
+    accepted, quarantined, resets = screen.screen([(1, 100000.0)])
+    assert len(resets) == 1
+
+
+def test_load_restores_the_run_of_outliers_of_a_cron_run():
+    windowRows = [(1, minutes(i), 100.0 + i * 0.1) for i in range(20)]
+    quarantineRows = [(1, minutes(10), "outlier"), (1, minutes(20), "outlier"), (1, minutes(21), "outlier")]
+    screen = newScreen(resetAfter=3)
+    screen.load(FakeCursor(quarantineRows), minutes(22), 3600, windowRows, [1], 1000)
+    # The outlier of minute 10 was followed by accepted values, the run is the last two.
+    assert screen.strikes[screen.rows[1]] == 2
+    accepted, quarantined, resets = screen.screen([(1, 100000.0)])
+    assert len(resets) == 1
+
+
+def test_load_starts_the_window_at_the_last_reset():
+    windowRows = [(1, minutes(i), 100.0) for i in range(20)] + [(1, minutes(20 + i), 100000.0 + i) for i in range(5)]
+    quarantineRows = [(1, minutes(18), "outlier"), (1, minutes(19), "outlier"), (1, minutes(20), "reset")]
+    screen = newScreen()
+    screen.load(FakeCursor(quarantineRows), minutes(25), 3600, windowRows, [1], 1000)
+    row = screen.rows[1]
+    assert screen.counts[row] == 5 and screen.strikes[row] == 0
+    assert screen.screen([(1, 100005.0)]) == ([(1, 100005.0)], [], [])
+
+
+def test_window_keeps_the_last_values_when_it_wraps_around():
+    screen = newScreen(windowSize=4, minSamples=2)
+    screen.append(screen.rowsFor([1, 2, 1, 1, 1, 1, 1]), np.array([1.0, 7.0, 2.0, 3.0, 4.0, 5.0, 6.0]))
+    screen.append(screen.rowsFor([1]), np.array([7.0]))
+    assert sorted(screen.values[screen.rows[1]]) == [4.0, 5.0, 6.0, 7.0]
+    assert screen.positions[screen.rows[1]] == 3 and screen.counts[screen.rows[1]] == 4
+
+
+def test_statistics_of_partial_windows():
+    screen = newScreen(windowSize=6, minSamples=3)
+    screen.append(screen.rowsFor([1, 1, 1, 1, 2, 2]), np.array([1.0, 2.0, 4.0, 10.0, 5.0, 6.0]))
+    medians, mads, smallest = screen.statistics(screen.values[[0, 1]], screen.counts[[0, 1]])
+    assert medians[0] == 3.0 and mads[0] == 1.5 and smallest[0] == 1.0
+    assert np.isnan(medians[1]) and np.isnan(mads[1])
+
+
+def test_retain_forgets_the_metrics_no_longer_tracked():
+    screen = newScreen()
+    screen.append(screen.rowsFor([1, 2, 3]), np.array([1.0, 2.0, 3.0]))
+    screen.retain([3])
+    assert screen.rows == {3: 0} and screen.values[0, 0] == 3.0
+
+
+def test_load_leaves_out_the_rows_older_than_the_window():
+    # The rows are read once for the longer alerting window.
+    windowRows = [(1, minutes(i), float(i)) for i in range(120)]
+    screen = newScreen(windowSize=100)
+    screen.load(FakeCursor([]), minutes(120), 30 * 60, windowRows, [1], 1000)
+    assert screen.counts[screen.rows[1]] == 29
@@ -0,0 +1,73 @@
+import datetime
+import itertools
+
+from sharding import LeaseShards, StaticShards, metricsForWorker, ownerOf, expiredLeaseDeleteQuery, expiredLeaseRetention
+
+PAIRS = [(market, f"{base}{quote}") for market, base, quote in
+         itertools.product(["kraken", "binance", "coinbase-pro"], ["btc", "eth", "ltc", "xrp", "ada", "dot"], ["usd", "eur", "usdt"])]
+
+
+def test_every_pair_has_exactly_one_owner():
+    workers = list(range(4))
+    owned = [metricsForWorker([(i, pair, market) for i, (market, pair) in enumerate(PAIRS)], worker, workers) for worker in workers]
+    assert sorted(row[0] for rows in owned for row in rows) == list(range(len(PAIRS)))
+    assert all(len(rows) > 0 for rows in owned)
+
+
+def test_owner_does_not_depend_on_the_order_of_the_workers():
+    for market, pair in PAIRS:
+        assert ownerOf(market, pair, ["a", "b", "c"]) == ownerOf(market, pair, ["c", "a", "b"])
+
+
+def test_only_the_pairs_of_a_leaving_worker_move():
+    before = {key: ownerOf(key[0], key[1], ["a", "b", "c"]) for key in PAIRS}
+    after = {key: ownerOf(key[0], key[1], ["a", "b"]) for key in PAIRS}
+    moved = [key for key in PAIRS if before[key] != after[key]]
+    assert len(moved) > 0 and all(before[key] == "c" for key in moved)
+
+
+def test_metrics_of_a_pair_stay_together():
+    metrics = [(i, "btcusd", "kraken") for i in range(7)]
+    owners = [worker for worker in range(3) if len(metricsForWorker(metrics, worker, list(range(3)))) > 0]
+    assert len(owners) == 1 and len(metricsForWorker(metrics, owners[0], list(range(3)))) == 7
+
+
+def test_static_shards_list_every_index():
+    shards = StaticShards(1, 3)
+    assert shards.workers(None, 0) == [0, 1, 2] and shards.workerId() == 1
+
+
+# crypto.PollerLease rows, answered to the query of LeaseShards.workers.
+class FakeLeaseCursor:
+    def __init__(self, workerIds):
+        self.workerIds = workerIds
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return [(workerId,) for workerId in self.workerIds]
+
+
+def test_lease_shards_only_list_the_valid_leases():
+    shards = LeaseShards(None, "late-worker", 30)
+    workers = shards.workers(FakeLeaseCursor(["b", "a", "b"]), 1000000)
+    assert workers == ["a", "b"] and shards.workerId() not in workers
+
+
+# Records the statements and their parameters.
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append((query, params))
+
+
+def test_renewing_a_lease_deletes_the_long_expired_ones():
+    cursor = RecordingCursor()
+    before = datetime.datetime.now()
+    LeaseShards(None, "worker", 30).renew(cursor)
+    deletes = [params for query, params in cursor.statements if query == expiredLeaseDeleteQuery]
+    assert len(deletes) == 1
+    assert before - expiredLeaseRetention <= deletes[0][0] <= datetime.datetime.now() - expiredLeaseRetention
@@ -0,0 +1,188 @@
+import datetime
+import time
+
+import pytest
+
+from fetcher import fetchSummary
+from heartbeat import recordHeartbeat, pairSuccessQuery, pairFailureQuery
+from upstream import AllowanceBudget, CircuitBreakers, BudgetExhausted
+
+PAIR = ("kraken", "deadusd")
+
+
+# crypto.PairFreshness in memory, written by recordHeartbeat with the same upsert rules as the queries, and read
+# back by CircuitBreakers.load.
+class FakeFreshnessDb:
+    def __init__(self):
+        self.pairs = {}
+        self.result = []
+
+    def cursor(self):
+        return self
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute(self, query, params=None):
+        if "FROM crypto.PairFreshness" in query:
+            self.result = [(market, pair, row["consecutiveFailures"], row["retryAt"]) for (market, pair), row in self.pairs.items()
+                           if row["consecutiveFailures"] > 0]
+
+    def fetchall(self):
+        return self.result
+
+    def executemany(self, query, rows):
+        for row in rows:
+            if query == pairSuccessQuery:
+                market, pair, attemptAt, successAt, failures, error, retryAt, workerId = row
+                self.pairs[(market, pair)] = {"consecutiveFailures": 0, "retryAt": None}
+            elif query == pairFailureQuery:
+                market, pair, attemptAt, failures, error, retryAt, workerId = row
+                previous = self.pairs.get((market, pair), {"consecutiveFailures": 0})
+                self.pairs[(market, pair)] = {"consecutiveFailures": previous["consecutiveFailures"] + failures, "retryAt": retryAt}
+
+
+# Answers the requests of fetchSummary with the (status code, payload) of responses, one after the other.
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, timeout=None):
+        self.requests += 1
+        return FakeResponse(*self.responses.pop(0))
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        if self.payload is None:
+            raise ValueError("no json")
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+
+def summary(remaining):
+    return {"result": {"price": {"last": 1}}, "allowance": {"cost": 0.005, "remaining": remaining}}
+
+
+def fetchWithBudget(session, budget):
+    return fetchSummary(session, "http://upstream", PAIR[0], PAIR[1], 1, 2, 0, budget)
+
+
+# One cron run: fresh breakers loaded from the table, one fetch of the pair if its circuit lets it through, and
+# the heartbeat written back. Outputs: whether the pair was fetched.
+def cronRun(db, now, error):
+    breakers = CircuitBreakers(3, 300, 3600)
+    breakers.load(db)
+    if breakers.check(PAIR, now) != None:
+        return False
+    if error is None:
+        breakers.recordSuccess(PAIR)
+    elif not isinstance(error, BudgetExhausted):
+        breakers.recordFailure(PAIR, now, False)
+    cycleTime = datetime.datetime.fromtimestamp(int(now))
+    recordHeartbeat(db, "worker", cycleTime, now, now, 1, 0, [(PAIR[0], PAIR[1], error, breakers.retryAt(PAIR))], 0, 1000)
+    return True
+
+
+def test_failures_add_up_across_cron_runs_until_the_circuit_opens():
+    db, now = FakeFreshnessDb(), time.time()
+    for run in range(3):
+        assert cronRun(db, now + 60 * run, TimeoutError("timed out"))
+    assert db.pairs[PAIR]["consecutiveFailures"] == 3
+    assert db.pairs[PAIR]["retryAt"] != None
+    # Open: the next runs within BREAKER_BASE_SECONDS do not fetch it.
+    assert not cronRun(db, now + 60 * 3, TimeoutError("timed out"))
+    assert not cronRun(db, now + 60 * 4, TimeoutError("timed out"))
+
+
+def test_circuit_stays_closed_below_the_threshold():
+    db, now = FakeFreshnessDb(), time.time()
+    for run in range(2):
+        assert cronRun(db, now + 60 * run, TimeoutError("timed out"))
+    assert db.pairs[PAIR] == {"consecutiveFailures": 2, "retryAt": None}
+    assert cronRun(db, now + 120, None)
+    assert db.pairs[PAIR] == {"consecutiveFailures": 0, "retryAt": None}
+
+
+def test_budget_exhaustion_does_not_count_as_a_failure():
+    db, now = FakeFreshnessDb(), time.time()
+    for run in range(5):
+        assert cronRun(db, now + 60 * run, BudgetExhausted("no allowance left"))
+    assert db.pairs[PAIR] == {"consecutiveFailures": 0, "retryAt": None}
+
+
+def test_probes_back_off_exponentially_up_to_the_maximum():
+    breakers, now = CircuitBreakers(3, 300, 1000), 1000000.0
+    for i in range(3):
+        breakers.recordFailure(PAIR, now)
+    assert breakers.check(PAIR, now + 299) != None
+    assert breakers.check(PAIR, now + 300) == None
+    breakers.recordFailure(PAIR, now + 300)
+    assert breakers.check(PAIR, now + 300 + 599) != None
+    assert breakers.check(PAIR, now + 300 + 600) == None
+    breakers.recordFailure(PAIR, now + 900)
+    assert breakers.check(PAIR, now + 900 + 1000) == None
+    breakers.recordSuccess(PAIR)
+    assert breakers.retryAt(PAIR) == None
+
+
+def test_permanent_error_opens_the_circuit_right_away():
+    breakers = CircuitBreakers(3, 300, 3600)
+    breakers.recordFailure(PAIR, 1000000.0, permanent=True)
+    assert breakers.check(PAIR, 1000000.0 + 1) != None
+
+
+def test_budget_follows_the_reported_allowance():
+    budget = AllowanceBudget(1, 86400, 0.1, 60)
+    assert budget.acquire()
+    budget.settle({"cost": 0.1, "remaining": 0.15})
+    assert budget.acquire()
+    assert not budget.acquire()
+    budget.settle({"cost": 0.1, "remaining": 0.01})
+    assert budget.pausedUntil > time.time()
+
+
+def test_unlimited_budget_only_stops_on_429():
+    budget = AllowanceBudget(0, 86400, 0.005, 60)
+    assert all(budget.acquire() for i in range(1000))
+    budget.exhaust()
+    assert not budget.acquire()
+
+
+def test_429_with_allowance_left_is_retried():
+    budget = AllowanceBudget(0, 86400, 0.005, 60)
+    session = FakeSession([(429, {"error": "Too many requests", "allowance": {"cost": 0, "remaining": 9}}), (429, None), (200, summary(8.99))])
+    assert fetchWithBudget(session, budget) == summary(8.99)
+    assert session.requests == 3 and budget.acquire()
+
+
+def test_429_reporting_no_allowance_exhausts_the_budget():
+    budget = AllowanceBudget(0, 86400, 0.005, 60)
+    session = FakeSession([(429, {"error": "Out of allowance", "allowance": {"cost": 0, "remaining": 0}}), (200, summary(8))])
+    with pytest.raises(BudgetExhausted):
+        fetchWithBudget(session, budget)
+    assert session.requests == 1 and not budget.acquire()
+
+
+def test_long_dead_pair_backs_off_at_the_maximum():
+    breakers, now = CircuitBreakers(3, 300, 3600), 1000000.0
+    breakers.failures[PAIR] = 1100
+    breakers.recordFailure(PAIR, now)
+    assert breakers.check(PAIR, now + 3599) != None
+    assert breakers.check(PAIR, now + 3600) == None
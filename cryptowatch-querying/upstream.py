@@ -0,0 +1,159 @@
+import datetime
+import threading
+import time
+
+from instrumentation import UPSTREAM_ALLOWANCE_REMAINING, UPSTREAM_CREDITS_SPENT, CIRCUITS_OPEN
+
+# Guards of the Cryptowatch calls, used by fetcher.py: a budget of the credit allowance the API grants, and a
+# circuit breaker per market/pair so that the dead ones stop costing cycle time and allowance.
+
+
+# Raised instead of fetching a market/pair whose circuit is open, retryAt being when it will be probed again.
+class CircuitOpen(Exception):
+    def __init__(self, retryAt):
+        super().__init__(f"circuit open until {retryAt}")
+        self.retryAt = retryAt
+
+
+# Raised instead of fetching when the allowance budget cannot afford another request.
+class BudgetExhausted(Exception):
+    pass
+
+
+# Token bucket of Cryptowatch credits. It holds up to credits, refilled continuously over periodSeconds, and
+# every request takes the estimated cost of a summary out of it. Each payload reports the actual cost of the
+# request and the credits remaining on the account ({"allowance": {"cost", "remaining"}}): the estimate follows
+# the actual costs, and the bucket never holds more than the API says is left. credits 0 turns the local
+# budget off, and only the upstream's remaining (also reported by its 429s) is then respected: when it runs out, requests
+# are held back for pauseSeconds before probing again.
+class AllowanceBudget:
+    def __init__(self, credits, periodSeconds, requestCost, pauseSeconds):
+        self.lock = threading.Lock()
+        self.credits = credits
+        self.refillRate = credits / periodSeconds if credits > 0 else 0
+        self.tokens = credits
+        self.requestCost = requestCost
+        self.pauseSeconds = pauseSeconds
+        self.pausedUntil = 0
+        self.updatedAt = time.time()
+
+    def refill(self, now):
+        if self.credits > 0:
+            self.tokens = min(self.credits, self.tokens + (now - self.updatedAt) * self.refillRate)
+        self.updatedAt = now
+
+    # Takes the estimated cost of one request out of the bucket. Outputs: False when it cannot be afforded.
+    def acquire(self):
+        now = time.time()
+        with self.lock:
+            self.refill(now)
+            if now < self.pausedUntil:
+                return False
+            if self.credits > 0:
+                if self.tokens < self.requestCost:
+                    return False
+                self.tokens -= self.requestCost
+            return True
+
+    # Settles a request with the allowance reported in its payload (None when there was none).
+    def settle(self, allowance):
+        if not isinstance(allowance, dict):
+            return
+        cost, remaining = allowance.get("cost"), allowance.get("remaining")
+        with self.lock:
+            if isinstance(cost, (int, float)):
+                UPSTREAM_CREDITS_SPENT.inc(cost)
+                if self.credits > 0:
+                    self.tokens += self.requestCost - cost
+                # The estimate follows the actual costs, smoothed over the last requests.
+                self.requestCost = 0.9 * self.requestCost + 0.1 * cost
+            if isinstance(remaining, (int, float)):
+                UPSTREAM_ALLOWANCE_REMAINING.set(remaining)
+                if self.credits > 0:
+                    self.tokens = min(self.tokens, remaining)
+                if remaining < self.requestCost:
+                    self.pausedUntil = time.time() + self.pauseSeconds
+
+    # The API answered 429 with the allowance of its payload (None when there was none). Outputs: whether the
+    # allowance is spent, in which case it is exhausted. Otherwise the API is only throttling a burst of requests,
+    # and the request is retried like on the other retryable statuses.
+    def throttled(self, allowance):
+        remaining = allowance.get("remaining") if isinstance(allowance, dict) else None
+        if not isinstance(remaining, (int, float)):
+            return False
+        UPSTREAM_ALLOWANCE_REMAINING.set(remaining)
+        with self.lock:
+            spent = remaining < self.requestCost
+        if spent:
+            self.exhaust()
+        return spent
+
+    # The allowance is spent, whatever the bucket thought.
+    def exhaust(self):
+        with self.lock:
+            self.tokens = 0
+            self.pausedUntil = time.time() + self.pauseSeconds
+
+
+# Beyond this many doublings of baseSeconds, the probe interval of an open circuit is maxSeconds anyway.
+MAX_DOUBLINGS = 32
+
+
+# Circuit breakers of the market/pairs. A market/pair fails when its fetch or the extraction of its values
+# fails. After failureThreshold failures in a row its circuit opens (right away for an error that will not go
+# away, ex: a 400 or 404 for a pair the exchange dropped), and it is not fetched again until it is probed
+# after baseSeconds, doubling with every failed probe up to maxSeconds. One success closes it. The state lives
+# in memory, and is loaded back from crypto.PairFreshness (where the heartbeat records the failures in a row of
+# every market/pair and the retryAt of every open circuit) so that it carries over between the cron runs and
+# the restarts of the daemon: a cron run starts from the failures of the previous runs, not from 0.
+class CircuitBreakers:
+    def __init__(self, failureThreshold, baseSeconds, maxSeconds):
+        self.lock = threading.Lock()
+        self.failureThreshold = failureThreshold
+        self.baseSeconds = baseSeconds
+        self.maxSeconds = maxSeconds
+        self.failures = {}
+        self.openUntil = {}
+
+    def load(self, cursor):
+        cursor.execute("SELECT market, pair, consecutiveFailures, retryAt FROM crypto.PairFreshness WHERE consecutiveFailures > 0")
+        with self.lock:
+            for market, pair, consecutiveFailures, retryAt in cursor.fetchall():
+                self.failures[(market, pair)] = consecutiveFailures
+                if retryAt != None:
+                    self.openUntil[(market, pair)] = retryAt.timestamp()
+            CIRCUITS_OPEN.set(len(self.openUntil))
+
+    # Outputs: None when the market/pair can be fetched (closed, or open but due for a probe), else its retryAt.
+    def check(self, marketPair, now):
+        with self.lock:
+            openUntil = self.openUntil.get(marketPair)
+        if openUntil == None or now >= openUntil:
+            return None
+        return datetime.datetime.fromtimestamp(openUntil)
+
+    def recordSuccess(self, marketPair):
+        with self.lock:
+            self.failures.pop(marketPair, None)
+            self.openUntil.pop(marketPair, None)
+            CIRCUITS_OPEN.set(len(self.openUntil))
+
+    def recordFailure(self, marketPair, now, permanent=False):
+        with self.lock:
+            failures = self.failures.get(marketPair, 0) + 1
+            if permanent:
+                failures = max(failures, self.failureThreshold)
+            self.failures[marketPair] = failures
+            if failures >= self.failureThreshold:
+                # The failures of a dead pair keep adding up for as long as it is tracked, so the doublings are
+                # capped before exponentiating: 2 ** 1000 does not fit in a float.
+                doublings = min(failures - self.failureThreshold, MAX_DOUBLINGS)
+                interval = min(self.maxSeconds, self.baseSeconds * 2 ** doublings)
+                self.openUntil[marketPair] = now + interval
+            CIRCUITS_OPEN.set(len(self.openUntil))
+
+    # Outputs: the datetime the market/pair will be probed again, None when its circuit is closed.
+    def retryAt(self, marketPair):
+        with self.lock:
+            openUntil = self.openUntil.get(marketPair)
+        return datetime.datetime.fromtimestamp(openUntil) if openUntil != None else None
@@ -32,6 +32,7 @@ CREATE TABLE crypto.`CurrencyPairMetric` (
 CREATE TABLE crypto.`UserCurrencyPairMetric` (
   `id` int auto_increment primary key,
   `userId` int not null,
+  `currencyPairMetricId` int not null,
   `createdAt` datetime not null,
   `deletedAt` datetime default null
 );
@@ -47,6 +48,29 @@ CREATE TABLE crypto.`MetricType` (
   `deletedAt` datetime default null
 );
 
+-- Materialized by query-cryptowatch.py after every cycle: the rank of each metric's standard deviation
+-- among the metrics of the same type on the same market, read by the REST API.
+CREATE TABLE crypto.`MetricRank` (
+  `currencyPairMetricId` int primary key,
+  `market` varchar(50) not null,
+  `metricTypeId` int not null,
+  `stddev` double default null,
+  `rankNum` int not null,
+  `rankDenom` int not null,
+  `rankChangedAt` datetime not null,
+  `updatedAt` datetime not null
+);
+
+-- Single row bumped by query-cryptowatch.py once a cycle is fully written, the REST API uses it
+-- to invalidate its series cache and in the ETag of the graph responses.
+CREATE TABLE crypto.`CycleVersion` (
+  `id` int primary key,
+  `version` bigint not null,
+  `updatedAt` datetime not null
+);
+
+INSERT INTO crypto.CycleVersion (id, version, updatedAt) VALUES (1, 0, now());
+
 INSERT INTO crypto.MetricType (name, firstLevel, secondLevel, createdAt, updatedAt)
     VALUES ('price', 'price', 'last', now(), now());
 
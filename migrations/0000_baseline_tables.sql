@@ -0,0 +1,43 @@
+-- Tables and columns added to databaseSetup.sql before there were migrations, which a database created from an
+-- older databaseSetup.sql is missing: MetricRank (and its rankChangedAt), CycleVersion and its single row, and
+-- UserCurrencyPairMetric.currencyPairMetricId. It comes before the indexes, the partitioning and the rollups,
+-- and does nothing on a database created from the current databaseSetup.sql.
+-- MySQL has no ADD COLUMN IF NOT EXISTS, the columns are added by a statement prepared from information_schema.
+-- The schema is read from the table name so that the runner's rewriting of crypto. applies to it.
+
+CREATE TABLE IF NOT EXISTS crypto.`MetricRank` (
+  `currencyPairMetricId` int primary key,
+  `market` varchar(50) not null,
+  `metricTypeId` int not null,
+  `stddev` double default null,
+  `rankNum` int not null,
+  `rankDenom` int not null,
+  `rankChangedAt` datetime not null,
+  `updatedAt` datetime not null
+);
+
+CREATE TABLE IF NOT EXISTS crypto.`CycleVersion` (
+  `id` int primary key,
+  `version` bigint not null,
+  `updatedAt` datetime not null
+);
+
+INSERT IGNORE INTO crypto.CycleVersion (id, version, updatedAt) VALUES (1, 0, now());
+
+SET @addColumn = (
+  SELECT IF(COUNT(*) = 0, 'ALTER TABLE crypto.MetricRank ADD COLUMN `rankChangedAt` datetime not null default current_timestamp AFTER `rankDenom`', 'DO 0')
+  FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = SUBSTRING_INDEX('crypto.MetricRank', '.', 1) AND TABLE_NAME = 'MetricRank' AND COLUMN_NAME = 'rankChangedAt'
+);
+PREPARE addColumn FROM @addColumn;
+EXECUTE addColumn;
+DEALLOCATE PREPARE addColumn;
+
+SET @addColumn = (
+  SELECT IF(COUNT(*) = 0, 'ALTER TABLE crypto.UserCurrencyPairMetric ADD COLUMN `currencyPairMetricId` int not null AFTER `userId`', 'DO 0')
+  FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = SUBSTRING_INDEX('crypto.UserCurrencyPairMetric', '.', 1) AND TABLE_NAME = 'UserCurrencyPairMetric' AND COLUMN_NAME = 'currencyPairMetricId'
+);
+PREPARE addColumn FROM @addColumn;
+EXECUTE addColumn;
+DEALLOCATE PREPARE addColumn;
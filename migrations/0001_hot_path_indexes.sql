@@ -0,0 +1,17 @@
+-- Composite indexes for the hot paths, none of which could use an index with only the primary keys:
+--   graph and since queries:   currencyPairMetricId IN (...) ORDER BY currencyPairMetricId, queriedAt
+--   freshness, alert window and retention:  ranges and MAX() on queriedAt
+--   poller's active metrics:    UserCurrencyPairMetric by currencyPairMetricId where deletedAt is null
+--   REST API:                   UserCurrencyPairMetric by userId, CurrencyPairMetric by (market, pair, metricTypeId)
+
+ALTER TABLE crypto.MetricValue
+  ADD INDEX `idxMetricValueMetricTime` (`currencyPairMetricId`, `queriedAt`),
+  ADD INDEX `idxMetricValueTime` (`queriedAt`);
+
+ALTER TABLE crypto.CurrencyPairMetric
+  ADD INDEX `idxCurrencyPairMetricLookup` (`market`, `pair`, `metricTypeId`),
+  ADD INDEX `idxCurrencyPairMetricRank` (`market`, `metricTypeId`);
+
+ALTER TABLE crypto.UserCurrencyPairMetric
+  ADD INDEX `idxUserCurrencyPairMetricUser` (`userId`, `currencyPairMetricId`, `deletedAt`),
+  ADD INDEX `idxUserCurrencyPairMetricActive` (`currencyPairMetricId`, `deletedAt`);
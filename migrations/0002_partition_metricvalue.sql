@@ -0,0 +1,15 @@
+-- Range partitions MetricValue by the hour of queriedAt, so retention can drop whole expired partitions and the
+-- time range scans only touch the partitions they need. MySQL requires the partitioning column to be part of
+-- every unique key, hence the primary key becoming (id, queriedAt).
+--
+-- Everything starts in the catch-all pmax partition. query-cryptowatch.py splits hourly partitions off pmax
+-- ahead of time (see cryptowatch-querying/partitions.py) and the expired ones are dropped by retention.
+
+ALTER TABLE crypto.MetricValue
+  DROP PRIMARY KEY,
+  ADD PRIMARY KEY (`id`, `queriedAt`);
+
+ALTER TABLE crypto.MetricValue
+  PARTITION BY RANGE (TO_SECONDS(`queriedAt`)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+  );
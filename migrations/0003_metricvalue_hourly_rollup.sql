@@ -0,0 +1,15 @@
+-- Coarser hourly tier that expired raw MetricValues are rolled up into by cryptowatch-querying/retention.py
+-- before they are removed, instead of just being discarded.
+
+CREATE TABLE crypto.`MetricValueHourly` (
+  `currencyPairMetricId` int not null,
+  `bucketStart` datetime not null,
+  `open` double not null,
+  `high` double not null,
+  `low` double not null,
+  `close` double not null,
+  `mean` double not null,
+  `count` int not null,
+  primary key (`currencyPairMetricId`, `bucketStart`),
+  index `idxMetricValueHourlyBucket` (`bucketStart`)
+);
@@ -0,0 +1,8 @@
+-- Leases of the poller workers sharing the market/pairs between them (SHARD_MODE=lease, see
+-- cryptowatch-querying/sharding.py). Each worker renews its own row while it is up.
+
+CREATE TABLE crypto.`PollerLease` (
+  `workerId` varchar(255) primary key,
+  `acquiredAt` datetime not null,
+  `expiresAt` datetime not null
+);
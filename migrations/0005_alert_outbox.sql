@@ -0,0 +1,20 @@
+-- Queue of the client alerts raised by query-cryptowatch.py, delivered by cryptowatch-querying/alert-worker.py
+-- outside of the ingestion cycle. A metric raises at most one alert per cycle.
+
+CREATE TABLE crypto.`AlertOutbox` (
+  `id` int auto_increment primary key,
+  `currencyPairMetricId` int not null,
+  `previousValue` double not null,
+  `currentValue` double not null,
+  `cycleTime` datetime not null,
+  `status` varchar(20) not null default 'pending',
+  `attempts` int not null default 0,
+  `claimToken` varchar(64) default null,
+  `claimedAt` datetime default null,
+  `lastError` varchar(1000) default null,
+  `createdAt` datetime not null,
+  `sentAt` datetime default null,
+  unique index `idxAlertOutboxMetricCycle` (`currencyPairMetricId`, `cycleTime`),
+  index `idxAlertOutboxStatus` (`status`, `id`),
+  index `idxAlertOutboxMetricSent` (`currencyPairMetricId`, `sentAt`)
+);
@@ -0,0 +1,25 @@
+-- Daily tier next to MetricValueHourly, for the graphs of long lookbacks (months, a year). Both tiers are now
+-- kept up to date by query-cryptowatch.py as the values land (see cryptowatch-querying/ingestion.py), the
+-- hours already in MetricValueHourly are backfilled into it here.
+
+CREATE TABLE crypto.`MetricValueDaily` (
+  `currencyPairMetricId` int not null,
+  `bucketStart` datetime not null,
+  `open` double not null,
+  `high` double not null,
+  `low` double not null,
+  `close` double not null,
+  `mean` double not null,
+  `count` int not null,
+  primary key (`currencyPairMetricId`, `bucketStart`),
+  index `idxMetricValueDailyBucket` (`bucketStart`)
+);
+
+INSERT INTO crypto.MetricValueDaily (currencyPairMetricId, bucketStart, open, high, low, close, mean, count)
+SELECT currencyPairMetricId, DATE(bucketStart),
+SUBSTRING_INDEX(GROUP_CONCAT(open ORDER BY bucketStart ASC), ',', 1) + 0,
+MAX(high), MIN(low),
+SUBSTRING_INDEX(GROUP_CONCAT(close ORDER BY bucketStart DESC), ',', 1) + 0,
+SUM(mean * count) / SUM(count), SUM(count)
+FROM crypto.MetricValueHourly
+GROUP BY currencyPairMetricId, DATE(bucketStart);
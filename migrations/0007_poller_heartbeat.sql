@@ -0,0 +1,29 @@
+-- Small tables the freshness canary (cryptowatch-querying/canary.py) reads instead of scanning MetricValue:
+-- one heartbeat row per cycle of each poller worker, and the latest fetch outcome of every market/pair.
+
+CREATE TABLE crypto.`PollerHeartbeat` (
+  `id` int auto_increment primary key,
+  `workerId` varchar(255) not null,
+  `cycleTime` datetime not null,
+  `cycleStart` datetime not null,
+  `cycleEnd` datetime not null,
+  `metricsExpected` int not null,
+  `valuesWritten` int not null,
+  `pairsExpected` int not null,
+  `pairsFailed` int not null,
+  `failuresByMarket` varchar(4000) not null,
+  index `idxPollerHeartbeatEnd` (`cycleEnd`),
+  index `idxPollerHeartbeatWorker` (`workerId`, `cycleEnd`)
+);
+
+CREATE TABLE crypto.`PairFreshness` (
+  `market` varchar(255) not null,
+  `pair` varchar(255) not null,
+  `lastAttemptAt` datetime not null,
+  `lastSuccessAt` datetime default null,
+  `consecutiveFailures` int not null default 0,
+  `lastError` varchar(1000) default null,
+  `workerId` varchar(255) not null,
+  primary key (`market`, `pair`),
+  index `idxPairFreshnessAttempt` (`lastAttemptAt`)
+);
@@ -0,0 +1,9 @@
+-- Circuit breakers of the market/pairs (cryptowatch-querying/upstream.py): when the open circuit of each
+-- market/pair is probed again, so that it carries over between the runs of the poller and the canary can report
+-- it, and how many market/pairs each cycle skipped as their circuit was open.
+
+ALTER TABLE crypto.`PairFreshness`
+  ADD COLUMN `retryAt` datetime default null AFTER `lastError`;
+
+ALTER TABLE crypto.`PollerHeartbeat`
+  ADD COLUMN `pairsSkipped` int not null default 0 AFTER `pairsFailed`;
@@ -0,0 +1,15 @@
+-- Values held back by the screening stage of the poller (cryptowatch-querying/screening.py) instead of being
+-- written to MetricValue: not a number, or far off from the recent values of their metric. They are kept for
+-- review with the median and median absolute deviation they were screened against.
+
+CREATE TABLE crypto.`MetricValueQuarantine` (
+  `id` int auto_increment primary key,
+  `currencyPairMetricId` int not null,
+  `value` double default null,
+  `median` double default null,
+  `mad` double default null,
+  `reason` varchar(20) not null,
+  `queriedAt` datetime not null,
+  index `idxQuarantineMetricQueried` (`currencyPairMetricId`, `queriedAt`),
+  index `idxQuarantineQueried` (`queriedAt`)
+);
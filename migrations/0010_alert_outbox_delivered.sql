@@ -0,0 +1,5 @@
+-- Recipients an alert of crypto.AlertOutbox was already delivered to, so that retrying an alert whose recipients
+-- span several SendGrid requests only sends the requests that failed (cryptowatch-querying/notifications.py).
+
+ALTER TABLE crypto.`AlertOutbox`
+  ADD COLUMN `deliveredThrough` varchar(255) default null AFTER `attempts`;
@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import time
+import pymysql
+
+# Applies the numbered migrations of this folder (NNNN_description.sql) that are not yet recorded in
+# crypto.SchemaVersion, in order, after databaseSetup.sql has been run once. Usage:
+#   python migrations/migrate.py            applies the pending migrations
+#   python migrations/migrate.py --status   lists the migrations and whether they were applied
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+createSchemaVersion = """
+    CREATE TABLE IF NOT EXISTS {schema}.`SchemaVersion` (
+      `version` int primary key,
+      `name` varchar(255) not null,
+      `appliedAt` datetime not null
+    )
+"""
+
+
+# Returns the list of (version, name, path) of the migration files, ordered by version.
+def listMigrations():
+    migrations = []
+    for fileName in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"^(\d+)_(.+)\.sql$", fileName)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, fileName)))
+    return sorted(migrations)
+
+
+# Splits a migration file into its statements, dropping the -- comments. The migrations are plain DDL/DML,
+# so a semicolon at the end of a line always ends a statement.
+def readStatements(path, schema):
+    with open(path) as migrationFile:
+        lines = [line for line in migrationFile if not line.strip().startswith("--")]
+    statements = [statement.strip() for statement in re.split(r";\s*\n", "".join(lines) + "\n")]
+    # The migrations are written against the crypto schema, other schemas (ex: benchmarks) get them rewritten.
+    return [statement.replace("crypto.", f"{schema}.") for statement in statements if len(statement) > 0]
+
+
+def appliedVersions(cursor, schema):
+    cursor.execute(createSchemaVersion.format(schema=schema))
+    cursor.execute(f"SELECT version FROM {schema}.SchemaVersion")
+    return {row[0] for row in cursor.fetchall()}
+
+
+# Applies every pending migration and records it in SchemaVersion. DDL is not transactional in MySQL, so a
+# migration failing halfway has to be fixed by hand before running this again.
+# Outputs: list of the versions applied.
+def applyMigrations(db, schema="crypto"):
+    cursor = db.cursor()
+    applied = appliedVersions(cursor, schema)
+    newlyApplied = []
+    for version, name, path in listMigrations():
+        if version in applied:
+            continue
+        start = time.time()
+        for statement in readStatements(path, schema):
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {schema}.SchemaVersion (version, name, appliedAt) VALUES (%s, %s, now())", (version, name))
+        print(f"--- Applied migration {version:04d} {name} --- {round(time.time() - start, 4)} seconds ---")
+        newlyApplied.append(version)
+    cursor.close()
+    return newlyApplied
+
+
+if __name__ == "__main__":
+    # This section is for running the migrations locally.
+    if os.environ.get("SQL_IP") == None:
+        from dotenv import load_dotenv, find_dotenv
+        load_dotenv(find_dotenv(usecwd=True))
+    db = pymysql.connect(host=os.environ.get('SQL_IP'), user=os.environ.get('SQL_USER'), password=os.environ.get('SQL_PASSWORD'),
+                         db=os.environ.get('SQL_SCHEMA'), autocommit=True)
+    if "--status" in sys.argv:
+        applied = appliedVersions(db.cursor(), "crypto")
+        for version, name, path in listMigrations():
+            print(f"{version:04d} {name}: {'applied' if version in applied else 'pending'}")
+    else:
+        applyMigrations(db)
+    db.close()